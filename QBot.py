@@ -1,12 +1,40 @@
 #!/usr/bin/env python
 
+import time                 # Sleeping
+STARTED = time.perf_counter()  # Before anything else is imported, so --once reports the time taken including imports
+
 from qmusic import Qmusic   # Q-music API wrapper
+from matcher import TriggerMatcher, parseTrigger  # Multi-pattern trigger matching
+from delivery import Deliverer  # Concurrent webhook posting
+from scheduler import PollScheduler  # Predicting song changes
+from metrics import Metrics, COUNT_BUCKETS  # Latency histograms and counters
+from tracing import Tracer, Sampler  # Spans of polling cycles and on-demand profiles
+from pipeline import Stage, OVERFLOW_POLICIES  # Decoupling detection, matching and delivery
+from cache import MetadataCache  # Details of songs and artists, derived once
+
+from concurrent.futures import ThreadPoolExecutor  # Polling channels concurrently
 
 import csv                  # Reading targets
+import json                 # Persisted state
+import datetime             # Predicted start of announced tracks
+import functools            # Gauges per shard
+import argparse             # Command line arguments
+import heapq                # Polling schedule of channels
+import itertools            # Handing the cycle span to every poll
+import os                   # Watching the targets file and persisted state
+import tempfile             # Writing state atomically
+import threading            # Reloading targets in the background
 import requests             # Handle HTML stuff
-import time                 # Sleeping
+import signal               # Stopping cleanly on SIGTERM
+import sys                  # Exiting on SIGTERM
 import traceback            # Print caught exceptions
 
+# Where --once keeps the last handled track of every channel (unless there is an outbox)
+STATE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'qmusic', 'qbot-state.json')
+# When the notifications of an announced track are sent: once its start is confirmed, or at its predicted start
+PRE_ARM_MODES = ('confirm', 'predict')
+WARM_LEAD = 5  # Seconds before the predicted start of an armed track that connections to its webhooks are opened
+
 
 class QBot:
     """
@@ -15,27 +43,221 @@ class QBot:
     Targets and webhooks are defined in targets.csv
     """
 
-    def __init__(self):
+    def __init__(self, slugs=None, history=0, outboxPath=None, qapi=None, tracer=None, metadata=None, clock=None,
+                 schedulerOptions=None):
         """
         Initialise with components and urls
+
+        Args:
+            slugs (list): Slugs of the channels to listen to, defaults to the regular channel.
+                          'all' tunes in to every channel in the catalog.
+            history (int): Number of recent plays to fetch per poll, so songs played in between polls are not missed.
+                           0 only fetches the current song.
+            outboxPath (str): Location of a database to record notifications in before they are sent.
+                              The last handled track of every channel is restored from it, so that after a restart
+                              nothing is posted twice and failed posts are retried. None posts directly.
+            qapi (qmusic.Qmusic): Q-music API wrapper to use, defaults to one for the Q-music API itself.
+            tracer (tracing.Tracer): Tracer to record a span of every polling cycle with, defaults to no tracing.
+            metadata (cache.MetadataCache): Cache for details of songs and artists, defaults to one in memory.
+            clock: Provides time(), monotonic() and sleep() like the time module (the default),
+                   e.g. a replay.VirtualClock to replay recorded plays faster than real time.
+            schedulerOptions (dict): Arguments of scheduler.PollScheduler (the polling policy of every channel).
+
+        Raises:
+            ValueError: If a channel to listen to is not in the catalog (or there are none).
         """
         # Listener preparation
         self.sessy = requests.Session()  # Initialise session
-        self.qapi = Qmusic()  # Initialise Q-music API wrapper
-        self.channel = self.qapi.get_channel()  # Tune in to regular channel
-        self.latestCode = ''  # Selector code of last track
-        self.sleepPeriod = 180  # By default, sleep for three minutes
+        self.clock = clock or time  # Time to schedule polls by
+        self.metrics = Metrics()  # Timings and counts of everything the bot does
+        self.describeMetrics()
+        self.tracer = tracer or Tracer()  # Spans of polling cycles (if enabled)
+        # Details of songs and artists, by selector code and artist id
+        self.metadata = MetadataCache() if metadata is None else metadata
+        self.metrics.gauge('qbot_metadata_entries', lambda: len(self.metadata))
+        self.metrics.gauge('qbot_metadata_lookups', lambda: self.metadata.hits, result='hit')
+        self.metrics.gauge('qbot_metadata_lookups', lambda: self.metadata.misses, result='miss')
+        self.deliverer = Deliverer(tracer=self.tracer)  # Posts notifications to webhooks in parallel
+        self.qapi = qapi or Qmusic(compact=True, selective='auto')  # Initialise Q-music API wrapper
+        self.qapi.get_connection().observer = self.observeRequest  # Time requests to the API
+        if slugs is None:
+            channels = [channel for channel in [self.qapi.get_channel()] if channel]  # Tune in to regular channel
+        else:
+            channels = self.qapi.get_channels(None if slugs == 'all' else slugs)  # Tune in to selected channels
+        found = {channel.slug() for channel in channels}
+        unknown = [slug for slug in (slugs if slugs not in (None, 'all') else []) if slug not in found]
+        if unknown:
+            raise ValueError('Unknown channel(s): {} (available: {})'.format(
+                ', '.join(unknown), ', '.join(self.qapi.slugs())))
+        if not channels:
+            raise ValueError('No channels to listen to, the catalog has none (or lacks the regular channel)')
+        self.channels = {channel.slug(): channel for channel in channels}  # Channels to listen to, by slug
+        if self.tracer.enabled:
+            for channel in channels:
+                channel.tracer = self.tracer  # Record fetching and parsing plays as well
+        self.channel = channels[0]  # Main channel
+        self.pollers = ThreadPoolExecutor(max_workers=min(len(self.channels), 16), thread_name_prefix='poll')
+        self.latestCodes = dict.fromkeys(self.channels, '')  # Selector code of last track per channel
+        self.history = history  # Size of the window of recent plays to backfill from
+        self.outbox = None  # Durable outbox (if any)
+        if outboxPath:
+            from outbox import Outbox  # Only imported when used, to keep starting up cheap
+            self.outbox = Outbox(outboxPath, self.deliverer, self.printDeliveries)
+            # Continue where the previous run left off
+            self.latestCodes.update((slug, code) for slug, code in self.outbox.latestCodes().items()
+                                    if slug in self.latestCodes)
+            self.outbox.start()
+        # Polling schedule per channel
+        self.schedulers = {slug: PollScheduler(clock=self.clock.time, **(schedulerOptions or {}))
+                           for slug in self.channels}
         self.targets = []  # List of targets (to be read from targets.csv)
+        self.matcher = TriggerMatcher(self.targets)  # Compiled triggers of all targets
+        self.statePath = None  # File the last handled track of every channel is kept in (if any)
+        self.targetsPath = None  # Location of the targets file (once read)
+        self.targetsStamp = None  # Modification time, size and inode of the targets file when it was last read
+        self.stagedTargets = None  # Reloaded targets and their matcher, waiting for the next polling cycle
+        self.stageLock = threading.Lock()  # Guards stagedTargets
+        self.shard = None  # (shards.HashRing, index) of the shard of the targets this process owns, None for all
+        self.shards = None  # Worker processes that match and deliver new songs (if sharded)
+        self.matchStage = None  # Stage matching new songs, if detection is decoupled from matching and delivery
+        self.deliveryStage = None  # Stage posting notifications, if decoupled
+        self.archive = None  # Columnar archive of every handled play and the triggers it satisfied (if kept)
+        self.feeds = {}  # Push feeds of the channels, by slug (if subscribed)
+        self.channelLocks = {slug: threading.Lock() for slug in self.channels}  # Polls and pushes take turns
+        self.recording = None  # File every changed response of the API is recorded to (if any), for replay.py
+        self.recordLock = threading.Lock()  # Guards recording
+        self.preArm = None  # One of PRE_ARM_MODES if the notifications of announced tracks are prepared ahead of time
+        self.armed = {}  # Prepared notifications of the announced track, by slug (if pre-armed)
         self.message = 'Message'  # Message to post
 
+    def loadState(self, statePath):
+        """
+        Restores the code of the last handled track of every channel from a state file (see saveState),
+        and keeps saving it there after every polling cycle that found a new track. A missing file is ignored.
+
+        Args:
+            statePath (str): Location of the state file.
+        """
+        self.statePath = statePath
+        try:
+            with open(statePath) as stateFile:
+                latestCodes = json.load(stateFile)['latestCodes']
+        except (OSError, ValueError, KeyError) as _:
+            return
+        self.latestCodes.update((slug, code) for slug, code in latestCodes.items() if slug in self.latestCodes)
+
+    def saveState(self):
+        """
+        Writes the code of the last handled track of every channel to the state file.
+        The file is replaced atomically, so a crash never leaves a truncated state behind.
+        """
+        directory = os.path.dirname(self.statePath) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, tmpPath = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as tmp:
+            json.dump({'latestCodes': dict(self.latestCodes)}, tmp)
+        os.replace(tmpPath, self.statePath)
+
+    def describeMetrics(self):
+        """
+        Describes the metrics the bot keeps.
+        """
+        self.metrics.describe('qbot_api_request_seconds', 'Duration of requests to the Q-music API')
+        self.metrics.describe('qbot_api_decode_seconds', 'Duration of decoding responses of the Q-music API')
+        self.metrics.describe('qbot_match_seconds', 'Duration of matching a track against all targets')
+        self.metrics.describe('qbot_webhook_seconds', 'Duration of webhook posts, by status code')
+        self.metrics.describe('qbot_detection_lag_seconds', 'Time between the start of a track and its detection')
+        self.metrics.describe('qbot_polls_per_track', 'Number of polls it took to detect a track')
+        self.metrics.describe('qbot_tracks_total', 'Number of tracks handled')
+        self.metrics.describe('qbot_crash_restarts_total', 'Number of times the listener crashed and was restarted')
+        self.metrics.describe('qbot_metadata_entries', 'Number of cached details of songs and artists')
+        self.metrics.describe('qbot_metadata_lookups', 'Number of lookups of details of songs and artists, by result')
+        self.metrics.describe('qbot_queue_depth', 'Number of items waiting in the queue of a stage')
+        self.metrics.describe('qbot_dropped_total', 'Number of items dropped because the queue of a stage was full')
+        self.metrics.describe('qbot_push_events_total', 'Number of changes of the push feeds, by channel and event')
+        self.metrics.describe('qbot_push_live', 'Whether the push feed of a channel is live (1) or polled instead (0)')
+        self.metrics.describe('qbot_prearmed_total', 'Number of announced tracks prepared ahead of time, by outcome')
+
+    def observeRequest(self, url, status, requestTime, decodeTime):
+        """
+        Records the timings of a request to the Q-music API.
+
+        Args:
+            url (str): Requested URL.
+            status (int): HTTP status code of the response.
+            requestTime (float): Seconds the request took.
+            decodeTime (float): Seconds decoding the response took.
+        """
+        endpoint = 'plays' if '/tracks/plays' in url else 'catalog'
+        self.metrics.observe('qbot_api_request_seconds', requestTime, endpoint=endpoint, status=status)
+        if decodeTime:
+            self.metrics.observe('qbot_api_decode_seconds', decodeTime, endpoint=endpoint)
+
+    def startRecording(self, path):
+        """
+        Appends every changed tracks/plays response of every channel to a file, one line of JSON per response
+        (with the slug of the channel), to be replayed later (see replay.py).
+
+        Args:
+            path (str): Location of the recording.
+        """
+        self.recording = open(path, 'a')
+        apiURLs = {channel.api_url(): slug for slug, channel in self.channels.items()}
+        self.qapi.get_connection().recorder = functools.partial(self.recordResponse, apiURLs)
+
+    def recordResponse(self, apiURLs, url, document):
+        """
+        Records a decoded response of the API, if it holds plays.
+
+        Args:
+            apiURLs (dict): Slug of every channel, by the base URL of its API.
+            url (str): Requested URL.
+            document (dict): Decoded response.
+        """
+        slug = apiURLs.get(url.split('/tracks/plays')[0])
+        if slug is None or 'played_tracks' not in document:
+            return
+        line = json.dumps(dict(document, channel=slug))
+        with self.recordLock:
+            self.recording.write(line + '\n')
+            self.recording.flush()
+
     def readTargets(self, targetsCSV):
         """
         Reads the targets.csv file and stores a list where every element is a target dictionary.
-        A target consists of a trigger, target and message.
+        A target consists of a trigger, target, message and optionally the slug of the channel it is limited to.
+        Afterwards, the triggers of all targets are compiled into a single matcher.
 
         Args:
             targetsCSV (str): Location of the .csv file that contains the targets.
         """
+        # Remember the state of the file before reading, so changes made while reading are picked up later
+        self.targetsPath = targetsCSV
+        self.targetsStamp = fileStamp(targetsCSV)
+
+        for rowDict in self.parseTargets(targetsCSV):
+            # Print what was read
+            print("Read target that is triggered by '{}', sends a notification to '{}' with message '{}'".format(
+                rowDict['trigger'], rowDict['target'], rowDict['message']))
+            # Add the target to the internal targets
+            self.targets.append(rowDict)
+
+        # Compile all triggers once, so every song is scanned in a single pass
+        self.matcher = TriggerMatcher(self.targets)
+
+    def parseTargets(self, targetsCSV):
+        """
+        Reads the targets from a targets.csv file.
+        If this process owns a shard of the targets, only the targets posting to a webhook of that shard are kept.
+        Rows with a malformed structured trigger (e.g. 'year:abc') are skipped, naming their line.
+
+        Args:
+            targetsCSV (str): Location of the .csv file that contains the targets.
+
+        Returns:
+            list: Target dictionaries, in the order of the file.
+        """
+        targets = []
         # Open and read targets.csv
         with open(targetsCSV, 'r') as tfile:
             csvrows = csv.reader(tfile, delimiter=';')
@@ -45,142 +267,920 @@ class QBot:
 
             # Store remaining rows as targets
             for row in csvrows:
+                if self.shard is not None and self.shard[0].owner(row[1]) != self.shard[1]:
+                    # Another process takes care of this webhook
+                    continue
+                try:
+                    parseTrigger(row[0])
+                except ValueError as error:
+                    # Skip the row instead of failing on it, the other targets still work
+                    print('Regel {} van {} overgeslagen: {}'.format(csvrows.line_num, targetsCSV, error))
+                    continue
                 # Put row contents into dictionary
-                rowDict = {'trigger': row[0], 'target': row[1], 'message': row[2]}
-                # Print what was read
-                print("Read target that is triggered by '{}', sends a notification to '{}' with message '{}'".format(
-                    rowDict['trigger'], rowDict['target'], rowDict['message']))
-                # Add the target to the internal targets
-                self.targets.append({'trigger': row[0], 'target': row[1], 'message': row[2]})
+                targets.append({'trigger': row[0], 'target': row[1], 'message': row[2],
+                                'channel': row[3] if len(row) > 3 else ''})
+        return targets
+
+    def reloadTargets(self):
+        """
+        Reads the targets file again if it changed, and prepares the new targets to be swapped in.
+        Targets that did not change are kept as they are, and only triggers that were added need compiling,
+        so reloading does not hold up polling. The swap itself happens in between polling cycles (see applyTargets).
+
+        Returns:
+            bool: Whether new targets were staged.
+        """
+        stamp = fileStamp(self.targetsPath)
+        if stamp == self.targetsStamp:
+            return False
+        targets = self.parseTargets(self.targetsPath)
+
+        # Diff the rows against the current targets, reusing the unchanged ones
+        current = {}
+        for target in self.matcher.targets:
+            current.setdefault(tuple(target.values()), []).append(target)
+        reloaded, added = [], 0
+        for rowDict in targets:
+            kept = current.get(tuple(rowDict.values()))
+            if kept:
+                reloaded.append(kept.pop())
+            else:
+                reloaded.append(rowDict)
+                added += 1
+        removed = sum(len(kept) for kept in current.values())
+
+        # Only the triggers that were added are compiled
+        matcher = self.matcher.update(reloaded) if added or removed else self.matcher
+        with self.stageLock:
+            self.stagedTargets = (reloaded, matcher)
+        self.targetsStamp = stamp
+        print('Doelen opnieuw ingelezen: {} toegevoegd, {} verwijderd, {} in totaal'.format(
+            added, removed, len(reloaded)))
+        return True
+
+    def applyTargets(self):
+        """
+        Swaps in targets that were reloaded in the background, if any.
+        Called in between polling cycles, so a cycle never sees a mix of old and new targets.
+        """
+        with self.stageLock:
+            staged, self.stagedTargets = self.stagedTargets, None
+        if staged is not None:
+            self.targets, self.matcher = staged
+            # Prepared with the old targets, unless they were posted already
+            self.armed = {slug: armed for slug, armed in self.armed.items() if armed['fired']}
+
+    def watchTargets(self, interval=5):
+        """
+        Keeps checking the targets file for changes in the background, and reloads it when it changed.
+
+        Args:
+            interval (float): Seconds in between checks.
+        """
+        def watch():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.reloadTargets()
+                except Exception as error:
+                    # Keep the current targets (e.g. while the file is being written) and try again later
+                    print('Doelen konden niet opnieuw worden ingelezen: {}'.format(error))
+
+        threading.Thread(target=watch, name='targets', daemon=True).start()
+
+    def startPipeline(self, queueSize=1000, overflow='drop-oldest'):
+        """
+        Decouples detection from matching and delivery, connecting them with bounded queues.
+        Polls only hand new songs to the matching stage, which hands the notifications to the delivery stage,
+        so slow webhooks never hold up the next poll. Matching waits for room when its queue is full,
+        delivery applies the given overflow policy. Queue depths are exposed as metrics.
+
+        Args:
+            queueSize (int): Maximum number of items waiting per stage.
+            overflow (str): What the delivery stage does when its queue is full (see pipeline.OVERFLOW_POLICIES).
+        """
+        self.deliveryStage = Stage('deliver', self.deliverJobs, size=queueSize, overflow=overflow,
+                                   onDrop=lambda jobs: self.dropped('deliver', len(jobs)))
+        self.matchStage = Stage('match', lambda item: self.notify(*item), size=queueSize)
+        for stage in (self.matchStage, self.deliveryStage):
+            self.metrics.gauge('qbot_queue_depth', stage.depth, stage=stage.name)
+
+    def dropped(self, stageName, count):
+        """
+        Reports items that were dropped because a stage could not keep up.
+
+        Args:
+            stageName (str): Name of the stage.
+            count (int): Number of dropped notifications.
+        """
+        self.metrics.increment('qbot_dropped_total', count, stage=stageName)
+        print('Wachtrij {} is vol, {} notificatie(s) overgeslagen'.format(stageName, count))
 
     def listenToQ(self):
         """
         This function indefinitely lets the bot listen for new songs on Q.
+        All channels share one worker pool and are each polled on their own schedule,
+        which polls tightly around the predicted end of the current song and sleeps otherwise.
         If a new song is detected, post it to a webhook.
         """
+        # Every channel is due right away
+        schedule = [(self.clock.monotonic(), slug) for slug in self.channels]
+        heapq.heapify(schedule)
+
         # Infinite listening loop
         while True:
-            # Refresh page and get latest track
-            latestTrack = self.channel.current_song()
+            # Sleep until the first channel is due
+            self.clock.sleep(max(0, schedule[0][0] - self.clock.monotonic()))
 
-            # Check if the latest track is new
-            if self.trackIsNew(latestTrack):
-                # There is a new track, let the update function handle it
-                self.handleUpdate(latestTrack)
+            # Swap in reloaded targets (if any) before starting a new cycle
+            self.applyTargets()
+            handledCodes = dict(self.latestCodes)
 
-                # Reset sleeping period and sleep
-                self.sleepPeriod = 180
-                time.sleep(self.sleepPeriod)
-            else:
-                # No new track
-                self.sleepPeriod = int(self.sleepPeriod / 3) + 10  # Set new sleeping period
-                time.sleep(self.sleepPeriod)  # Sleep for that period
+            # Collect every channel that is due by now
+            now = self.clock.monotonic()
+            dueSlugs = []
+            while schedule and schedule[0][0] <= now:
+                dueSlugs.append(heapq.heappop(schedule)[1])
+
+            # Poll them concurrently and put each back on the schedule after its own sleeping period
+            with self.tracer.span('cycle', channels=len(dueSlugs)) as cycle:
+                sleepPeriods = list(self.pollers.map(self.pollChannel, dueSlugs, itertools.repeat(cycle)))
+            for slug, sleepPeriod in zip(dueSlugs, sleepPeriods):
+                heapq.heappush(schedule, (self.clock.monotonic() + sleepPeriod, slug))
+
+            # Keep the state up to date (if kept), so a restart continues where this run left off
+            if self.statePath and self.latestCodes != handledCodes:
+                self.saveState()
+
+    def runOnce(self):
+        """
+        Polls every channel once, handles their new tracks and waits until the notifications have been posted.
+        Meant for running from a timer: the state is saved afterwards and failed posts stay in the outbox (if any)
+        for the next run.
+
+        Returns:
+            int: Number of channels on which a new track was found.
+        """
+        handledCodes = dict(self.latestCodes)
+        list(self.pollers.map(self.pollChannel, self.channels))
+
+        # Wait for the background stages (if any), then for the outbox
+        for stage in (self.matchStage, self.deliveryStage):
+            if stage is not None:
+                stage.join()
+        if self.outbox:
+            self.outbox.stop()
+            while self.outbox.drain() == 0:
+                pass
+
+        if self.statePath:
+            self.saveState()
+        return sum(code != handledCodes[slug] for slug, code in self.latestCodes.items())
+
+    def startPush(self, url=None, silence=30.0):
+        """
+        Subscribes every channel to its push feed, so new tracks are handled the moment they start.
+        A channel is only polled while its feed is not live (broken, reconnecting or silent for too long).
+
+        Args:
+            url (str): URL of the feeds, '{slug}' is replaced by the slug of the channel.
+                       Defaults to the feed of every channel itself.
+            silence (float): Seconds without any data after which a feed is no longer trusted.
+        """
+        from push import PushFeed  # Only imported when used, to keep starting up cheap
+        for slug, channel in self.channels.items():
+            feed = PushFeed(channel, functools.partial(self.pushUpdate, slug), url and url.replace('{slug}', slug),
+                            silence, onEvent=functools.partial(self.pushEvent, slug))
+            self.feeds[slug] = feed
+            self.metrics.gauge('qbot_push_live', functools.partial(lambda feed: int(feed.live()), feed), channel=slug)
+            feed.start()
+
+    def pushEvent(self, slug, event):
+        """
+        Counts a change of a push feed.
+
+        Args:
+            slug (str): Slug of the channel of the feed.
+            event (str): 'connect', 'song' or 'disconnect'.
+        """
+        self.metrics.increment('qbot_push_events_total', channel=slug, event=event)
+        if event != 'song':
+            print('Push-feed van {}: {}'.format(slug, 'verbonden' if event == 'connect' else 'verbroken'))
+
+    def pushUpdate(self, slug, track):
+        """
+        Handles a track that arrived on the push feed of a channel, if it is new.
+
+        Args:
+            slug (str): Slug of the channel.
+            track (qmusic.Song): The track that just started.
+        """
+        with self.tracer.span('push', channel=slug), self.channelLocks[slug]:
+            isNew = self.trackIsNew(track, slug)
+            if isNew:
+                with self.tracer.span('handle', code=track.selector_code()):
+                    self.handleUpdate(track, slug)
+                self.schedulers[slug].observe(track, True)
+                self.observeDetection(slug)
+            if self.preArm:
+                self.armNext(slug)
+        if isNew and self.statePath:
+            self.saveState()
+
+    def pollChannel(self, slug, parent=None):
+        """
+        Refreshes a single channel and handles its latest track if it is new.
+        A channel with a live push feed is not fetched, only checked again a little later.
+        Prepared notifications of an announced track are readied first (see checkArmed).
+
+        Args:
+            slug (str): Slug of the channel to poll.
+            parent (tracing.Span): Span of the polling cycle the poll is part of (if traced).
+
+        Returns:
+            float: Number of seconds to sleep before polling this channel again.
+        """
+        if self.preArm:
+            with self.channelLocks[slug]:
+                self.checkArmed(slug)
+        feed = self.feeds.get(slug)
+        if feed is not None and feed.live():
+            # Soon enough to take over when the feed falls silent
+            return self.armedSleep(slug, min(5.0, feed.silence / 2))
+        with self.tracer.span('poll', parent, channel=slug), self.channelLocks[slug]:
+            return self.refreshChannel(slug)
+
+    def refreshChannel(self, slug):
+        """
+        Fetches the latest track(s) of a channel, handles the new ones and determines when to poll again.
+
+        Args:
+            slug (str): Slug of the channel to poll.
+
+        Returns:
+            float: Number of seconds to sleep before polling this channel again.
+        """
+        # Refresh page and get latest track(s)
+        if self.history:
+            recentTracks = self.channels[slug].recent_songs(self.history)
+            latestTrack = recentTracks[0]
+            newTracks = self.missedTracks(recentTracks, slug)
+        else:
+            latestTrack = self.channels[slug].current_song()
+            newTracks = [latestTrack] if self.trackIsNew(latestTrack, slug) else []
+
+        # Check if there are new tracks
+        isNew = bool(newTracks)
+        for track in newTracks:
+            # There is a new track, let the update function handle it (oldest first)
+            with self.tracer.span('handle', code=track.selector_code()):
+                self.handleUpdate(track, slug)
 
-    def trackIsNew(self, curTrack):
+        # Determine the sleeping period from the progress of the current track
+        scheduler = self.schedulers[slug]
+        sleepPeriod = scheduler.observe(latestTrack, isNew, max(0, len(newTracks) - 1))
+        if isNew:
+            self.observeDetection(slug)
+        if self.preArm:
+            # Prepare the announced track (if any) and check for its start
+            self.armNext(slug)
+            sleepPeriod = self.armedSleep(slug, sleepPeriod)
+        return sleepPeriod
+
+    def observeDetection(self, slug):
+        """
+        Records how late and after how many polls the latest change of a channel was detected, and prints its schedule.
+
+        Args:
+            slug (str): Slug of the channel.
+        """
+        scheduler = self.schedulers[slug]
+        if scheduler.lastLag is not None:
+            self.metrics.observe('qbot_detection_lag_seconds', scheduler.lastLag, channel=slug)
+            self.metrics.histogram('qbot_polls_per_track', COUNT_BUCKETS, channel=slug).observe(scheduler.lastPolls)
+        self.printSchedule(slug)
+
+    def armNext(self, slug):
+        """
+        Prepares the notifications of the track a channel announced to play next (if any), so once it starts they
+        only have to be sent: deriving its details, matching it and formatting the posts are done ahead of time.
+        Its start is taken from the announcement, or else predicted from the lengths of songs on the channel.
+
+        Args:
+            slug (str): Slug of the channel.
+        """
+        try:
+            upcoming = self.channels[slug].next_song(cached=True)
+        except (KeyError, TypeError, ValueError) as _:
+            upcoming = None  # Announcement without the fields of a song
+        if upcoming is None or not self.trackIsNew(upcoming, slug):
+            return
+        armed = self.armed.get(slug)
+        if armed is not None and armed['code'] == upcoming.selector_code():
+            return
+        try:
+            announcedAt = upcoming.played_at()
+        except KeyError as _:
+            announcedAt = None
+        with self.tracer.span('arm', channel=slug, code=upcoming.selector_code()):
+            armed = self.prepare(upcoming, slug, announcedAt)
+        armed['start'] = announcedAt.timestamp() if announcedAt else self.schedulers[slug].predictedChange()
+        armed['warmed'] = armed['fired'] = False
+        self.armed[slug] = armed
+        self.metrics.increment('qbot_prearmed_total', channel=slug, result='armed')
+        self.checkArmed(slug)
+
+    def checkArmed(self, slug):
+        """
+        Readies the prepared notifications of the announced track of a channel as its start comes near:
+        connections to their webhooks are opened shortly before and, when predicting,
+        they are posted at the predicted start without waiting for the change to be confirmed.
+
+        Args:
+            slug (str): Slug of the channel.
+        """
+        armed = self.armed.get(slug)
+        if armed is None or not armed['matches'] or armed['start'] is None:
+            return
+        now = self.clock.time()
+        if not armed['warmed'] and now >= armed['start'] - WARM_LEAD:
+            armed['warmed'] = True
+            self.deliverer.warm(target['target'] for target in armed['matches'])
+        if self.preArm == 'predict' and not armed['fired'] and now >= armed['start']:
+            if armed['jobs'] is None:
+                # Announced without a start, the notifications show the predicted one
+                armed['playedAt'] = datetime.datetime.fromtimestamp(armed['start']).astimezone()
+                armed['jobs'] = self.buildJobs(armed)
+            armed['fired'] = True
+            self.metrics.increment('qbot_prearmed_total', channel=slug, result='predicted')
+            self.dispatch(armed['jobs'])
+
+    def armedSleep(self, slug, sleepPeriod):
+        """
+        Shortens the sleeping period of a channel with prepared notifications, so it is checked right when connections
+        are to be opened and right at the predicted start, and tightly for a while after that until the start is seen.
+
+        Args:
+            slug (str): Slug of the channel.
+            sleepPeriod (float): Number of seconds the channel would sleep otherwise.
+
+        Returns:
+            float: Number of seconds to sleep before checking this channel again.
+        """
+        armed = self.armed.get(slug)
+        if armed is None or not armed['matches'] or armed['start'] is None:
+            return sleepPeriod
+        now = self.clock.time()
+        due = armed['start'] if armed['warmed'] else armed['start'] - WARM_LEAD
+        if due > now:
+            return min(sleepPeriod, due - now)
+        scheduler = self.schedulers[slug]
+        if now < armed['start'] + scheduler.tightInterval:
+            return min(sleepPeriod, scheduler.minInterval)
+        return sleepPeriod
+
+    def missedTracks(self, recentTracks, slug):
+        """
+        Determines which of the recently played tracks have not been handled yet,
+        by diffing them against the code of the last handled track.
+
+        Args:
+            recentTracks (list): Recently played qmusic.Song tracks, newest first.
+            slug (str): Slug of the channel the tracks were played on.
+
+        Returns:
+            list: Tracks played after the last handled track, oldest first.
+        """
+        latestCode = self.latestCodes[slug]
+        if not latestCode:
+            # Nothing handled yet, only the current track is new
+            return recentTracks[:1]
+
+        missed = []
+        for track in recentTracks:
+            if track.selector_code() == latestCode:
+                break
+            missed.append(track)
+        else:
+            if missed:
+                # The last handled track is not in the window anymore, so some tracks may be lost
+                print('Meer dan {} liedjes gemist op {}'.format(len(missed), slug))
+        missed.reverse()
+        return missed
+
+    def trackIsNew(self, curTrack, slug=None):
         """
         Determines whether a track is new (different code).
 
         Args:
             curTrack (qmusic.Song): Track to compare (whether it is different from the last).
+            slug (str): Slug of the channel the track was played on, defaults to the main channel.
 
         Returns:
             bool: Whether or not curTrack is different from the last.
         """
-        return curTrack.selector_code() != self.latestCode
+        return curTrack.selector_code() != self.latestCodes[slug or self.channel.slug()]
 
-    def handleUpdate(self, track):
+    def handleUpdate(self, track, slug=None):
         """
         Logic to determine what to do after an update, based on given targets (triggers).
         For Q, if a new track is recognised, it is printed and if it satisfies a trigger, a notification is posted.
+        If the targets are sharded, the track is handed to the worker processes instead.
 
         Args:
             track (qmusic.Song): Latest song.
+            slug (str): Slug of the channel the track was played on, defaults to the main channel.
         """
         # Extract relevant information
-        self.latestCode = track.selector_code()
-        title = track.title()
-        artist = track.artist().name_all_artist().title()
-        playtime = track.played_at().time().isoformat()
+        slug = slug or self.channel.slug()
+        self.latestCodes[slug] = track.selector_code()
+        armed = self.armed.pop(slug, None)
+        if armed is not None and armed['code'] != track.selector_code():
+            # Another track started than was announced
+            self.metrics.increment('qbot_prearmed_total', channel=slug, result='wrong' if armed['fired'] else 'missed')
+            if armed['fired']:
+                print('Vooraf verstuurde notificatie(s) op {} klopten niet, er werd iets anders gedraaid'.format(slug))
+            armed = None
 
         # Print the new track first
-        self.printUpdate(playtime, title, artist)
+        self.printUpdate(track.played_at().time().isoformat(), track.title(),
+                         track.artist().name_all_artist().title(), slug if len(self.channels) > 1 else None)
 
-        # Check if the track satisfies a trigger
-        for target in self.targets:
-            # Loop through all targets and check if the track contains the trigger (case-insensitive)
-            if target['trigger'].lower() in title.lower() + ' ' + artist.lower():
-                # Trigger satisfied, post notification
-                try:
-                    # Usually post with thumbnail, but there is a possibility there is no thumbnail
-                    self.postNotification(target['target'], target['message'],
-                                          playtime, title, artist, track.thumbnail_url())
-                except KeyError as _:
-                    # There is no thumbnail, so don't try to post it
-                    self.postNotification(target['target'], target['message'],
-                                          playtime, title, artist)
+        if self.shards is not None:
+            # Every worker matches and delivers for its own shard of the targets
+            self.shards.publish(track, slug)
+        elif armed is not None:
+            # Matched ahead of time, the notifications can go right away
+            self.notify(track, slug, armed)
+        elif self.matchStage is not None:
+            # Match and deliver in the background, the next poll does not have to wait for it
+            self.matchStage.put((track, slug))
+        else:
+            self.notify(track, slug)
+
+    def notify(self, track, slug, armed=None):
+        """
+        Posts a notification for every target that is satisfied by a track.
+        Targets limited to another channel are skipped.
+
+        Args:
+            track (qmusic.Song): New song.
+            slug (str): Slug of the channel the track was played on.
+            armed (dict): The notifications of the track, if they were prepared ahead of time (see armNext).
+        """
+        if armed is None:
+            prepared = self.prepare(track, slug, track.played_at())
+        else:
+            prepared = armed
+            if not armed['fired'] and armed['playedAt'] != track.played_at():
+                # The notifications show the actual start, not the announced one
+                armed['playedAt'] = track.played_at()
+                armed['jobs'] = self.buildJobs(armed)
+            if not armed['fired']:
+                self.metrics.increment('qbot_prearmed_total', channel=slug, result='hit')
+        code = prepared['code']
+        self.metrics.increment('qbot_tracks_total', channel=slug)
+        if self.archive is not None:
+            # Keep the play for analysis, with every trigger it satisfied (once)
+            self.archive.append(code, prepared['fields']['artist'], slug, track.played_at(),
+                                dict.fromkeys(target['trigger'] for target in prepared['matches']))
+
+        # Notifications posted at the predicted start are not posted again
+        jobs = [] if prepared.get('fired') else prepared['jobs']
+        if self.outbox:
+            # Record the track and its notifications first, the outbox takes care of posting them
+            play = '{}:{}@{}'.format(slug, code, track.played_at().isoformat())
+            with self.tracer.span('record', posts=len(jobs)):
+                self.outbox.record(slug, code, play, jobs)
+        else:
+            self.dispatch(jobs)
+
+    def prepare(self, track, slug, playedAt):
+        """
+        Matches a track against the targets and prepares one post per webhook,
+        containing the messages of all targets that share it.
+
+        Args:
+            track (qmusic.Song): The track.
+            slug (str): Slug of the channel the track is played on.
+            playedAt (datetime.datetime): Start of the track shown in the notifications (None if unknown).
+
+        Returns:
+            dict: Selector code, details and fields of the track, the satisfied targets, the start shown and
+                  the posts as tuples of (hookURL, postContent) (None while the start is unknown).
+        """
+        # Extract relevant information (the details of a song are only derived the first time it is played)
+        code = track.selector_code()
+        details = self.metadata.get('song:{}'.format(code), lambda: self.songDetails(track))
+
+        # Check which targets are satisfied by the track (text case-insensitive in a single scan, fields by lookup)
+        start = time.perf_counter()
+        with self.tracer.span('match') as span:
+            fields = self.trackFields(track)
+            matches = [target for target in self.matcher.match(details['title'] + ' ' + details['artist'], **fields)
+                       if target['channel'] in ('', slug)]
+            span.set(matches=len(matches))
+        self.metrics.observe('qbot_match_seconds', time.perf_counter() - start)
+
+        prepared = {'code': code, 'details': details, 'fields': fields, 'matches': matches, 'playedAt': playedAt,
+                    'jobs': None}
+        if playedAt is not None:
+            prepared['jobs'] = self.buildJobs(prepared)
+        return prepared
+
+    def buildJobs(self, prepared):
+        """
+        Formats the posts of a prepared track (see prepare).
+
+        Args:
+            prepared (dict): The prepared track, with the start to show.
+
+        Returns:
+            list: Tuples of (hookURL, postContent).
+        """
+        details = prepared['details']
+        playtime = prepared['playedAt'].time().isoformat()
+        return [(hookURL, self.buildNotification(msgStart, playtime, details['title'], details['artist'],
+                                                 details['thumbnail'], details['country']))
+                for hookURL, msgStart in self.coalesce(prepared['matches'])]
+
+    def dispatch(self, jobs):
+        """
+        Posts notifications, through the delivery stage if there is one.
+
+        Args:
+            jobs (list): Tuples of (hookURL, postContent).
+        """
+        if jobs and self.deliveryStage is not None:
+            # Trigger(s) satisfied, let the delivery stage post them
+            self.deliveryStage.put(jobs)
+        elif jobs:
+            # Trigger(s) satisfied, post all notifications at once (rate-limited webhooks are left to the background)
+            self.deliverJobs(jobs, self.printDeliveries)
+
+    def deliverJobs(self, jobs, onLater=None):
+        """
+        Posts notifications at once and prints the outcomes.
+
+        Args:
+            jobs (list): Tuples of (hookURL, postContent).
+            onLater (callable): If given, posts to rate-limited webhooks are not waited for, the outcomes of those
+                                are handed to onLater once they are done (see delivery.Deliverer.deliver).
+        """
+        self.printDeliveries(self.deliverer.deliver(jobs, onLater))
+
+    def songDetails(self, track):
+        """
+        Derives what a notification shows of a song.
+
+        Args:
+            track (qmusic.Song): The song.
+
+        Returns:
+            dict: Title, artist(s), image (the cover, or else a photo of the artist, if any)
+                  and country of the artist (if known).
+        """
+        artistDetails = self.artistDetails(track.artist())
+        # Usually post with thumbnail, but there is a possibility there is no thumbnail
+        try:
+            thumbnail = track.thumbnail_url()
+        except KeyError as _:
+            thumbnail = artistDetails['photo']
+        return {'title': track.title(), 'artist': track.artist().name_all_artist().title(), 'thumbnail': thumbnail,
+                'country': artistDetails['country']}
+
+    def artistDetails(self, artist):
+        """
+        Gets the photo and country of an artist, derived once per artist.
+
+        Args:
+            artist (qmusic.Artist): The artist.
 
-    def printUpdate(self, trackTime, title, artist):
+        Returns:
+            dict: Photo URL and country name of the artist (None if unknown).
+        """
+        def derive():
+            try:
+                photo = artist.photo()
+            except (KeyError, TypeError) as _:
+                photo = None
+            try:
+                country = artist.country_name()
+            except KeyError as _:
+                country = None
+            return {'photo': photo, 'country': country}
+
+        if artist.id_code() is None:
+            return derive()
+        return self.metadata.get('artist:{}'.format(artist.id_code()), derive)
+
+    def trackFields(self, track):
+        """
+        Extracts the fields of a track that structured triggers are matched against.
+
+        Args:
+            track (qmusic.Song): Track to extract the fields of.
+
+        Returns:
+            dict: Artist id, ids of featuring artists, selector code and release year (if known) of the track.
+        """
+        try:
+            featuring = [featured.id_code() for featured in track.featuring_artists()]
+        except KeyError as _:
+            featuring = []
+        year = track.release_year()
+        return {'artist': track.artist().id_code(), 'featuring': featuring, 'code': track.selector_code(),
+                'year': int(year) if year and str(year).isdigit() else None}
+
+    def printUpdate(self, trackTime, title, artist, slug=None):
         """
         Prints an update to the console.
-        For a track the time, song title and artist name is printed.
+        For a track the time, song title and artist name is printed (and the channel, if given).
 
         Args:
             trackTime (str): Time song was started (hh:mm:ss).
             title (str): Title of the song.
             artist (str): Artist(s) of the song.
+            slug (str): Slug of the channel the song was played on.
         """
         message = 'Nieuw liedje:\nTijd: {}\nTitel: {}\nArtiest: {}'.format(trackTime, title, artist)
+        if slug:
+            message += '\nZender: {}'.format(slug)
         print(message)
 
-    def postNotification(self, hookURL, msgStart, trackTime, title, artist, thumbnail=None):
+    def printSchedule(self, slug):
         """
-        Posts a notification to a provided webhook (url).
+        Prints how late songs on a channel are detected and how many requests that takes.
+
+        Args:
+            slug (str): Slug of the channel.
+        """
+        stats = self.schedulers[slug].stats()
+        if stats['lag'] is not None:
+            print('Detectie: gemiddeld {:.1f} s na start, {:.1f} verzoeken per liedje (liedjes duren ~{:.0f} s)'.format(
+                stats['lag'], stats['requests'], stats['length']))
+
+    def printDeliveries(self, deliveries):
+        """
+        Prints (and records) the outcome and latency of every posted notification.
+        Posts that were deferred to the retry threads are skipped, their final outcome is printed once it is known.
+
+        Args:
+            deliveries (list): delivery.Delivery outcomes.
+        """
+        for delivery in deliveries:
+            if delivery.deferred:  # Recorded when the post is actually made
+                continue
+            self.metrics.observe('qbot_webhook_seconds', delivery.latency, status=delivery.status or 'error')
+            outcome = delivery.status if delivery.error is None else delivery.error
+            print('Notificatie naar {}: {} ({:.0f} ms)'.format(delivery.hookURL, outcome, delivery.latency * 1000))
+
+    def coalesce(self, targets, maxLength=1900):
+        """
+        Merges the messages of targets that post to the same webhook, so every webhook receives a single post.
+        A webhook only receives more than one post if its messages would not fit in one.
+
+        Args:
+            targets (list): Satisfied targets.
+            maxLength (int): Maximum length of merged messages (Discord allows 2000 characters per post).
+
+        Returns:
+            list: Tuples of (hookURL, message), in the order the webhooks were first targeted.
+        """
+        # Group unique messages by webhook
+        messages = {}
+        for target in targets:
+            hookMessages = messages.setdefault(target['target'], [])
+            if target['message'] not in hookMessages:
+                hookMessages.append(target['message'])
+
+        # Join the messages of each webhook, starting a new post when one gets too long
+        merged = []
+        for hookURL, hookMessages in messages.items():
+            message = hookMessages[0]
+            for nextMessage in hookMessages[1:]:
+                if len(message) + 1 + len(nextMessage) > maxLength:
+                    merged.append((hookURL, message))
+                    message = nextMessage
+                else:
+                    message += '\n' + nextMessage
+            merged.append((hookURL, message))
+        return merged
+
+    def buildNotification(self, msgStart, trackTime, title, artist, thumbnail=None, country=None):
+        """
+        Prepares the data of a notification.
         For a track, the title becomes username, thumbnail the avatar,
-        artist and time are included in the message.
+        artist (and their country, if known) and time are included in the message.
 
         Args:
-            hookURL (str): URL to post to.
             msgStart (str): Text to start a message with.
-            thumbnail (str): URL of thumbnail image.
             trackTime (str): Time at which the track was started (hh:mm:ss).
             title (str): Title of a track.
             artist (str): Artist(s) of a track.
+            thumbnail (str): URL of thumbnail image.
+            country (str): Country of the artist.
+
+        Returns:
+            dict: Data to include in the post request.
         """
         # Prepare message to display
         message = msgStart + '\nArtiest: {}\nTijd: {}'.format(artist, trackTime)
+        if country:
+            message += '\nLand: {}'.format(country)
         # Prepare data to include in post request
         if thumbnail:
             # If a thumbnail is provided, include it
-            postContent = {'username': title, 'avatar_url': thumbnail, 'content': message}
+            return {'username': title, 'avatar_url': thumbnail, 'content': message}
         else:
             # No thumbnail, so don't include it
-            postContent = {'username': title, 'content': message}
-        # Then post
-        self.sessy.post(hookURL, postContent)
+            return {'username': title, 'content': message}
+
+    def postNotification(self, hookURL, msgStart, trackTime, title, artist, thumbnail=None, country=None):
+        """
+        Posts a notification to a provided webhook (url).
+
+        Args:
+            hookURL (str): URL to post to.
+            msgStart (str): Text to start a message with.
+            trackTime (str): Time at which the track was started (hh:mm:ss).
+            title (str): Title of a track.
+            artist (str): Artist(s) of a track.
+            thumbnail (str): URL of thumbnail image.
+            country (str): Country of the artist.
+
+        Returns:
+            delivery.Delivery: Outcome of the post.
+        """
+        return self.deliverer.post(hookURL, self.buildNotification(msgStart, trackTime, title, artist, thumbnail,
+                                                                   country))
+
+
+def fileStamp(path):
+    """
+    Gets what identifies the version of a file, to detect changes cheaply.
+
+    Args:
+        path (str): Location of the file.
+
+    Returns:
+        tuple: Modification time (ns), size and inode of the file.
+    """
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
 
 
 # If executed, run bot function
 if __name__ == '__main__':
 
-    # Initialise bot
-    bot = QBot()
-    bot.readTargets('targets.csv')
+    # Read command line arguments
+    parser = argparse.ArgumentParser(description='Listen to Q-music and post songs satisfying a target to webhooks.')
+    parser.add_argument('slugs', nargs='*', help="Slugs of the channels to listen to ('all' for every channel)")
+    parser.add_argument('--history', type=int, default=0,
+                        help='Number of recent plays to fetch per poll, to backfill songs missed in between polls')
+    parser.add_argument('--default-length', type=float,
+                        help='Assumed song length (s) until lengths are learned, e.g. the song length of the simulator')
+    parser.add_argument('--min-length', type=float,
+                        help='Shortest song length (s) to learn from (defaults to a seventh of --default-length)')
+    parser.add_argument('--max-length', type=float,
+                        help='Longest song length (s) to learn from (defaults to 30/7 times --default-length)')
+    parser.add_argument('--outbox', metavar='PATH',
+                        help='SQLite database to record notifications in before posting them, survives restarts')
+    parser.add_argument('--targets', default='targets.csv', help='Location of the targets file')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='Number of worker processes to shard matching and delivery over (0 does it in-process)')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='Match and deliver in background stages, so polling never waits for webhooks')
+    parser.add_argument('--queue-size', type=int, default=1000, help='Maximum number of items waiting per stage')
+    parser.add_argument('--overflow', choices=OVERFLOW_POLICIES, default='drop-oldest',
+                        help='What the delivery stage does when its queue is full')
+    parser.add_argument('--archive', metavar='DIR',
+                        help='Keep every play and the triggers it satisfied in a columnar archive (see analytics.py)')
+    parser.add_argument('--metadata-cache', metavar='PATH',
+                        help='File to keep details of songs and artists in across restarts')
+    parser.add_argument('--reload-interval', type=float, default=5,
+                        help='Seconds in between checks of the targets file for changes (0 disables reloading)')
+    parser.add_argument('--api', metavar='URL', help='Use another API than Q-music, e.g. the simulator')
+    parser.add_argument('--record', metavar='PATH',
+                        help='Append every changed response of the API to PATH, to be replayed with replay.py')
+    parser.add_argument('--push', nargs='?', const='', metavar='URL',
+                        help='Subscribe to the now-playing push feed of every channel and only poll while it is down '
+                             "(URL of the feeds, '{slug}' is replaced by the channel, defaults to the feed of the API)")
+    parser.add_argument('--push-silence', type=float, default=30,
+                        help='Seconds without any data after which a push feed is polled instead')
+    parser.add_argument('--pre-arm', nargs='?', const='confirm', choices=PRE_ARM_MODES,
+                        help='Prepare the notifications of the song a channel announces to play next, and post them '
+                             "once its start is seen ('confirm', the default) or at its predicted start ('predict')")
+    parser.add_argument('--metrics-port', type=int, help='Serve metrics in the Prometheus format at :PORT/metrics')
+    parser.add_argument('--stats-interval', type=float, help='Print a summary of the metrics every this many seconds')
+    parser.add_argument('--trace', metavar='PATH', help='Append a JSON span of every polling cycle to PATH')
+    parser.add_argument('--trace-threshold', type=float, default=0, metavar='MS',
+                        help='Only trace polling cycles taking at least this many milliseconds')
+    parser.add_argument('--profile-dir', metavar='DIR',
+                        help='Sample all threads on SIGUSR1 and write the profile to DIR')
+    parser.add_argument('--profile-seconds', type=float, default=30, help='Seconds to sample for on SIGUSR1')
+    parser.add_argument('--once', action='store_true',
+                        help='Check every channel once, post the notifications and exit (e.g. from a timer)')
+    parser.add_argument('--state', metavar='PATH',
+                        help='File to keep the last handled track of every channel in across runs '
+                             '(--once defaults to {} unless there is an outbox)'.format(STATE_PATH))
+    args = parser.parse_args()
+    if args.archive and args.workers > 0 and not args.once:
+        parser.error('--archive cannot be combined with --workers, the workers only see their own targets')
+    if args.pre_arm and args.workers > 0 and not args.once:
+        parser.error('--pre-arm cannot be combined with --workers, the workers only see their own targets')
+    if args.pre_arm == 'predict' and args.outbox and not args.once:
+        parser.error('--pre-arm predict cannot be combined with --outbox, posts at the predicted start would not '
+                     'be recorded in the outbox before they are sent')
+
+    # Initialise bot, listening to the given channels (or the regular channel)
+    qapi = Qmusic(compact=True, selective='auto', base_url=args.api) if args.api else None
+    tracer = Tracer(args.trace, args.trace_threshold / 1000) if args.trace else None
+    metadata = MetadataCache(path=args.metadata_cache)
+    if args.metadata_cache:
+        metadata.saveEvery(60)
+    # When sharded, every worker keeps its own outbox (a single check is never sharded nor pipelined)
+    policy = {'defaultLength': args.default_length, 'minLength': args.min_length, 'maxLength': args.max_length}
+    try:
+        bot = QBot(('all' if args.slugs == ['all'] else args.slugs) or None, args.history,
+                   None if args.workers > 0 and not args.once else args.outbox, qapi, tracer, metadata,
+                   schedulerOptions={name: value for name, value in policy.items() if value is not None})
+    except ValueError as error:
+        parser.error(str(error))
+    if args.archive:
+        from archive import PlayArchive  # Only imported when used, to keep starting up cheap
+        bot.archive = PlayArchive(args.archive)
+        if not args.once:
+            bot.archive.flushEvery(60)
+    if args.state or (args.once and not args.outbox):
+        bot.loadState(args.state or STATE_PATH)
+    if args.workers > 0 and not args.once:
+        from shards import ShardPool  # Only imported when used, to keep starting up cheap
+        # This process only polls, the workers read (their shard of) the targets themselves
+        bot.shards = ShardPool(args.workers, {'slugs': list(bot.channels), 'targets': args.targets,
+                                              'outbox': args.outbox, 'api': args.api,
+                                              'reloadInterval': args.reload_interval})
+        for index in range(args.workers):
+            bot.metrics.gauge('qbot_queue_depth', functools.partial(bot.shards.depth, index),
+                              stage='shard-{}'.format(index))
+    elif args.pipeline and not args.once:
+        bot.startPipeline(args.queue_size, args.overflow)
+    bot.readTargets(args.targets)
+
+    if args.once:
+        # Check once, wait for the posts and stop
+        newTracks = bot.runOnce()
+        if bot.outbox:
+            bot.outbox.close()
+        bot.deliverer.close()
+        metadata.save()
+        if bot.archive is not None:
+            bot.archive.close()
+        print('Klaar in {:.0f} ms, {} nieuwe liedjes'.format((time.perf_counter() - STARTED) * 1000, newTracks))
+        raise SystemExit(0)
+
+    if args.reload_interval > 0 and bot.shards is None:
+        bot.watchTargets(args.reload_interval)
+    if args.record:
+        bot.startRecording(args.record)
+    if args.pre_arm:
+        bot.preArm = args.pre_arm
+        for channel in bot.channels.values():
+            channel.next_upcoming = True  # The announced song is armed, it is not current until it shows up as played
+    if args.push is not None:
+        bot.startPush(args.push or None, args.push_silence)
+    if args.metrics_port:
+        bot.metrics.serve(args.metrics_port)
+    if args.stats_interval:
+        bot.metrics.dumpEvery(args.stats_interval)
+    if args.profile_dir and not Sampler(args.profile_dir, args.profile_seconds).installSignal():
+        print('Profileren op signaal wordt niet ondersteund op dit platform')
+
+    # Stop on SIGTERM (e.g. from systemd) like on CTRL-C, so what is still buffered is kept
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
 
     # Run bot until process kill (CTRL-C)
-    while True:
-        # Keep listening, even if an error occurs, just restart
-        try:
-            bot.listenToQ()
-        except Exception as error:
-            # Print exception, try to send a notification and restart in 10 seconds
-            print(traceback.format_exc() + '\nListener crashed, re-establishing connection...')
+    try:
+        while True:
+            # Keep listening, even if an error occurs, just restart
             try:
-                # Try to send a notification to the first target
-                bot.sessy.post(bot.targets[0]['target'],
-                               {'content': bot.targets[0]['message'] + '\nError! Opnieuw verbinding aan het maken...'})
-            except Exception as postErr:
-                # Unable to post notification, really time to restart
-                print(traceback.format_exc() + '\nCould not send notification of failure either :(...')
+                bot.listenToQ()
+            except Exception as error:
+                # Print exception, try to send a notification and restart in 10 seconds
+                bot.metrics.increment('qbot_crash_restarts_total')
+                print(traceback.format_exc() + '\nListener crashed, re-establishing connection...')
+                try:
+                    # Try to send a notification to the first target
+                    bot.sessy.post(bot.targets[0]['target'], {
+                        'content': bot.targets[0]['message'] + '\nError! Opnieuw verbinding aan het maken...'})
+                except Exception as postErr:
+                    # Unable to post notification, really time to restart
+                    print(traceback.format_exc() + '\nCould not send notification of failure either :(...')
+                    continue
+                time.sleep(10)  # Wait 10 seconds before restarting
                 continue
-            time.sleep(10)  # Wait 10 seconds before restarting
-            continue
+    finally:
+        # Write the plays and details that are still buffered
+        if bot.archive is not None:
+            bot.archive.close()
+        metadata.save()
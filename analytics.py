@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+
+from archive import COLUMNS, TRIGGER_COLUMNS, DICTIONARIES, columnPath, readDictionary  # Layout of the archive
+from array import array     # Columns (without NumPy)
+from collections import Counter  # Counting (without NumPy)
+from itertools import compress, repeat  # Selecting plays (without NumPy)
+
+import argparse             # Command line arguments
+import datetime             # Days of plays
+import operator             # Comparing columns (without NumPy)
+import os                   # Column files
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+DAY = 86400  # Seconds
+
+
+class Plays:
+    """
+    Read-only view of a play archive (see archive.py), answering aggregate questions about the play history.
+    With NumPy the columns are memory-mapped and every query is a handful of vectorized operations over them,
+    so a year of plays on every channel takes milliseconds. Without NumPy the columns are read into arrays
+    and counted with the C-level iterators of the standard library, which is slower but gives the same answers.
+    """
+
+    def __init__(self, directory, useNumpy=True):
+        """
+        Opens an archive. Plays appended afterwards are not seen, open the archive again for those.
+
+        Args:
+            directory (str): Directory of the archive.
+            useNumpy (bool): Whether to use NumPy (if it is installed).
+        """
+        self.numpy = numpy if useNumpy else None
+        self.values = {name: readDictionary(directory, name) for name in DICTIONARIES}  # name -> strings by index
+        columns = {name: self.readColumn(directory, name, typeCode) for name, typeCode in COLUMNS}
+        # Leave out a play that is being written
+        self.size = min(len(column) for column in columns.values())
+        for name, column in columns.items():
+            setattr(self, name, column[:self.size])
+        end = self.matches[-1] if self.size else 0
+        for name, typeCode in TRIGGER_COLUMNS:
+            setattr(self, name, self.readColumn(directory, name, typeCode)[:end])
+
+    def readColumn(self, directory, name, typeCode):
+        """
+        Args:
+            directory (str): Directory of the archive.
+            name (str): Name of the column.
+            typeCode (str): Array type code of the column.
+
+        Returns:
+            numpy.ndarray or array.array: Values of the column (memory-mapped with NumPy).
+        """
+        path = columnPath(directory, name)
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        if self.numpy:
+            dtype = self.numpy.dtype(typeCode)
+            if size < dtype.itemsize:
+                return self.numpy.zeros(0, dtype)
+            # A plain view of the mapping, which avoids the overhead of the memmap subclass on every operation
+            return self.numpy.memmap(path, dtype, 'r', shape=(size // dtype.itemsize,)).view(self.numpy.ndarray)
+        column = array(typeCode)
+        if size:
+            with open(path, 'rb') as columnFile:
+                column.fromfile(columnFile, size // column.itemsize)
+        return column
+
+    def __len__(self):
+        """
+        Returns:
+            int: Number of plays.
+        """
+        return self.size
+
+    def selection(self, since=None, until=None, artist=None):
+        """
+        Selects plays.
+
+        Args:
+            since (datetime.datetime): Only plays starting at or after this moment.
+            until (datetime.datetime): Only plays starting before this moment.
+            artist (int): Only plays of songs by the artist with this id.
+
+        Returns:
+            numpy.ndarray or iterable: Whether every play is selected (None if all are selected).
+                                       Without NumPy an iterator, which can only be used once.
+        """
+        conditions = []
+        if since is not None:
+            conditions.append((self.played_at, operator.ge, int(since.timestamp())))
+        if until is not None:
+            conditions.append((self.played_at, operator.lt, int(until.timestamp())))
+        if artist is not None:
+            conditions.append((self.artist, operator.eq, artist))
+        if not conditions:
+            return None
+        if self.numpy:
+            selected = None
+            for column, compare, value in conditions:
+                test = compare(column, value)
+                selected = test if selected is None else selected & test
+            return selected
+        # Combine the conditions lazily, play by play
+        tests = [map(compare, column, repeat(value)) for column, compare, value in conditions]
+        return tests[0] if len(tests) == 1 else map(all, zip(*tests))
+
+    def artistPerDay(self, artist, since=None, until=None, utcOffset=0):
+        """
+        Counts the plays of an artist per day, on every channel.
+
+        Args:
+            artist (int): Id of the artist.
+            since (datetime.datetime): Only plays starting at or after this moment.
+            until (datetime.datetime): Only plays starting before this moment.
+            utcOffset (int): Seconds the days start after midnight UTC, e.g. 3600 for CET.
+
+        Returns:
+            dict: Channel slug -> datetime.date -> number of plays (days without plays are left out).
+        """
+        selected = self.selection(since, until, artist)
+        result = {}
+        if self.numpy:
+            rows = self.numpy.flatnonzero(selected)  # Taking rows by index beats indexing by a mask
+            channels = self.channel.take(rows)
+            days = (self.played_at.take(rows) + utcOffset) // DAY
+            if not len(days):
+                return result
+            # Count every (channel, day) pair at once, as a single bin index
+            first = int(days.min())
+            span = int(days.max()) - first + 1
+            counts = self.numpy.bincount(channels.astype(self.numpy.int64) * span + (days - first))
+            keys = self.numpy.flatnonzero(counts)
+            dates = [toDate(day) for day in range(first, first + span)]
+            for channel, day, count in zip((keys // span).tolist(), (keys % span).tolist(), counts[keys].tolist()):
+                result.setdefault(self.values['channel'][channel], {})[dates[day]] = count
+            return result
+        days = map(operator.floordiv, map(operator.add, self.played_at, repeat(utcOffset)), repeat(DAY))
+        for (channel, day), count in sorted(Counter(compress(zip(self.channel, days), selected)).items()):
+            result.setdefault(self.values['channel'][channel], {})[toDate(day)] = count
+        return result
+
+    def triggerCounts(self, since=None, until=None):
+        """
+        Counts how often every trigger fired.
+
+        Args:
+            since (datetime.datetime): Only plays starting at or after this moment.
+            until (datetime.datetime): Only plays starting before this moment.
+
+        Returns:
+            list: Tuples of (trigger, number of plays that satisfied it), the most frequent first.
+        """
+        selected = self.selection(since, until)
+        if self.numpy:
+            triggers = self.triggers
+            if selected is not None:
+                triggers = triggers[selected.take(self.trigger_plays)]
+            counts = self.numpy.bincount(triggers, minlength=len(self.values['trigger']))
+            order = self.numpy.argsort(-counts, kind='stable')
+            return [(self.values['trigger'][index], int(counts[index])) for index in order if counts[index]]
+        if selected is None:
+            counts = Counter(self.triggers)
+        else:
+            selected = array('b', selected)
+            counts = Counter(compress(self.triggers, map(selected.__getitem__, self.trigger_plays)))
+        return [(self.values['trigger'][index], count) for index, count in mostCommon(counts)]
+
+    def topArtists(self, count=10, since=None, until=None):
+        """
+        Finds the most played artists.
+
+        Args:
+            count (int): Number of artists to return.
+            since (datetime.datetime): Only plays starting at or after this moment.
+            until (datetime.datetime): Only plays starting before this moment.
+
+        Returns:
+            list: Tuples of (artist id, number of plays), the most played first.
+        """
+        selected = self.selection(since, until)
+        if self.numpy:
+            artists = self.artist if selected is None else self.artist.take(self.numpy.flatnonzero(selected))
+            artists = artists[artists >= 0]
+            if len(artists) and artists.max() < 1 << 24:
+                # Ids are small enough to count by id directly, which beats sorting them
+                counts = self.numpy.bincount(artists)
+                ids = self.numpy.flatnonzero(counts)
+                counts = counts[ids]
+            else:
+                ids, counts = self.numpy.unique(artists, return_counts=True)
+            order = self.numpy.argsort(-counts, kind='stable')[:count]
+            return [(int(ids[index]), int(counts[index])) for index in order]
+        artists = self.artist if selected is None else compress(self.artist, selected)
+        counts = Counter(artists)
+        counts.pop(-1, None)  # Unknown artists
+        return mostCommon(counts)[:count]
+
+
+def mostCommon(counts):
+    """
+    Args:
+        counts (collections.Counter): Counts per key.
+
+    Returns:
+        list: Tuples of (key, count), the highest count first and ties by key (the order NumPy gives as well).
+    """
+    return sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+
+
+def toDate(day):
+    """
+    Args:
+        day (int): Number of days since 1 January 1970.
+
+    Returns:
+        datetime.date: The day.
+    """
+    return datetime.date(1970, 1, 1) + datetime.timedelta(days=day)
+
+
+# If executed, answer a question about an archive
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Analyse the play history recorded in an archive.')
+    parser.add_argument('archive', help='Directory of the archive (see --archive of QBot.py)')
+    parser.add_argument('--artist', type=int, help='Count the plays of the artist with this id per day and channel')
+    parser.add_argument('--triggers', action='store_true', help='Count how often every trigger fired')
+    parser.add_argument('--top', type=int, metavar='N', help='List the N most played artists')
+    parser.add_argument('--since', type=datetime.datetime.fromisoformat, help='Only plays from this moment on')
+    parser.add_argument('--until', type=datetime.datetime.fromisoformat, help='Only plays before this moment')
+    args = parser.parse_args()
+
+    plays = Plays(args.archive)
+    print('{} afgespeelde liedjes'.format(len(plays)))
+    if args.artist is not None:
+        for slug, days in sorted(plays.artistPerDay(args.artist, args.since, args.until).items()):
+            for day, count in sorted(days.items()):
+                print('{} {} {}'.format(slug, day, count))
+    if args.triggers:
+        for trigger, count in plays.triggerCounts(args.since, args.until):
+            print('{:>8} {}'.format(count, trigger))
+    if args.top:
+        for artist, count in plays.topArtists(args.top, args.since, args.until):
+            print('{:>8} {}'.format(count, artist))
@@ -0,0 +1,254 @@
+from array import array     # Compact columns
+from itertools import repeat  # Play of every matched trigger
+
+import json                 # Dictionary values
+import os                   # Column files
+import threading            # Guarding appends, writing in the background
+import time                 # Periodic writes
+
+# Fixed-width columns, one value per play, with their array type codes
+COLUMNS = (
+    ('code', 'i'),  # Selector code, as index into the 'code' dictionary
+    ('artist', 'q'),  # Artist id (-1 if unknown)
+    ('channel', 'i'),  # Channel slug, as index into the 'channel' dictionary
+    ('played_at', 'q'),  # Start of the play, UNIX timestamp (s)
+    ('matches', 'q'),  # End of the matched triggers of the play in the 'triggers' column
+)
+# Columns with a value per matched trigger (in the order of the plays)
+TRIGGER_COLUMNS = (
+    ('triggers', 'i'),  # Trigger, as index into the 'trigger' dictionary
+    ('trigger_plays', 'i'),  # Play the trigger was matched for
+)
+# Strings that are stored as indices
+DICTIONARIES = ('code', 'channel', 'trigger')
+
+
+class PlayArchive:
+    """
+    Append-only columnar archive of plays, for analysing play history afterwards (see analytics.py).
+    Every column is a file of fixed-width values in native byte order, which can be read (or memory-mapped)
+    as a whole into an array. Strings are stored once in a dictionary file and referred to by their index.
+    Plays are buffered and appended to the files in batches, a play written partially (e.g. during a crash)
+    is discarded when the archive is opened again.
+    """
+
+    def __init__(self, directory, batchSize=256):
+        """
+        Opens (or creates) an archive.
+
+        Args:
+            directory (str): Directory of the archive.
+            batchSize (int): Number of plays to buffer before they are written.
+        """
+        self.directory = directory
+        self.batchSize = batchSize
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        # Strings by index and indices by string, per dictionary
+        self.values = {name: readDictionary(directory, name, repair=True) for name in DICTIONARIES}
+        self.indices = {name: {value: index for index, value in enumerate(values)}
+                        for name, values in self.values.items()}
+        self.written = {name: len(values) for name, values in self.values.items()}  # Values already on disk
+        self.plays = self.repair()  # Number of plays on disk
+        self.triggerCount = self.endOfTriggers()  # Number of matched triggers on disk
+        self.buffers = {name: array(typeCode) for name, typeCode in COLUMNS + TRIGGER_COLUMNS}
+
+    def repair(self):
+        """
+        Truncates the columns to the plays that were written completely.
+
+        Returns:
+            int: Number of plays in the archive.
+        """
+        sizes = [os.path.getsize(columnPath(self.directory, name)) // array(typeCode).itemsize
+                 if os.path.exists(columnPath(self.directory, name)) else 0 for name, typeCode in COLUMNS]
+        plays = min(sizes)
+        for (name, typeCode), size in zip(COLUMNS, sizes):
+            if size > plays:
+                os.truncate(columnPath(self.directory, name), plays * array(typeCode).itemsize)
+        return plays
+
+    def endOfTriggers(self):
+        """
+        Truncates the matched triggers to those of the plays in the archive.
+
+        Returns:
+            int: Number of matched triggers in the archive.
+        """
+        end = 0
+        if self.plays:
+            # The last value of the 'matches' column is where the triggers of the last complete play end
+            last = array('q')
+            with open(columnPath(self.directory, 'matches'), 'rb') as column:
+                column.seek((self.plays - 1) * last.itemsize)
+                last.fromfile(column, 1)
+            end = last[0]
+        for name, typeCode in TRIGGER_COLUMNS:
+            path = columnPath(self.directory, name)
+            if os.path.exists(path) and os.path.getsize(path) > end * array(typeCode).itemsize:
+                os.truncate(path, end * array(typeCode).itemsize)
+        return end
+
+    def lookup(self, name, value):
+        """
+        Args:
+            name (str): Dictionary to look in.
+            value (str): String to look up, added to the dictionary if it is new.
+
+        Returns:
+            int: Index of the string.
+        """
+        index = self.indices[name].get(value)
+        if index is None:
+            index = self.indices[name][value] = len(self.values[name])
+            self.values[name].append(value)
+        return index
+
+    def append(self, code, artist, channel, playedAt, triggers=()):
+        """
+        Adds a play to the archive.
+
+        Args:
+            code (str): Selector code of the song.
+            artist (int): Id of the (main) artist of the song, None if unknown.
+            channel (str): Slug of the channel the song was played on.
+            playedAt (datetime.datetime): Start of the play.
+            triggers (list): Triggers of the targets the play satisfied.
+        """
+        with self.lock:
+            buffers = self.buffers
+            buffers['code'].append(self.lookup('code', code))
+            buffers['artist'].append(artist if isinstance(artist, int) else -1)
+            buffers['channel'].append(self.lookup('channel', channel))
+            buffers['played_at'].append(int(playedAt.timestamp()))
+            buffers['triggers'].extend(self.lookup('trigger', trigger) for trigger in triggers)
+            play = self.plays + len(buffers['played_at']) - 1
+            buffers['trigger_plays'].extend(repeat(play, len(buffers['triggers']) - len(buffers['trigger_plays'])))
+            buffers['matches'].append(self.triggerCount + len(buffers['triggers']))
+            if len(buffers['played_at']) >= self.batchSize:
+                try:
+                    self.write()
+                except OSError as error:  # The plays stay buffered until the next write
+                    print('Archief kon niet worden bijgewerkt: {}'.format(error))
+
+    def flush(self):
+        """
+        Writes the buffered plays.
+        """
+        with self.lock:
+            self.write()
+
+    def write(self):
+        """
+        Writes the buffered plays, the lock must be held.
+        New dictionary values and matched triggers are written first, then the columns of the plays themselves,
+        so a play is only complete once everything it refers to is on disk.
+        If writing fails, every file is truncated back to its size before the write (so the columns stay aligned)
+        and the plays stay buffered, to be written again by the next write.
+
+        Raises:
+            OSError: If the plays could not be written.
+        """
+        if not len(self.buffers['played_at']):
+            return
+        paths = [dictionaryPath(self.directory, name) for name in DICTIONARIES] + \
+                [columnPath(self.directory, name) for name, _ in TRIGGER_COLUMNS + COLUMNS]
+        sizes = {path: os.path.getsize(path) for path in paths if os.path.exists(path)}  # Sizes to restore
+        try:
+            for name, values in self.values.items():
+                if len(values) > self.written[name]:
+                    with open(dictionaryPath(self.directory, name), 'a') as dictionary:
+                        dictionary.writelines(json.dumps(value) + '\n' for value in values[self.written[name]:])
+            for name, _ in TRIGGER_COLUMNS + COLUMNS:
+                with open(columnPath(self.directory, name), 'ab') as column:
+                    self.buffers[name].tofile(column)
+        except BaseException:
+            for path in paths:
+                try:
+                    os.truncate(path, sizes.get(path, 0))
+                except OSError as _:  # Left to repair() when the archive is opened again
+                    pass
+            raise
+        self.written = {name: len(values) for name, values in self.values.items()}
+        self.plays += len(self.buffers['played_at'])
+        self.triggerCount += len(self.buffers['triggers'])
+        self.buffers = {name: array(typeCode) for name, typeCode in COLUMNS + TRIGGER_COLUMNS}
+
+    def __len__(self):
+        """
+        Returns:
+            int: Number of plays in the archive (including buffered ones).
+        """
+        return self.plays + len(self.buffers['played_at'])
+
+    def flushEvery(self, interval):
+        """
+        Writes the buffered plays periodically, in the background.
+
+        Args:
+            interval (float): Seconds in between writes.
+        """
+        def flushLoop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.flush()
+                except OSError as error:
+                    print('Archief kon niet worden bijgewerkt: {}'.format(error))
+
+        threading.Thread(target=flushLoop, name='archive', daemon=True).start()
+
+    def close(self):
+        """
+        Writes the buffered plays.
+        """
+        self.flush()
+
+
+def columnPath(directory, name):
+    """
+    Args:
+        directory (str): Directory of the archive.
+        name (str): Name of the column.
+
+    Returns:
+        str: Location of the column file.
+    """
+    return os.path.join(directory, name + '.bin')
+
+
+def dictionaryPath(directory, name):
+    """
+    Args:
+        directory (str): Directory of the archive.
+        name (str): Name of the dictionary.
+
+    Returns:
+        str: Location of the dictionary file.
+    """
+    return os.path.join(directory, name + '.jsonl')
+
+
+def readDictionary(directory, name, repair=False):
+    """
+    Reads a dictionary of an archive.
+
+    Args:
+        directory (str): Directory of the archive.
+        name (str): Name of the dictionary.
+        repair (bool): Whether to truncate a line that was written partially (e.g. during a crash),
+                       so values can be appended again.
+
+    Returns:
+        list: Strings of the dictionary, by index.
+    """
+    path = dictionaryPath(directory, name)
+    try:
+        with open(path, 'rb') as dictionary:
+            data = dictionary.read()
+    except OSError as _:
+        return []
+    end = data.rfind(b'\n') + 1  # A partial last line is discarded
+    if repair and end < len(data):
+        os.truncate(path, end)
+    return [json.loads(line) for line in data[:end].splitlines()]
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+"""
+Times queries over a year of generated plays on every channel, with and without NumPy.
+Run from the repository root with `python -m benchmarks.bench_analytics`.
+"""
+
+from analytics import Plays, numpy  # Queries over the archive
+from archive import PlayArchive  # Writing the archive
+
+import argparse             # Command line arguments
+import datetime             # Play times
+import random               # Generating plays
+import tempfile             # Scratch archive
+import timeit               # Timing
+
+
+def fillArchive(directory, channels, days, rng):
+    """
+    Generates plays of three minute songs, around the clock, on a number of channels.
+
+    Args:
+        directory (str): Directory of the archive.
+        channels (int): Number of channels.
+        days (int): Number of days.
+        rng (random.Random): Random number generator.
+
+    Returns:
+        int: Number of generated plays.
+    """
+    archive = PlayArchive(directory, batchSize=100000)
+    start = datetime.datetime(2021, 1, 1, tzinfo=datetime.timezone.utc)
+    triggers = ['trigger{}'.format(index) for index in range(500)]
+    for minute in range(0, days * 24 * 60, 3):
+        playedAt = start + datetime.timedelta(minutes=minute)
+        for channel in range(channels):
+            artist = int(rng.paretovariate(1.2)) % 5000
+            matched = rng.sample(triggers, rng.choice((0, 0, 0, 1, 1, 2)))
+            archive.append('QM{:05d}'.format(artist * 7 % 20000), artist, 'channel_{}'.format(channel),
+                           playedAt, matched)
+    archive.close()
+    return len(archive)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--channels', type=int, default=20)
+    parser.add_argument('--days', type=int, default=365)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = timeit.default_timer()
+        plays = fillArchive(directory, args.channels, args.days, random.Random(42))
+        print('{} plays written in {:.1f} s'.format(plays, timeit.default_timer() - start))
+
+        since = datetime.datetime(2021, 6, 1, tzinfo=datetime.timezone.utc)
+        queries = {
+            'artist per day': lambda view: view.artistPerDay(1),
+            'trigger counts': lambda view: view.triggerCounts(),
+            'triggers since': lambda view: view.triggerCounts(since),
+            'top artists': lambda view: view.topArtists(10),
+        }
+        variants = [('array', False)] + ([('numpy', True)] if numpy else [])
+        answers = {}
+        print('{:>16} {:>10} {:>12}'.format('query', 'variant', 'time (ms)'))
+        for variant, useNumpy in variants:
+            start = timeit.default_timer()
+            view = Plays(directory, useNumpy)
+            print('{:>16} {:>10} {:>12.1f}'.format('open', variant, (timeit.default_timer() - start) * 1e3))
+            for name, query in queries.items():
+                answer = query(view)
+                # Both variants must agree before their timings are worth comparing
+                assert answers.setdefault(name, answer) == answer, name
+                elapsed = min(timeit.repeat(lambda: query(view), number=1, repeat=3))
+                print('{:>16} {:>10} {:>12.1f}'.format(name, variant, elapsed * 1e3))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+"""
+Compares the CPU time of decoding the channel catalog and a tracks/plays response
+with every installed JSON backend, both completely and selectively.
+Run from the repository root with `python -m benchmarks.bench_decode`.
+"""
+
+from qmusic import Decoder, CATALOG_SCHEMA, PLAYS_SCHEMA  # Decoding
+
+import json                 # Encoding the fixtures
+import timeit               # Timing
+
+
+def makeCatalog(count):
+    """
+    Builds a channel catalog shaped like app/channels, including the stream and logo variants the bot never reads.
+
+    Args:
+        count (int): Number of channels.
+
+    Returns:
+        bytes: Encoded catalog.
+    """
+    streams = {kind: [{'source': 'https://stream.example.invalid/{}/{}.{}'.format(kind, i, kind),
+                       'extra': ['quality={}'.format(i)]} for i in range(4)]
+               for kind in ('aac', 'mp3', 'video', 'hls', 'radioplayerId')}
+    streams.update({'mobile': {'audio': 'a', 'video': 'v', 'live': 'l'}, 'android': {'high': 'h', 'low': 'l'},
+                    'iphone': {'live': 'l', 'video': 'v'}})
+    logo = {name: 'https://static.example.invalid/{}.png'.format(name)
+            for name in ('active_android_url', 'active_iphone_url', 'app_card', 'app_player_bg_phone', 'app_square',
+                         'app_player_icon', 'app_player_thumbnail', 'radioplayer_cover', 'site_logo', 'homepage_banner')}
+    channels = [{'data': {'id': 'channel_{}'.format(i), 'name': 'Channel {}'.format(i),
+                          'api_url': 'api.example.invalid/channel_{}'.format(i), 'station_id': str(i),
+                          'background_image': 'bg.png', 'search_terms': ['q', 'music'], 'logo': logo,
+                          'streams': streams},
+                 'color': {'background': '#ff0000', 'foreground': '#ffffff', 'extra': '#000000'}}
+                for i in range(count)]
+    return json.dumps({'data': channels}).encode()
+
+
+def makePlays(count):
+    """
+    Builds a tracks/plays response.
+
+    Args:
+        count (int): Number of plays.
+
+    Returns:
+        bytes: Encoded response.
+    """
+    artist = {'id': 42, 'name': 'QUEEN', 'original_name': 'QUEEN', 'slug': 'queen', 'bio': 'Band ' * 200,
+              'photo': '/artists/queen.jpg', 'facebook_url': 'https://facebook.example.invalid/queen',
+              'country': {'code': 'GB', 'name': 'United Kingdom'}}
+    play = {'selector_code': 'QM12345', 'title': 'Bohemian Rhapsody', 'slug': 'bohemian-rhapsody',
+            'played_at': '2021-03-01T12:34:56+01:00', 'thumbnail': '/tracks/bohemian-rhapsody.jpg',
+            'release_year': '1975', 'spotify_url': 'https://open.spotify.com/track/x', 'artist': artist,
+            'youtube_ids': {'default': 'fJ9rUzIMcZQ'}, 'hooks': {'m4a': 'https://example.invalid/hook.m4a'},
+            'editions': [{'position': i, 'edition': {'name': '2020'}, 'list': {'name': 'Top 500'}} for i in range(20)],
+            'sub_artists': [{'artist': artist}]}
+    return json.dumps({'played_tracks': [play] * count}).encode()
+
+
+def main():
+    backends = []
+    for backend in ('json', 'orjson', 'msgspec'):
+        try:
+            backends.append(Decoder(backend))
+        except ImportError:
+            print('{} is not installed, skipping'.format(backend))
+
+    fixtures = [('catalog (30 channels)', makeCatalog(30), CATALOG_SCHEMA),
+                ('tracks/plays (limit=1)', makePlays(1), PLAYS_SCHEMA),
+                ('tracks/plays (limit=10)', makePlays(10), PLAYS_SCHEMA)]
+    print('{:>24} {:>8} {:>14} {:>16}'.format('document', 'backend', 'full (us)', 'selective (us)'))
+    for name, content, schema in fixtures:
+        for decoder in backends:
+            number = 200
+            full = min(timeit.repeat(lambda: decoder.decode(content), number=number, repeat=3)) / number
+            selective = min(timeit.repeat(lambda: decoder.decode(content, schema), number=number, repeat=3)) / number
+            print('{:>24} {:>8} {:>14.1f} {:>16.1f}'.format(name, decoder.backend, full * 1e6, selective * 1e6))
+
+
+if __name__ == '__main__':
+    main()
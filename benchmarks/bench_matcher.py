@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+"""
+Compares the compiled trigger matcher to the original per-target loop.
+Run from the repository root with `python -m benchmarks.bench_matcher`.
+"""
+
+from matcher import TriggerMatcher  # Compiled multi-pattern matching
+
+import random               # Generating triggers
+import string               # Alphabet for generated triggers
+import timeit               # Timing
+
+
+def makeTargets(count, rng):
+    """
+    Generates targets with random word triggers.
+
+    Args:
+        count (int): Number of targets to generate.
+        rng (random.Random): Random number generator.
+
+    Returns:
+        list: Target dictionaries.
+    """
+    targets = []
+    for i in range(count):
+        trigger = ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 12)))
+        targets.append({'trigger': trigger, 'target': 'https://example.invalid/{}'.format(i), 'message': str(i)})
+    # Make sure some targets actually fire
+    targets[0]['trigger'] = 'queen'
+    targets[-1]['trigger'] = 'Bohemian'
+    return targets
+
+
+def loopMatch(targets, title, artist):
+    """
+    The original per-target scan of QBot.handleUpdate.
+    """
+    return [target for target in targets
+            if target['trigger'].lower() in title.lower() + ' ' + artist.lower()]
+
+
+def main():
+    rng = random.Random(42)
+    title, artist = 'Bohemian Rhapsody', 'Queen'
+    print('{:>8} {:>14} {:>14} {:>10} {:>12}'.format('targets', 'loop (us)', 'matcher (us)', 'speed-up', 'build (ms)'))
+    for count in (10, 1000, 100000):
+        targets = makeTargets(count, rng)
+        start = timeit.default_timer()
+        matcher = TriggerMatcher(targets)
+        build = timeit.default_timer() - start
+
+        # Both approaches must agree before their timings are worth comparing
+        assert loopMatch(targets, title, artist) == matcher.match(title + ' ' + artist)
+
+        repeats = max(1, 100000 // count)
+        loopTime = min(timeit.repeat(lambda: loopMatch(targets, title, artist), number=repeats, repeat=3)) / repeats
+        matchTime = min(timeit.repeat(lambda: matcher.match(title + ' ' + artist), number=repeats, repeat=3)) / repeats
+        print('{:>8} {:>14.1f} {:>14.1f} {:>9.1f}x {:>12.1f}'.format(
+            count, loopTime * 1e6, matchTime * 1e6, loopTime / matchTime, build * 1e3))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+"""
+End-to-end benchmark of the poll -> match -> notify pipeline of QBot.
+A local stub serves the recorded channel catalog and tracks/plays responses in benchmarks/fixtures,
+and receives the webhook posts, so the benchmark runs offline.
+For every scenario (number of targets x number of channels) a new song is published on every channel,
+after which one polling cycle is run, just like listenToQ would. Reported are the latency from publishing the song
+to the last webhook post being received, the time spent per stage and the throughput.
+Sleeping in between polls is not part of the measurement.
+Run from the repository root with `python -m benchmarks.bench_pipeline`, results are printed as JSON.
+"""
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler  # Stub API and webhook receiver
+from QBot import QBot       # Bot under test
+from qmusic import Qmusic   # Q-music API wrapper
+
+import argparse             # Command line arguments
+import contextlib           # Silencing the bot
+import io                   # Silencing the bot
+import json                 # Fixtures and results
+import os                   # Paths
+import random               # Generating targets
+import socket               # Disabling Nagle's algorithm
+import statistics           # Summarising timings
+import string               # Generating targets
+import sys                  # Output
+import tempfile             # Scratch files
+import threading            # Running the stub
+import time                 # Timing
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+class StubServer(ThreadingHTTPServer):
+    """
+    Serves recorded tracks/plays responses per channel and records received webhook posts.
+    """
+    daemon_threads = True
+
+    def __init__(self, plays):
+        """
+        Args:
+            plays (list): Encoded tracks/plays responses, played in order on every channel.
+        """
+        super().__init__(('127.0.0.1', 0), StubHandler)
+        self.plays = plays
+        self.position = 0  # Index of the current play (the same on every channel)
+        self.received = []  # (time.perf_counter(), path) of every webhook post
+        self.lock = threading.Lock()
+
+    def advance(self):
+        """
+        Publishes the next song on every channel.
+
+        Returns:
+            float: Moment the song was published (time.perf_counter()).
+        """
+        self.position += 1
+        return time.perf_counter()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep connections alive
+
+    def setup(self):
+        super().setup()
+        # Headers and body are written separately, don't let them wait for each other
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def do_GET(self):
+        body = self.server.plays[self.server.position % len(self.server.plays)]
+        self.reply(200, body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        with self.server.lock:
+            self.server.received.append((time.perf_counter(), self.path))
+        self.reply(204)
+
+    def reply(self, status, body=b''):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def timed(function, durations):
+    """
+    Wraps a function so that the duration of every call is recorded.
+
+    Args:
+        function (callable): Function to wrap.
+        durations (list): List to append durations (seconds) to.
+
+    Returns:
+        callable: Wrapped function.
+    """
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            durations.append(time.perf_counter() - start)
+    return wrapper
+
+
+def summary(durations):
+    """
+    Summarises a list of durations.
+
+    Args:
+        durations (list): Durations in seconds.
+
+    Returns:
+        dict: Count, mean, median, 95th percentile and maximum in milliseconds (None if there are no durations).
+    """
+    if not durations:
+        return None
+    ordered = sorted(durations)
+    return {'count': len(ordered), 'mean_ms': statistics.fmean(ordered) * 1e3,
+            'p50_ms': ordered[len(ordered) // 2] * 1e3,
+            'p95_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1e3, 'max_ms': ordered[-1] * 1e3}
+
+
+def makeBot(server, scratch, targetCount, channelCount, rng):
+    """
+    Sets up a bot that listens to the stub.
+
+    Args:
+        server (StubServer): Running stub.
+        scratch (str): Directory for the catalog cache and targets.
+        targetCount (int): Number of targets.
+        channelCount (int): Number of channels.
+        rng (random.Random): Random number generator.
+
+    Returns:
+        QBot: Bot with targets read.
+    """
+    host = '127.0.0.1:{}'.format(server.server_port)
+
+    # Point (copies of) the recorded channels at the stub, and offer them as a cached catalog
+    with open(os.path.join(FIXTURES, 'channels.json')) as fixture:
+        recorded = json.load(fixture)['data']
+    channels = []
+    for i in range(channelCount):
+        channel = json.loads(json.dumps(recorded[i % len(recorded)]))
+        channel['data']['id'] = '{}_{}'.format(channel['data']['id'], i)
+        channel['data']['api_url'] = '{}/{}'.format(host, channel['data']['id'])
+        channels.append(channel)
+    cachePath = os.path.join(scratch, 'channels.json')
+    for path in (cachePath, os.path.splitext(cachePath)[0] + '.selective.json'):
+        with open(path, 'w') as cache:
+            json.dump(channels, cache)
+    qapi = Qmusic(cache_path=cachePath, compact=True, selective=True)
+
+    # Targets: some are triggered by the recorded artists (each posting to its own webhook), the rest never fire
+    artists = sorted({json.loads(play)['played_tracks'][0]['artist']['original_name'].lower()
+                      for play in server.plays})
+    targetsPath = os.path.join(scratch, 'targets.csv')
+    with open(targetsPath, 'w') as targets:
+        targets.write('Trigger;Target (url);Message;Channel (slug)\n')
+        for i in range(targetCount):
+            if i < 10 * len(artists):
+                trigger = artists[i % len(artists)]
+            else:
+                trigger = ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(6, 12)))
+            targets.write('{};http://{}/hook/{};Target {};\n'.format(trigger, host, i % 100, i))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        bot = QBot([channel['data']['id'] for channel in channels], qapi=qapi)
+        bot.readTargets(targetsPath)
+    # The stub does not rate limit, so neither should the bot
+    bot.deliverer.rate = bot.deliverer.burst = 1e9
+    return bot
+
+
+def runScenario(server, targetCount, channelCount, songs, rng):
+    """
+    Measures the pipeline for a number of targets and channels.
+
+    Returns:
+        dict: Results of the scenario.
+    """
+    with tempfile.TemporaryDirectory() as scratch:
+        start = time.perf_counter()
+        bot = makeBot(server, scratch, targetCount, channelCount, rng)
+        setup = time.perf_counter() - start
+
+        # Record the time spent in every stage
+        stages = {'fetch': [], 'match': [], 'deliver': [], 'handle': []}
+        for channel in bot.channels.values():
+            channel.current_song = timed(channel.current_song, stages['fetch'])
+        bot.matcher.match = timed(bot.matcher.match, stages['match'])
+        bot.deliverer.deliver = timed(bot.deliverer.deliver, stages['deliver'])
+        bot.handleUpdate = timed(bot.handleUpdate, stages['handle'])
+
+        slugs = list(bot.channels)
+        latencies, cycles, posts = [], [], 0
+        with contextlib.redirect_stdout(io.StringIO()):
+            # The first cycle detects the song that was already playing, it warms up connections
+            list(bot.pollers.map(bot.pollChannel, slugs))
+            for stage in stages.values():
+                del stage[:]
+
+            for _ in range(songs):
+                received = len(server.received)
+                published = server.advance()
+                list(bot.pollers.map(bot.pollChannel, slugs))
+                done = time.perf_counter()
+                cycles.append(done - published)
+                arrivals = [arrival for arrival, _ in server.received[received:]]
+                posts += len(arrivals)
+                if arrivals:
+                    latencies.append(max(arrivals) - published)
+
+        bot.deliverer.close()
+        bot.pollers.shutdown()
+        total = sum(cycles)
+        return {'targets': targetCount, 'channels': channelCount, 'songs': songs, 'setup_s': setup,
+                'end_to_end': summary(latencies), 'cycle': summary(cycles),
+                'stages': {name: summary(durations) for name, durations in stages.items()},
+                'webhook_posts': posts, 'tracks_per_s': songs * channelCount / total if total else None,
+                'posts_per_s': posts / total if total else None}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the poll -> match -> notify pipeline offline.')
+    parser.add_argument('--targets', type=int, nargs='+', default=[10, 1000, 10000], help='Target counts')
+    parser.add_argument('--channels', type=int, nargs='+', default=[1, 4, 16], help='Channel counts')
+    parser.add_argument('--songs', type=int, default=20, help='Songs per scenario')
+    parser.add_argument('--output', help='File to write the JSON results to (default: standard output)')
+    args = parser.parse_args()
+
+    with open(os.path.join(FIXTURES, 'plays.jsonl'), 'rb') as fixture:
+        plays = [line.strip() for line in fixture if line.strip()]
+    server = StubServer(plays)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    rng = random.Random(42)
+    results = []
+    for targetCount in args.targets:
+        for channelCount in args.channels:
+            results.append(runScenario(server, targetCount, channelCount, args.songs, rng))
+            print('{} targets, {} channels: {:.1f} ms end-to-end (p50)'.format(
+                targetCount, channelCount, (results[-1]['end_to_end'] or {}).get('p50_ms', float('nan'))),
+                file=sys.stderr)
+    server.shutdown()
+
+    report = json.dumps({'python': sys.version.split()[0], 'results': results}, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(report + '\n')
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+"""
+Compares the memory use and CPU time of the compact song model to the original Song and Artist classes.
+Run from the repository root with `python -m benchmarks.bench_song`.
+"""
+
+from qmusic import Song, CompactSong  # Song models
+
+import copy                 # Independent song dictionaries
+import timeit               # Timing
+import tracemalloc          # Measuring memory
+
+BASE = 'https://api.qmusic.nl/2.4'
+PLAY = {
+    'selector_code': 'QM12345', 'title': 'Bohemian Rhapsody', 'slug': 'bohemian-rhapsody',
+    'played_at': '2021-03-01T12:34:56+01:00', 'thumbnail': '/tracks/bohemian-rhapsody.jpg', 'release_year': '1975',
+    'spotify_url': 'https://open.spotify.com/track/x', 'youtube_ids': {'default': 'fJ9rUzIMcZQ'},
+    'hooks': {'m4a': 'https://example.invalid/hook.m4a'},
+    'artist': {'id': 42, 'name': 'QUEEN', 'original_name': 'QUEEN', 'slug': 'queen', 'bio': 'Band' * 50,
+               'photo': '/artists/queen.jpg', 'country': {'code': 'GB', 'name': 'United Kingdom'}},
+    'sub_artists': [],
+}
+
+
+def useSong(song):
+    """
+    Reads the fields QBot uses from a song, as handleUpdate does.
+    """
+    return (song.selector_code(), song.title(), song.artist().name_all_artist(),
+            song.played_at().time().isoformat(), song.thumbnail_url())
+
+
+def memory(cls, count):
+    """
+    Measures the memory retained by a number of songs, including the decoded JSON they keep alive.
+
+    Returns:
+        float: Bytes per song.
+    """
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    plays = [copy.deepcopy(PLAY) for _ in range(count)]
+    songs = [cls(play, BASE) for play in plays]
+    del plays  # Only what the songs hold on to remains
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    assert len(songs) == count
+    return retained / count
+
+
+def main():
+    count = 10000
+    print('{:>12} {:>16} {:>20} {:>16}'.format('model', 'bytes per song', 'build + 1 use (us)', '5 uses (us)'))
+    for cls in (Song, CompactSong):
+        once = min(timeit.repeat(lambda: useSong(cls(PLAY, BASE)), number=count, repeat=3)) / count
+        song = cls(PLAY, BASE)
+        often = min(timeit.repeat(lambda: [useSong(song) for _ in range(5)], number=count, repeat=3)) / count
+        print('{:>12} {:>16.0f} {:>20.2f} {:>16.2f}'.format(
+            cls.__name__, memory(cls, count), once * 1e6, often * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+from collections import OrderedDict  # Least recently used order
+
+import json                 # Persisting entries
+import os                   # Cache location
+import tempfile             # Writing atomically
+import threading            # Guarding entries, saving in the background
+import time                 # Expiring entries
+
+
+class MetadataCache:
+    """
+    Bounded cache of derived metadata (e.g. of artists and songs), so it is determined once per artist or song.
+    The least recently used entry is evicted when the cache is full, entries expire after a while,
+    and the cache can be persisted to disk so it survives restarts.
+    Values must be JSON serialisable when the cache is persisted.
+    """
+
+    def __init__(self, maxSize=10000, ttl=7 * 86400, path=None, clock=time.time):
+        """
+        Args:
+            maxSize (int): Maximum number of entries.
+            ttl (float): Seconds an entry stays valid.
+            path (str): File to persist the cache to, None keeps it in memory only.
+            clock (callable): Returns the current time as a UNIX timestamp.
+        """
+        self.maxSize = maxSize
+        self.ttl = ttl
+        self.path = path
+        self.clock = clock
+        self.entries = OrderedDict()  # key -> (expiry, value), least recently used first
+        self.lock = threading.Lock()
+        self.dirty = False  # Whether there are changes that were not saved yet
+        self.hits = 0
+        self.misses = 0
+        if path:
+            self.load()
+
+    def get(self, key, compute):
+        """
+        Gets the value of a key, computing (and caching) it if it is not cached or expired.
+
+        Args:
+            key (str): Key of the value, e.g. 'artist:<id>'.
+            compute (callable): Determines the value if it is not cached.
+
+        Returns:
+            The (cached) value.
+        """
+        now = self.clock()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        # Compute outside of the lock, another thread computing the same value at the same time is harmless
+        value = compute()
+        self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        """
+        Caches a value, evicting the least recently used entries if the cache is full.
+
+        Args:
+            key (str): Key of the value.
+            value: Value to cache.
+        """
+        with self.lock:
+            self.entries[key] = (self.clock() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxSize:
+                self.entries.popitem(last=False)
+            self.dirty = True
+
+    def __len__(self):
+        """
+        Returns:
+            int: Number of cached entries (including expired ones that were not evicted yet).
+        """
+        return len(self.entries)
+
+    def load(self):
+        """
+        Restores the entries that have not expired yet from disk. A missing or unreadable file is ignored.
+        """
+        try:
+            with open(self.path) as stored:
+                entries = json.load(stored)
+        except (OSError, ValueError):
+            return
+        now = self.clock()
+        with self.lock:
+            for key, expiry, value in entries[-self.maxSize:]:
+                if expiry > now:
+                    self.entries[key] = (expiry, value)
+
+    def save(self):
+        """
+        Writes the entries to disk (if anything changed), least recently used first.
+        The file is replaced atomically, so a crash never leaves a truncated cache behind.
+        """
+        if not self.path or not self.dirty:
+            return
+        with self.lock:
+            entries = [[key, expiry, value] for key, (expiry, value) in self.entries.items()]
+            self.dirty = False
+        directory = os.path.dirname(self.path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, tmpPath = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as tmp:
+            json.dump(entries, tmp)
+        os.replace(tmpPath, self.path)
+
+    def saveEvery(self, interval):
+        """
+        Saves the cache periodically, in the background.
+
+        Args:
+            interval (float): Seconds in between saves.
+        """
+        def saveLoop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.save()
+                except OSError as error:
+                    print('Metadata kon niet worden opgeslagen: {}'.format(error))
+
+        threading.Thread(target=saveLoop, name='metadata', daemon=True).start()
@@ -0,0 +1,337 @@
+from concurrent.futures import ThreadPoolExecutor  # Bounded worker pool
+from requests.adapters import HTTPAdapter  # Connection pool per host
+from urllib.parse import urlsplit  # Determine webhook host
+from tracing import Tracer  # Spans of posts
+
+import requests             # Handle HTML stuff
+import threading            # Guard session and limiter creation
+import time                 # Measure latency
+
+
+class Delivery:
+    """
+    Outcome of a single webhook post.
+    """
+
+    __slots__ = ('hookURL', 'status', 'latency', 'error', 'deferred')
+
+    def __init__(self, hookURL, status=None, latency=0.0, error=None, deferred=False):
+        """
+        Args:
+            hookURL (str): URL that was posted to.
+            status (int): HTTP status code of the response (None if no response was received).
+            latency (float): Seconds between sending the request and receiving the response (or failure).
+            error (str): Description of the error if the post failed.
+            deferred (bool): Whether the post was not made yet but left to the retry threads (its final outcome is
+                             reported separately).
+        """
+        self.hookURL = hookURL
+        self.status = status
+        self.latency = latency
+        self.error = error
+        self.deferred = deferred
+
+    def ok(self):
+        """
+        Returns:
+            bool: Whether the webhook accepted the post.
+        """
+        return self.error is None and self.status is not None and 200 <= self.status < 300
+
+    def __repr__(self):
+        return 'Delivery({!r}, status={}, latency={:.3f}, error={!r}, deferred={})'.format(
+            self.hookURL, self.status, self.latency, self.error, self.deferred)
+
+
+class TokenBucket:
+    """
+    Rate limiter for a single webhook.
+    Allows bursts of up to `burst` posts, refilled at `rate` posts per second,
+    and blocks all posts while the webhook asked to retry later.
+    """
+
+    def __init__(self, rate, burst):
+        """
+        Args:
+            rate (float): Posts per second in the long run.
+            burst (int): Maximum number of posts at once.
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blockedUntil = 0.0  # Set after a 429 response
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Waits until a post to the webhook is allowed and takes a token for it.
+        """
+        while True:
+            with self.lock:
+                wait = self.take()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    def tryAcquire(self):
+        """
+        Takes a token for a post to the webhook, if one is allowed right now.
+
+        Returns:
+            bool: Whether a token was taken (if not, the post has to wait).
+        """
+        with self.lock:
+            return not self.take()
+
+    def take(self):
+        """
+        Takes a token if one is available, the lock must be held.
+
+        Returns:
+            float: Number of seconds to wait before trying again, 0 if a token was taken.
+        """
+        now = time.monotonic()
+        # Refill the bucket for the time that passed
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if now < self.blockedUntil:
+            return self.blockedUntil - now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def block(self, seconds):
+        """
+        Blocks all posts for a while, e.g. as asked by a Retry-After header.
+
+        Args:
+            seconds (float): Number of seconds to block for.
+        """
+        with self.lock:
+            self.updated = time.monotonic()
+            self.blockedUntil = max(self.blockedUntil, self.updated + seconds)
+            self.tokens = 0.0
+
+
+class Deliverer:
+    """
+    Concurrent webhook delivery engine.
+    Posts are dispatched in parallel over a bounded thread pool,
+    using one pooled keep-alive session per webhook host.
+    Posts that have to wait for the rate limit of their webhook can be left to separate threads,
+    so a rate-limited webhook never holds up the caller (see deliver).
+    """
+
+    def __init__(self, maxWorkers=16, timeout=10, rate=2.5, burst=5, rateLimitRetries=2, maxRetryAfter=60,
+                 tracer=None):
+        """
+        Args:
+            maxWorkers (int): Maximum number of posts in flight at once.
+            timeout (float): Seconds to wait for a webhook before giving up.
+            rate (float): Posts per second allowed per webhook in the long run (Discord allows 5 per 2 seconds).
+            burst (int): Posts allowed per webhook at once.
+            rateLimitRetries (int): Number of times a post is retried after a 429 response.
+            maxRetryAfter (float): Maximum number of seconds to wait for a rate limit before giving up on a post.
+            tracer (tracing.Tracer): Tracer to record a span per post with, defaults to none.
+        """
+        self.maxWorkers = maxWorkers
+        self.timeout = timeout
+        self.rate = rate
+        self.burst = burst
+        self.rateLimitRetries = rateLimitRetries
+        self.maxRetryAfter = maxRetryAfter
+        self.limiters = {}  # Token bucket per webhook
+        self.pool = ThreadPoolExecutor(max_workers=maxWorkers, thread_name_prefix='deliver')
+        # Posts waiting for a rate limit, kept apart so they never take up the threads of new posts
+        self.retries = ThreadPoolExecutor(max_workers=maxWorkers, thread_name_prefix='retry')
+        self.sessions = {}  # Keep-alive session per webhook host
+        self.lock = threading.Lock()  # Guards creation of sessions and limiters
+        self.tracer = tracer or Tracer()
+
+    def session(self, hookURL):
+        """
+        Gets (or creates) the pooled session for the host of a webhook.
+
+        Args:
+            hookURL (str): Webhook URL.
+
+        Returns:
+            requests.Session: Session that keeps connections to the host alive.
+        """
+        host = urlsplit(hookURL).netloc
+        sessy = self.sessions.get(host)
+        if sessy is None:
+            with self.lock:
+                sessy = self.sessions.get(host)
+                if sessy is None:
+                    # Allow as many pooled connections to one host as there are workers
+                    sessy = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.maxWorkers)
+                    sessy.mount('https://', adapter)
+                    sessy.mount('http://', adapter)
+                    self.sessions[host] = sessy
+        return sessy
+
+    def limiter(self, hookURL):
+        """
+        Gets (or creates) the rate limiter of a webhook.
+
+        Args:
+            hookURL (str): Webhook URL.
+
+        Returns:
+            TokenBucket: Rate limiter of the webhook.
+        """
+        bucket = self.limiters.get(hookURL)
+        if bucket is None:
+            with self.lock:
+                bucket = self.limiters.setdefault(hookURL, TokenBucket(self.rate, self.burst))
+        return bucket
+
+    def retryAfter(self, response):
+        """
+        Determines how long a webhook wants us to wait after a 429 response.
+
+        Args:
+            response (requests.Response): Rate limited response.
+
+        Returns:
+            float: Number of seconds to wait.
+        """
+        # Discord sends the delay both as header and in the body
+        for value in (response.headers.get('Retry-After'), response.headers.get('X-RateLimit-Reset-After')):
+            try:
+                return float(value)
+            except (TypeError, ValueError):
+                pass
+        try:
+            return float(response.json()['retry_after'])
+        except (ValueError, KeyError, TypeError):
+            return 1.0
+
+    def post(self, hookURL, postContent, parent=None, onLater=None):
+        """
+        Posts to a single webhook and records the outcome.
+        Posts wait for the rate limiter of the webhook, and are retried after a 429 response once the webhook allows it.
+
+        Args:
+            hookURL (str): URL to post to.
+            postContent (dict): Form data to post.
+            parent (tracing.Span): Span the post is part of, defaults to the open span of the calling thread.
+            onLater (callable): If given, the caller does not wait for the rate limiter (see send).
+
+        Returns:
+            Delivery: Outcome of the post.
+        """
+        with self.tracer.span('post', parent, host=urlsplit(hookURL).netloc) as span:
+            delivery = self.send(hookURL, postContent, onLater)
+            if delivery.deferred:
+                span.set(status='deferred')
+            else:
+                span.set(status=delivery.status if delivery.error is None else delivery.error)
+        return delivery
+
+    def send(self, hookURL, postContent, onLater=None):
+        """
+        Posts to a single webhook, waiting for its rate limiter and retrying after a 429 response.
+
+        Args:
+            hookURL (str): URL to post to.
+            postContent (dict): Form data to post.
+            onLater (callable): If given, the caller is not held up by the rate limiter: a post that has to wait
+                                (also to be retried after a 429 response) is left to the retry threads,
+                                and onLater is called with a list of its final delivery.Delivery once it is done.
+
+        Returns:
+            Delivery: Outcome of the post (status 429 with an error if it is left to the retry threads).
+        """
+        bucket = self.limiter(hookURL)
+        start = time.perf_counter()
+        for attempt in range(self.rateLimitRetries + 1):
+            if onLater is None:
+                bucket.acquire()
+            elif not bucket.tryAcquire():
+                return self.postLater(hookURL, postContent, onLater, start)
+            try:
+                response = self.session(hookURL).post(hookURL, postContent, timeout=self.timeout)
+            except requests.RequestException as error:
+                return Delivery(hookURL, latency=time.perf_counter() - start, error=str(error))
+            if response.status_code != 429:
+                break
+            # Rate limited, hold back every post to this webhook for as long as asked
+            wait = self.retryAfter(response)
+            bucket.block(wait)
+            if wait > self.maxRetryAfter:
+                break
+        return Delivery(hookURL, response.status_code, time.perf_counter() - start)
+
+    def postLater(self, hookURL, postContent, onLater, start):
+        """
+        Leaves a post that has to wait for the rate limiter of its webhook to the retry threads.
+
+        Args:
+            hookURL (str): URL to post to.
+            postContent (dict): Form data to post.
+            onLater (callable): Called with a list of the final delivery.Delivery of the post once it is done.
+            start (float): time.perf_counter() when the post was started.
+
+        Returns:
+            Delivery: Deferred outcome, without a status (the final outcome is handed to onLater).
+        """
+        self.retries.submit(lambda: onLater([self.post(hookURL, postContent)]))
+        return Delivery(hookURL, latency=time.perf_counter() - start, deferred=True)
+
+    def deliver(self, jobs, onLater=None):
+        """
+        Posts all given notifications in parallel and waits until every one of them is done.
+        The total time is close to that of the slowest single post.
+
+        Args:
+            jobs (list): Tuples of (hookURL, postContent).
+            onLater (callable): If given, posts to rate-limited webhooks are not waited for: they are left to the retry
+                                threads, which call onLater with a list of the final outcome of each of them.
+
+        Returns:
+            list: Delivery outcome per job, in the order of the jobs.
+        """
+        if len(jobs) == 1:
+            # Nothing to parallelise, skip the hand-off to the pool
+            return [self.post(*jobs[0], onLater=onLater)]
+        parent = self.tracer.current()  # Posts in the pool are part of the span of the caller
+        futures = [self.pool.submit(self.post, hookURL, postContent, parent, onLater) for hookURL, postContent in jobs]
+        return [future.result() for future in futures]
+
+    def warm(self, hookURLs):
+        """
+        Opens a connection to the host of every webhook in the background, ahead of posting to them,
+        so the posts do not have to wait for the TCP and TLS handshakes.
+
+        Args:
+            hookURLs (iterable): URLs that are about to be posted to.
+        """
+        hosts = {urlsplit(hookURL).netloc: hookURL for hookURL in hookURLs}  # One request per host is enough
+        for hookURL in hosts.values():
+            self.pool.submit(self.touch, hookURL)
+
+    def touch(self, hookURL):
+        """
+        Requests the headers of a webhook, which leaves an open connection to its host in the pool.
+
+        Args:
+            hookURL (str): Webhook URL.
+        """
+        try:
+            self.session(hookURL).head(hookURL, timeout=self.timeout)
+        except requests.RequestException as _:
+            pass  # The post itself will report the problem
+
+    def close(self):
+        """
+        Stops the worker pool and closes all sessions.
+        """
+        self.pool.shutdown(wait=True)
+        self.retries.shutdown(wait=True)
+        for sessy in self.sessions.values():
+            sessy.close()
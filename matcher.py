@@ -0,0 +1,294 @@
+from bisect import bisect_right  # Looking up intervals
+from collections import deque  # Breadth-first automaton construction
+
+# Prefixes of structured triggers, matched exactly against a field of the song instead of searched for in its text
+STRUCTURED_KINDS = ('artist', 'featuring', 'code', 'year')
+
+
+class Automaton:
+    """
+    Aho-Corasick automaton over a set of case-folded patterns,
+    finding every pattern contained in a text in a single scan.
+    """
+
+    def __init__(self, patterns):
+        """
+        Compile the given patterns.
+
+        Args:
+            patterns (iterable): Distinct, case-folded, non-empty patterns.
+        """
+        self.patterns = list(patterns)  # Pattern per pattern index
+        self.index = {pattern: index for index, pattern in enumerate(self.patterns)}
+        self.goto = [{}]  # Transitions per state, state 0 is the root
+        self.fail = [0]  # Failure link per state
+        self.output = [[]]  # Pattern indices that end in this state
+        self.outLink = [0]  # Nearest state along the failure chain with output (0 if none)
+
+        # Add every pattern to the trie, sharing states between identical prefixes
+        for index, pattern in enumerate(self.patterns):
+            self.output[self.addPattern(pattern)].append(index)
+
+        # Then link the trie into an automaton
+        self.buildLinks()
+
+    def addPattern(self, pattern):
+        """
+        Adds a single pattern to the trie.
+
+        Args:
+            pattern (str): Case-folded pattern to add.
+
+        Returns:
+            int: State in which the pattern ends.
+        """
+        state = 0
+        for char in pattern:
+            nextState = self.goto[state].get(char)
+            if nextState is None:
+                # Create a new state for this character
+                nextState = len(self.goto)
+                self.goto[state][char] = nextState
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+                self.outLink.append(0)
+            state = nextState
+        return state
+
+    def buildLinks(self):
+        """
+        Computes failure and output links breadth-first, so every state links to the longest proper suffix
+        of its path that is also a path in the trie.
+        """
+        queue = deque(self.goto[0].values())  # Children of the root fail back to the root
+        while queue:
+            state = queue.popleft()
+            for char, child in self.goto[state].items():
+                queue.append(child)
+
+                # Follow failure links of the parent until a state with a transition on char is found
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+
+                # Output link skips states without output along the failure chain
+                failState = self.fail[child]
+                self.outLink[child] = failState if self.output[failState] else self.outLink[failState]
+
+    def search(self, text):
+        """
+        Scans a text once and determines which patterns it contains.
+
+        Args:
+            text (str): Case-folded text to search.
+
+        Returns:
+            set: Indices of the contained patterns.
+        """
+        goto, fail, output, outLink = self.goto, self.fail, self.output, self.outLink
+        found = set()
+        state = 0
+        for char in text:
+            # Fall back until a transition exists (or the root is reached)
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+
+            # Collect the output of this state and every suffix state with output
+            outState = state if output[state] else outLink[state]
+            while outState:
+                found.update(output[outState])
+                outState = outLink[outState]
+        return found
+
+
+class IntervalIndex:
+    """
+    Index of closed intervals, answering which intervals contain a value with a single binary search.
+    The boundaries of all intervals split the number line into segments, and every segment lists the intervals
+    covering it.
+    """
+
+    def __init__(self, intervals):
+        """
+        Args:
+            intervals (list): Tuples of (low, high, item), where low or high is None for an open end.
+        """
+        self.bounds = sorted({low for low, _, _ in intervals if low is not None} |
+                             {high + 1 for _, high, _ in intervals if high is not None})
+        # Segment i holds the values from bounds[i - 1] up to (but not including) bounds[i]
+        self.segments = [[] for _ in range(len(self.bounds) + 1)]
+        for low, high, item in intervals:
+            first = 0 if low is None else bisect_right(self.bounds, low)
+            last = len(self.bounds) if high is None else bisect_right(self.bounds, high)
+            for segment in range(first, last + 1):
+                self.segments[segment].append(item)
+
+    def lookup(self, value):
+        """
+        Args:
+            value (int): Value to look up.
+
+        Returns:
+            list: Items of the intervals containing the value.
+        """
+        return self.segments[bisect_right(self.bounds, value)]
+
+
+class TriggerMatcher:
+    """
+    Compiled matcher for the triggers of all targets.
+    All distinct free-text triggers are case-folded and compiled into a single Aho-Corasick automaton,
+    so a song's text is scanned once regardless of the number of targets.
+    When the targets change, triggers that were added are compiled into a small second automaton,
+    so that updates cost time in proportion to the change rather than to the number of targets.
+    Structured triggers (see parseTrigger) are kept in hash indexes (and an interval index for years),
+    so they are resolved with a lookup per field of the song.
+    """
+
+    def __init__(self, targets, automata=()):
+        """
+        Compile the triggers of the given targets.
+
+        Args:
+            targets (list): Target dictionaries, each containing at least a 'trigger'.
+            automata (tuple): Previously compiled automata to reuse as far as possible.
+        """
+        self.targets = list(targets)  # Targets in the order they were read
+        self.always = []  # Target indices with an empty trigger (matches everything)
+        self.keys = {kind: {} for kind in STRUCTURED_KINDS if kind != 'year'}  # Target indices per kind and value
+        years = []  # Release year ranges with their target index
+
+        # Group targets by trigger, many subscribers share the same one
+        byTrigger = {}
+        for index, target in enumerate(self.targets):
+            kind, value = parseTrigger(target['trigger'])
+            if kind == 'text':
+                trigger = value.casefold()
+                if not trigger:
+                    # An empty trigger is contained in every text
+                    self.always.append(index)
+                else:
+                    byTrigger.setdefault(trigger, []).append(index)
+            elif kind == 'year':
+                years.append(value + (index,))
+            else:
+                self.keys[kind].setdefault(value, []).append(index)
+        self.years = IntervalIndex(years)
+
+        self.automata = compileTriggers(byTrigger, automata)
+        # Target indices per pattern of every automaton (patterns without targets anymore are simply ignored)
+        self.hits = [[byTrigger.get(pattern, ()) for pattern in automaton.patterns] for automaton in self.automata]
+
+    def update(self, targets):
+        """
+        Compiles the triggers of a changed list of targets, only compiling the triggers that were added.
+
+        Args:
+            targets (list): Target dictionaries, each containing at least a 'trigger'.
+
+        Returns:
+            TriggerMatcher: Matcher for the given targets.
+        """
+        return TriggerMatcher(targets, self.automata)
+
+    def match(self, text, artist=None, featuring=(), code=None, year=None):
+        """
+        Determines which targets are triggered by a song.
+        Free-text triggers are searched for in the text (case-insensitive, one scan per automaton),
+        structured triggers are looked up by the given fields.
+
+        Args:
+            text (str): Text to search, e.g. the title and artist of a song.
+            artist (int): Id of the (main) artist of the song.
+            featuring (iterable): Ids of the featuring artists of the song.
+            code (str): Selector code of the song.
+            year (int): Release year of the song.
+
+        Returns:
+            list: Triggered target dictionaries, in the order they were read.
+        """
+        text = text.casefold()
+        hits = set(self.always)
+        for automaton, patternHits in zip(self.automata, self.hits):
+            for pattern in automaton.search(text):
+                hits.update(patternHits[pattern])
+
+        # Structured triggers, a lookup each
+        keys = self.keys
+        if artist is not None:
+            hits.update(keys['artist'].get(str(artist), ()))
+        for featured in featuring:
+            hits.update(keys['featuring'].get(str(featured), ()))
+        if code is not None:
+            hits.update(keys['code'].get(code, ()))
+        if year is not None:
+            hits.update(self.years.lookup(year))
+        return [self.targets[index] for index in sorted(hits)]
+
+    def __len__(self):
+        """
+        Returns:
+            int: Number of compiled targets.
+        """
+        return len(self.targets)
+
+
+def parseTrigger(trigger):
+    """
+    Determines what kind of trigger a target has. Structured triggers consist of a kind and a value:
+    'artist:<id>' and 'featuring:<id>' match the (main or featuring) artist with that id, 'code:<selector code>'
+    matches a single song, and 'year:<year>', 'year:<from>-<to>', 'year:<from>-' or 'year:-<to>' match songs
+    released in (a range of) years. Anything else is free text, searched for in the title and artist of a song.
+
+    Args:
+        trigger (str): Trigger of a target.
+
+    Returns:
+        tuple: Kind of the trigger ('text' or one of STRUCTURED_KINDS) and its value
+               (the text, id or code, or a (from, to) tuple of years with None for an open end).
+
+    Raises:
+        ValueError: If the years of a year trigger are not numbers.
+    """
+    kind, separator, value = trigger.partition(':')
+    kind = kind.strip().lower()
+    if not separator or kind not in STRUCTURED_KINDS:
+        return 'text', trigger
+    value = value.strip()
+    if kind != 'year':
+        return kind, value
+    try:
+        low, dash, high = value.partition('-')
+        low = int(low) if low.strip() else None
+        high = (int(high) if high.strip() else None) if dash else low
+    except ValueError:
+        raise ValueError("Invalid year trigger '{}', expected e.g. 'year:1985' or 'year:1980-1989'".format(trigger))
+    return kind, (low, high)
+
+
+def compileTriggers(triggers, automata=()):
+    """
+    Compiles triggers into a main automaton and, for recently added triggers, a small additional one.
+    Everything is compiled into a single automaton again once the additional one grows too big,
+    or when most compiled patterns are not used anymore.
+
+    Args:
+        triggers (collection): Distinct, case-folded, non-empty triggers.
+        automata (tuple): Previously compiled automata (main one first).
+
+    Returns:
+        tuple: Automata that together contain every trigger.
+    """
+    compiled = sum(len(automaton.patterns) for automaton in automata)
+    if not automata or compiled > 2 * len(triggers) + 64:
+        return (Automaton(triggers),)
+    added = sorted(set(triggers).difference(*(automaton.index for automaton in automata)))
+    if not added:
+        return automata
+    recent = [pattern for automaton in automata[1:] for pattern in automaton.patterns] + added
+    if len(recent) > max(256, len(automata[0].patterns) // 8):
+        return (Automaton(triggers),)
+    return automata[0], Automaton(recent)
@@ -0,0 +1,274 @@
+from bisect import bisect_left  # Finding histogram buckets
+
+import threading            # Guarding updates, serving and dumping in the background
+import time                 # Periodic dumps
+
+# Default histogram buckets (seconds), from sub-millisecond matching to minutes of detection lag
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+# Histogram buckets for small counts
+COUNT_BUCKETS = (1, 2, 3, 5, 8, 13, 20, 30, 50)
+
+
+class Histogram:
+    """
+    Cumulative histogram, as understood by Prometheus.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        """
+        Args:
+            buckets (tuple): Upper bounds of the buckets, in increasing order.
+        """
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Last bucket is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        """
+        Adds a value to the histogram.
+
+        Args:
+            value (float): Observed value.
+        """
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        """
+        Returns:
+            tuple: Cumulative count per bucket (including +Inf), sum and count.
+        """
+        with self.lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        cumulative, running = [], 0
+        for bucketCount in counts:
+            running += bucketCount
+            cumulative.append(running)
+        return cumulative, total, count
+
+    def quantile(self, fraction):
+        """
+        Estimates a quantile by the upper bound of the bucket it falls in.
+
+        Args:
+            fraction (float): Quantile (between 0 and 1).
+
+        Returns:
+            float: Upper bound of the bucket (None without observations, inf beyond the last bucket).
+        """
+        cumulative, _, count = self.snapshot()
+        if not count:
+            return None
+        index = bisect_left(cumulative, fraction * count)
+        return self.buckets[index] if index < len(self.buckets) else float('inf')
+
+
+class Metrics:
+    """
+    Registry of counters, gauges and histograms, labelled by name and label values.
+    Rendered in the Prometheus text format, which can be served over HTTP or dumped periodically.
+    """
+
+    def __init__(self):
+        self.histograms = {}  # (name, labels) -> Histogram
+        self.counters = {}  # (name, labels) -> value
+        self.gauges = {}  # (name, labels) -> function returning the current value
+        self.help = {}  # name -> description
+        self.lock = threading.Lock()
+
+    def describe(self, name, description):
+        """
+        Sets the description of a metric.
+
+        Args:
+            name (str): Name of the metric.
+            description (str): Description of the metric.
+        """
+        self.help[name] = description
+
+    def histogram(self, name, buckets=LATENCY_BUCKETS, **labels):
+        """
+        Gets (or creates) a histogram.
+
+        Args:
+            name (str): Name of the metric.
+            buckets (tuple): Upper bounds of the buckets, used when the histogram is created.
+            **labels: Label values.
+
+        Returns:
+            Histogram: The histogram.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(key, Histogram(buckets))
+        return histogram
+
+    def observe(self, name, value, **labels):
+        """
+        Adds a value to a histogram.
+
+        Args:
+            name (str): Name of the metric.
+            value (float): Observed value.
+            **labels: Label values.
+        """
+        self.histogram(name, **labels).observe(value)
+
+    def increment(self, name, amount=1, **labels):
+        """
+        Increments a counter.
+
+        Args:
+            name (str): Name of the metric.
+            amount (float): Amount to increment with.
+            **labels: Label values.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def gauge(self, name, function, **labels):
+        """
+        Registers a gauge, whose value is determined whenever the metrics are rendered.
+
+        Args:
+            name (str): Name of the metric.
+            function (callable): Returns the current value.
+            **labels: Label values.
+        """
+        with self.lock:
+            self.gauges[(name, tuple(sorted(labels.items())))] = function
+
+    def render(self):
+        """
+        Renders all metrics in the Prometheus text exposition format.
+
+        Returns:
+            str: The metrics.
+        """
+        lines = []
+        with self.lock:
+            counters = sorted(self.counters.items())
+            gauges = sorted(self.gauges.items(), key=lambda item: item[0])
+            histograms = sorted(self.histograms.items(), key=lambda item: item[0])
+        described = set()
+
+        def header(name, kind):
+            if name not in described:
+                described.add(name)
+                if name in self.help:
+                    lines.append('# HELP {} {}'.format(name, self.help[name]))
+                lines.append('# TYPE {} {}'.format(name, kind))
+
+        for (name, labels), value in counters:
+            header(name, 'counter')
+            lines.append('{}{} {}'.format(name, formatLabels(labels), value))
+        for (name, labels), function in gauges:
+            header(name, 'gauge')
+            lines.append('{}{} {}'.format(name, formatLabels(labels), function()))
+        for (name, labels), histogram in histograms:
+            header(name, 'histogram')
+            cumulative, total, count = histogram.snapshot()
+            for bound, running in zip(histogram.buckets + ('+Inf',), cumulative):
+                lines.append('{}_bucket{} {}'.format(name, formatLabels(labels + (('le', str(bound)),)), running))
+            lines.append('{}_sum{} {}'.format(name, formatLabels(labels), total))
+            lines.append('{}_count{} {}'.format(name, formatLabels(labels), count))
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        """
+        Summarises all metrics in a few human-readable lines.
+
+        Returns:
+            str: Counter and gauge values and, per histogram,
+                 the number of observations, mean and estimated 95th percentile.
+        """
+        lines = []
+        with self.lock:
+            counters = sorted(self.counters.items())
+            gauges = sorted(self.gauges.items(), key=lambda item: item[0])
+            histograms = sorted(self.histograms.items(), key=lambda item: item[0])
+        for (name, labels), value in counters:
+            lines.append('{}{}: {}'.format(name, formatLabels(labels), value))
+        for (name, labels), function in gauges:
+            lines.append('{}{}: {}'.format(name, formatLabels(labels), function()))
+        for (name, labels), histogram in histograms:
+            _, total, count = histogram.snapshot()
+            if count:
+                lines.append('{}{}: n={} mean={:.4g} p95<={:.4g}'.format(
+                    name, formatLabels(labels), count, total / count, histogram.quantile(0.95)))
+        return '\n'.join(lines)
+
+    def serve(self, port, host=''):
+        """
+        Serves the metrics at /metrics in the background.
+
+        Args:
+            port (int): Port to listen on.
+            host (str): Address to listen on (all interfaces by default).
+
+        Returns:
+            http.server.ThreadingHTTPServer: The running server.
+        """
+        # Only imported when metrics are served, to keep starting up cheap
+        from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+        return server
+
+    def dumpEvery(self, interval):
+        """
+        Prints a summary of the metrics periodically, in the background.
+
+        Args:
+            interval (float): Seconds in between dumps.
+        """
+        def dump():
+            while True:
+                time.sleep(interval)
+                print('Statistieken:\n' + self.summary())
+
+        threading.Thread(target=dump, name='metrics-dump', daemon=True).start()
+
+
+def formatLabels(labels):
+    """
+    Formats label values the way Prometheus expects them.
+
+    Args:
+        labels (tuple): Pairs of label name and value.
+
+    Returns:
+        str: E.g. '{channel="qmusic_nl",status="204"}', or '' without labels.
+    """
+    if not labels:
+        return ''
+    escaped = ('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+               for name, value in labels)
+    return '{' + ','.join(escaped) + '}'
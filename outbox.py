@@ -0,0 +1,211 @@
+import json                 # Storing payloads
+import sqlite3              # Durable storage
+import threading            # Background delivery
+import time                 # Scheduling retries
+
+
+class Outbox:
+    """
+    Crash-safe delivery outbox, stored in SQLite.
+    Matched notifications are recorded (together with the code of the track that triggered them) before they are sent,
+    and a background worker drains them, retrying failed posts with exponential backoff.
+    Every notification is recorded once per play of a track, so after a restart nothing is posted twice
+    and nothing that failed is lost.
+    Only a crash in between a successful post and marking it delivered can repeat that single post.
+    Delivered notifications are kept for a retention period (long enough for a play to never be recorded again),
+    after which they are pruned so the database does not keep growing.
+    """
+
+    def __init__(self, path, deliverer, report=None, baseDelay=5, maxDelay=900, maxAttempts=10, retention=7 * 86400):
+        """
+        Args:
+            path (str): Location of the SQLite database.
+            deliverer (delivery.Deliverer): Engine to post notifications with.
+            report (callable): Called with a list of delivery.Delivery outcomes after every attempt.
+            baseDelay (float): Seconds to wait before the first retry, doubled on every next one.
+            maxDelay (float): Maximum number of seconds in between retries.
+            maxAttempts (int): Number of attempts after which a notification is given up on.
+            retention (float): Seconds delivered notifications are kept for.
+        """
+        self.deliverer = deliverer
+        self.report = report
+        self.baseDelay = baseDelay
+        self.maxDelay = maxDelay
+        self.maxAttempts = maxAttempts
+        self.retention = retention
+        self.pruned = 0.0  # Time delivered notifications were last pruned
+        self.lock = threading.Lock()  # One connection, shared by the pollers and the worker
+        self.wakeUp = threading.Event()  # Set when new notifications are recorded
+        self.stopped = threading.Event()
+        self.worker = None
+
+        # Open (or create) the database
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS state (channel TEXT PRIMARY KEY, latest_code TEXT NOT NULL)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS outbox ('
+                        'id INTEGER PRIMARY KEY, '
+                        'play TEXT NOT NULL, '  # Channel, selector code and start of the play
+                        'target TEXT NOT NULL, '  # Webhook URL
+                        'payload TEXT NOT NULL, '  # JSON encoded post content
+                        'status TEXT NOT NULL DEFAULT \'pending\', '  # pending, delivered or failed
+                        'attempts INTEGER NOT NULL DEFAULT 0, '
+                        'next_attempt REAL NOT NULL DEFAULT 0, '  # Time of delivery once delivered
+                        'last_error TEXT, '
+                        'UNIQUE (play, target, payload))')
+        self.db.execute('CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt)')
+
+    def latestCodes(self):
+        """
+        Restores the code of the last handled track of every channel.
+
+        Returns:
+            dict: Selector code per channel slug.
+        """
+        with self.lock:
+            return dict(self.db.execute('SELECT channel, latest_code FROM state'))
+
+    def record(self, slug, code, play, jobs):
+        """
+        Records a handled track and the notifications it triggered in a single transaction.
+
+        Args:
+            slug (str): Slug of the channel the track was played on.
+            code (str): Selector code of the track.
+            play (str): Identifier of this play of the track (the same track can be played again later).
+            jobs (list): Tuples of (hookURL, postContent) to deliver.
+        """
+        with self.lock:
+            self.db.execute('BEGIN IMMEDIATE')
+            try:
+                self.db.execute('INSERT OR REPLACE INTO state (channel, latest_code) VALUES (?, ?)', (slug, code))
+                self.db.executemany('INSERT OR IGNORE INTO outbox (play, target, payload) VALUES (?, ?, ?)',
+                                    [(play, hookURL, json.dumps(postContent, sort_keys=True))
+                                     for hookURL, postContent in jobs])
+                self.db.execute('COMMIT')
+            except BaseException:
+                self.db.execute('ROLLBACK')
+                raise
+        if jobs:
+            self.wakeUp.set()
+
+    def drain(self, limit=100):
+        """
+        Attempts to deliver every notification that is due.
+
+        Args:
+            limit (int): Maximum number of notifications to attempt at once.
+
+        Returns:
+            float: Seconds until the next notification is due (None if nothing is pending).
+        """
+        now = time.time()
+        with self.lock:
+            rows = self.db.execute('SELECT id, target, payload, attempts FROM outbox '
+                                   'WHERE status = \'pending\' AND next_attempt <= ? ORDER BY id LIMIT ?',
+                                   (now, limit)).fetchall()
+        if rows:
+            deliveries = self.deliverer.deliver([(target, json.loads(payload)) for _, target, payload, _ in rows])
+            self.settle(rows, deliveries)
+            if self.report:
+                self.report(deliveries)
+        if now - self.pruned >= 3600:
+            self.prune(now)
+
+        # Determine when to try again
+        with self.lock:
+            nextAttempt = self.db.execute('SELECT MIN(next_attempt) FROM outbox WHERE status = \'pending\'').fetchone()[0]
+        return None if nextAttempt is None else max(0.0, nextAttempt - time.time())
+
+    def settle(self, rows, deliveries):
+        """
+        Marks delivered notifications and reschedules (or gives up on) failed ones.
+
+        Args:
+            rows (list): Attempted outbox rows (id, target, payload, attempts).
+            deliveries (list): delivery.Delivery outcome per row.
+        """
+        now = time.time()
+        updates = []
+        for (rowId, _, _, attempts), delivery in zip(rows, deliveries):
+            attempts += 1
+            error = delivery.error or (None if delivery.ok() else 'HTTP {}'.format(delivery.status))
+            if error is None:
+                status = 'delivered'
+            elif attempts >= self.maxAttempts or not self.retryable(delivery):
+                status = 'failed'
+            else:
+                status = 'pending'
+            delay = 0 if status == 'delivered' else min(self.maxDelay, self.baseDelay * 2 ** (attempts - 1))
+            updates.append((status, attempts, now + delay, error, rowId))
+        with self.lock:
+            self.db.executemany('UPDATE outbox SET status = ?, attempts = ?, next_attempt = ?, last_error = ? '
+                                'WHERE id = ?', updates)
+
+    def prune(self, now=None):
+        """
+        Deletes the notifications that were delivered longer than the retention period ago.
+
+        Args:
+            now (float): Current time, defaults to time.time().
+
+        Returns:
+            int: Number of notifications deleted.
+        """
+        now = time.time() if now is None else now
+        with self.lock:
+            deleted = self.db.execute('DELETE FROM outbox WHERE status = \'delivered\' AND next_attempt < ?',
+                                      (now - self.retention,)).rowcount
+        self.pruned = now
+        return deleted
+
+    def retryable(self, delivery):
+        """
+        Determines whether a failed delivery is worth another attempt.
+
+        Args:
+            delivery (delivery.Delivery): Failed delivery.
+
+        Returns:
+            bool: True for connection errors, rate limits and server errors.
+        """
+        return delivery.status is None or delivery.status == 429 or delivery.status >= 500
+
+    def run(self):
+        """
+        Keeps draining the outbox until stopped, sleeping until something is recorded or a retry is due.
+        """
+        while not self.stopped.is_set():
+            try:
+                wait = self.drain()
+            except Exception as error:
+                # Never let the worker die, try again later
+                print('Outbox kon niet worden afgehandeld: {}'.format(error))
+                wait = self.baseDelay
+            self.wakeUp.wait(wait)
+            self.wakeUp.clear()
+
+    def start(self):
+        """
+        Starts the background worker.
+        """
+        self.worker = threading.Thread(target=self.run, name='outbox', daemon=True)
+        self.worker.start()
+
+    def stop(self):
+        """
+        Stops the background worker (if running), after which the outbox can still be drained by hand.
+        """
+        self.stopped.set()
+        self.wakeUp.set()
+        if self.worker:
+            self.worker.join()
+            self.worker = None
+
+    def close(self):
+        """
+        Stops the background worker and closes the database.
+        """
+        self.stop()
+        self.db.close()
@@ -0,0 +1,119 @@
+import queue                # Bounded hand-off between stages
+import threading            # Stage workers
+import traceback            # Print caught exceptions
+
+# What to do with an item when the queue of a stage is full
+OVERFLOW_POLICIES = ('block', 'drop-newest', 'drop-oldest')
+
+STOP = object()  # Tells a worker of a stage to stop
+
+
+class Stage:
+    """
+    Step of a producer/consumer pipeline: a bounded queue, drained by worker threads that handle every item.
+    When the queue is full, the producer either waits (backpressure) or an item is dropped,
+    so that a slow stage does not have to hold up the stages feeding it.
+    """
+
+    def __init__(self, name, handler, workers=1, size=1000, overflow='block', onDrop=None):
+        """
+        Starts the workers of the stage.
+
+        Args:
+            name (str): Name of the stage, used for its threads and metrics.
+            handler (callable): Called with every item.
+            workers (int): Number of worker threads.
+            size (int): Maximum number of items waiting in the queue.
+            overflow (str): Policy when the queue is full: 'block' waits for room,
+                            'drop-newest' discards the new item and 'drop-oldest' discards the longest waiting one.
+            onDrop (callable): Called with every dropped item.
+        """
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError("Unknown overflow policy '{}', expected one of {}".format(overflow, OVERFLOW_POLICIES))
+        self.name = name
+        self.handler = handler
+        self.overflow = overflow
+        self.onDrop = onDrop
+        self.queue = queue.Queue(size)
+        self.dropped = 0  # Number of dropped items
+        self.workers = [threading.Thread(target=self.run, name='{}_{}'.format(name, index), daemon=True)
+                        for index in range(workers)]
+        for worker in self.workers:
+            worker.start()
+
+    def put(self, item):
+        """
+        Hands an item to the stage, applying the overflow policy if the queue is full.
+
+        Args:
+            item: Item to handle.
+
+        Returns:
+            bool: Whether the item was queued (False if it was dropped).
+        """
+        if self.overflow == 'block':
+            self.queue.put(item)
+            return True
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                return True
+            except queue.Full:
+                if self.overflow == 'drop-newest':
+                    self.drop(item)
+                    return False
+            # Make room by dropping the item that has been waiting longest
+            try:
+                self.drop(self.queue.get_nowait())
+                self.queue.task_done()
+            except queue.Empty:
+                pass
+
+    def drop(self, item):
+        """
+        Registers a dropped item.
+
+        Args:
+            item: The dropped item.
+        """
+        self.dropped += 1
+        if self.onDrop:
+            self.onDrop(item)
+
+    def run(self):
+        """
+        Handles items until stopped.
+        """
+        while True:
+            item = self.queue.get()
+            try:
+                if item is STOP:
+                    return
+                self.handler(item)
+            except Exception:
+                # A failing item must not stop the stage
+                print(traceback.format_exc() + '\nFout in stap {}'.format(self.name))
+            finally:
+                self.queue.task_done()
+
+    def depth(self):
+        """
+        Returns:
+            int: Number of items waiting (approximately).
+        """
+        return self.queue.qsize()
+
+    def join(self):
+        """
+        Waits until every queued item has been handled.
+        """
+        self.queue.join()
+
+    def close(self):
+        """
+        Lets the workers handle the queued items and stops them.
+        """
+        for _ in self.workers:
+            self.queue.put(STOP)
+        for worker in self.workers:
+            worker.join()
@@ -0,0 +1,100 @@
+import random               # Spreading reconnects
+import threading            # Listening in the background
+import time                 # Liveness and backoff
+import traceback            # Print caught exceptions
+
+
+class PushFeed:
+    """
+    Keeps a channel subscribed to its now-playing push feed and hands every song to a callback the moment it arrives.
+    A feed that breaks is reconnected with exponential backoff. The feed is live while it is connected and has shown
+    signs of life recently, the caller polls the channel as usual whenever it is not.
+    """
+
+    def __init__(self, channel, onSong, url=None, silence=30.0, minDelay=1.0, maxDelay=60.0, onEvent=None):
+        """
+        Args:
+            channel (qmusic.Channel): Channel to subscribe to.
+            onSong (callable): Called with every qmusic.Song that arrives.
+            url (str): URL of the feed, defaults to the one of the channel.
+            silence (float): Seconds without any data after which the feed is no longer trusted.
+            minDelay (float): Seconds to wait before the first reconnect, doubled on every next one.
+            maxDelay (float): Maximum number of seconds in between reconnects.
+            onEvent (callable): Called with 'connect', 'song' or 'disconnect' for every change of the feed.
+        """
+        self.channel = channel
+        self.onSong = onSong
+        self.url = url
+        self.silence = silence
+        self.minDelay = minDelay
+        self.maxDelay = maxDelay
+        self.onEvent = onEvent
+        self.connected = False
+        self.lastSeen = None  # time.monotonic() of the last data on the feed
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """
+        Starts listening in the background.
+        """
+        self.thread = threading.Thread(target=self.run, name='push-{}'.format(self.channel.slug()), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stops reconnecting, the feed is dropped as soon as it shows signs of life again.
+        """
+        self.stopped.set()
+
+    def live(self):
+        """
+        Returns:
+            bool: Whether the feed can be relied on (polling the channel is unnecessary).
+        """
+        return self.connected and time.monotonic() - self.lastSeen < self.silence
+
+    def run(self):
+        """
+        Listens to the feed until stopped, reconnecting whenever it breaks.
+        """
+        delay = self.minDelay
+        while not self.stopped.is_set():
+            try:
+                for song in self.channel.push_songs(self.url, self.silence):
+                    self.lastSeen = time.monotonic()
+                    if not self.connected:
+                        self.connected = True
+                        self.report('connect')
+                    delay = self.minDelay  # The feed works, start over when it breaks
+                    if self.stopped.is_set():
+                        break
+                    if song is not None:
+                        self.report('song')
+                        try:
+                            self.onSong(song)
+                        except Exception:
+                            # A failing song must not end the subscription
+                            print(traceback.format_exc() + '\nLiedje van push-feed {} kon niet worden afgehandeld'
+                                  .format(self.channel.slug()))
+                error = 'verbinding gesloten'
+            except Exception as exception:
+                error = str(exception) or type(exception).__name__
+            if self.connected:
+                self.connected = False
+                self.report('disconnect')
+            if self.stopped.is_set():
+                break
+            print('Push-feed van {} onderbroken ({}), opnieuw verbinden over {:.0f} s'.format(
+                self.channel.slug(), error, delay))
+            # Jitter keeps the feeds of all channels from reconnecting at once
+            self.stopped.wait(delay * random.uniform(0.5, 1.0))
+            delay = min(self.maxDelay, delay * 2)
+
+    def report(self, event):
+        """
+        Args:
+            event (str): Change of the feed.
+        """
+        if self.onEvent:
+            self.onEvent(event)
@@ -1,60 +1,488 @@
-import requests, dateutil.parser
+import requests, contextlib, datetime, json, os, tempfile, time, typing
+from requests.adapters import HTTPAdapter
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+# orjson is only imported when it is used (it is the fallback for msgspec), to keep starting up cheap
+orjson = None
+
+
+def __import_orjson__():
+    global orjson
+    if orjson is None:
+        try:
+            import orjson as module
+        except ImportError:
+            return None
+        orjson = module
+    return orjson
+
+
+# Fields of a song that the compact models (and the bot) use
+SONG_SCHEMA = {"selector_code": None, "title": None, "slug": None, "played_at": None, "thumbnail": None,
+               "release_year": None,
+               "artist": {"id": None, "name": None, "original_name": None, "slug": None, "country": None,
+                          "photo": None},
+               "sub_artists": [{"artist": {"id": None, "name": None, "original_name": None, "slug": None,
+                                           "country": None}}]}
+# Fields of tracks/plays that are needed to poll a channel
+PLAYS_SCHEMA = {"played_tracks": [dict(SONG_SCHEMA, next=SONG_SCHEMA)]}
+# Fields of the channel catalog that are needed to poll a channel
+CATALOG_SCHEMA = {"data": [{"data": {"id": None, "name": None, "api_url": None, "station_id": None}}]}
+
+
+def extract(document, schema):
+    """Keeps only the fields of a decoded JSON document that are described by a schema.
+    A schema is None (keep the value as is), a dict of field names to schemas, or a list with the schema of every item.
+    :param document: The decoded document
+    :type document: dict, list
+    :param schema: The schema of the fields to keep
+    :type schema: dict, list, None
+    :return: Returns the document with only the described fields
+    :rtype: dict, list
+    """
+    if schema is None or document is None:
+        return document
+    if isinstance(schema, list):
+        return [extract(item, schema[0]) for item in document]
+    return {field: extract(document[field], sub_schema) for field, sub_schema in schema.items() if field in document}
+
+
+def __msgspec_type__(schema, name="Document"):
+    if schema is None:
+        return typing.Any
+    if isinstance(schema, list):
+        return list[__msgspec_type__(schema[0], name)]
+    # Unknown fields are skipped by msgspec without being decoded, missing fields are omitted again afterwards
+    fields = [(field, typing.Optional[__msgspec_type__(sub_schema, name + "_" + field)], msgspec.UNSET)
+              for field, sub_schema in schema.items()]
+    return msgspec.defstruct(name, fields, omit_defaults=True)
+
+
+class Decoder:
+    def __init__(self, backend=None):
+        """Decodes JSON documents, optionally only the fields described by a schema (see :func:`extract`).
+        :param backend: "msgspec", "orjson" or "json", defaults to the fastest one that is installed
+        :type backend: str, optional
+        """
+        if backend is None:
+            backend = "msgspec" if msgspec else "orjson" if __import_orjson__() else "json"
+        if backend == "msgspec" and msgspec is None or backend == "orjson" and __import_orjson__() is None:
+            raise ImportError("JSON backend {} is not installed".format(backend))
+        if backend not in ("msgspec", "orjson", "json"):
+            raise ValueError("Unknown JSON backend {}".format(backend))
+        self.backend = backend
+        self.__decoders__ = {}
+
+    def decode(self, content, schema=None):
+        """Decodes a JSON document.
+        :param content: The encoded document
+        :type content: bytes, str
+        :param schema: The schema of the fields to decode, defaults to decoding everything
+        :type schema: dict, list, optional
+        :return: Returns the decoded document
+        :rtype: dict, list
+        :raises ValueError: If the document is not valid JSON
+        """
+        if self.backend == "msgspec":
+            # msgspec skips everything outside of the schema while parsing
+            key = id(schema)
+            decoder = self.__decoders__.get(key)
+            if decoder is None:
+                decoder = msgspec.json.Decoder(__msgspec_type__(schema) if schema is not None else object)
+                self.__decoders__[key] = decoder
+            try:
+                document = decoder.decode(content)
+            except msgspec.DecodeError as error:
+                # Raise the same kind of error as the other backends
+                raise ValueError(str(error)) from error
+            return msgspec.to_builtins(document) if schema is not None else document
+        document = orjson.loads(content) if self.backend == "orjson" else json.loads(content)
+        return extract(document, schema)
+
+
+class Connection:
+    def __init__(self, timeout=(3.05, 10), pool_size=16, decoder=None):
+        """A pooled keep-alive session to the Q-music API, shared by all channels.
+        :param timeout: Seconds to wait for connecting and reading, defaults to (3.05, 10)
+        :type timeout: float, tuple, optional
+        :param pool_size: Number of connections to keep alive per host, defaults to 16
+        :type pool_size: int, optional
+        :param decoder: JSON backend to decode responses with, defaults to the fastest one that is installed
+        :type decoder: str, optional
+
+        Set :attr:`observer` to a callable to be told about every request, it is called with the url,
+        the status code, the seconds the request took and the seconds decoding the response took.
+        Set :attr:`recorder` to a callable to be handed every decoded document, it is called with the url and the
+        document (responses that did not change are not decoded again, so they are not handed over either).
+        """
+        self.timeout = timeout
+        self.decoder = Decoder(decoder)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.__validated__ = {}
+        self.observer = None
+        self.recorder = None
+
+    def __request__(self, url, headers=None):
+        start = time.perf_counter()
+        response = self.session.get(url, headers=headers, timeout=self.timeout)
+        return response, time.perf_counter() - start
+
+    def __observe__(self, url, status, request_time, decode_time=0.0):
+        if self.observer is not None:
+            self.observer(url, status, request_time, decode_time)
+
+    def __decode__(self, url, response, request_time, schema):
+        if not response.ok:
+            self.__observe__(url, response.status_code, request_time)
+            response.raise_for_status()
+        start = time.perf_counter()
+        document = self.decoder.decode(response.content, schema)
+        self.__observe__(url, response.status_code, request_time, time.perf_counter() - start)
+        if self.recorder is not None:
+            self.recorder(url, document)
+        return document
+
+    def get_json(self, url, schema=None):
+        """Gets and decodes a JSON document.
+        :param url: The url of the document
+        :type url: str
+        :param schema: The schema of the fields to decode, defaults to decoding everything
+        :type schema: dict, list, optional
+        :return: Returns the decoded document
+        :rtype: dict
+        """
+        response, request_time = self.__request__(url)
+        return self.__decode__(url, response, request_time, schema)
+
+    def get_json_conditional(self, url, schema=None):
+        """Gets and decodes a JSON document, unless it did not change since the last request.
+        The ETag and Last-Modified validators of the last response are sent along,
+        and if the server answers 304 Not Modified, the previously decoded document is returned as is.
+        :param url: The url of the document
+        :type url: str
+        :param schema: The schema of the fields to decode, defaults to decoding everything
+        :type schema: dict, list, optional
+        :return: Returns the decoded document and whether it changed since the last request
+        :rtype: tuple
+        """
+        headers = {}
+        cached = self.__validated__.get(url)
+        if cached is not None:
+            etag, last_modified, document = cached
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+        response, request_time = self.__request__(url, headers)
+        if response.status_code == 304 and cached is not None:
+            self.__observe__(url, 304, request_time)
+            return cached[2], False
+        document = self.__decode__(url, response, request_time, schema)
+        etag, last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+        if etag or last_modified:
+            self.__validated__[url] = (etag, last_modified, document)
+        return document, True
+
+    def stream_events(self, url, read_timeout=30):
+        """Subscribes to a server-sent events stream and yields its events as they arrive.
+        Comment lines (which servers send to keep a quiet stream open) are yielded as well, as an event None,
+        so the caller can tell that the stream is still alive.
+        :param url: The url of the stream
+        :type url: str
+        :param read_timeout: Seconds without any data after which the stream is considered dead, defaults to 30
+        :type read_timeout: float, optional
+        :return: Returns a generator of (event type, data) tuples, which ends when the server closes the stream
+        :rtype: generator
+        :raises requests.RequestException: If the stream cannot be opened, or breaks or stays silent too long
+        """
+        connect_timeout = self.timeout[0] if isinstance(self.timeout, tuple) else self.timeout
+        # A session of its own, a stream holds on to its connection for as long as it is open
+        with requests.Session() as session:
+            response = session.get(url, headers={"Accept": "text/event-stream"}, stream=True,
+                                   timeout=(connect_timeout, read_timeout))
+            with response:
+                self.__observe__(url, response.status_code, response.elapsed.total_seconds())
+                response.raise_for_status()
+                event, data = "message", []
+                # Without a chunk size, every chunk is handed over as soon as it arrives
+                for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+                    if not line:
+                        # A blank line ends an event
+                        if data:
+                            yield event, "\n".join(data)
+                        event, data = "message", []
+                    elif line.startswith(":"):
+                        yield None, line[1:].strip()
+                    else:
+                        field, _, value = line.partition(":")
+                        value = value[1:] if value.startswith(" ") else value
+                        if field == "event":
+                            event = value
+                        elif field == "data":
+                            data.append(value)
+
+
+connection = Connection()
+
+
+def configure(timeout=(3.05, 10), pool_size=16, decoder=None):
+    """Replaces the shared connection, e.g. to change timeouts. Affects channels created afterwards.
+    :param timeout: Seconds to wait for connecting and reading, defaults to (3.05, 10)
+    :type timeout: float, tuple, optional
+    :param pool_size: Number of connections to keep alive per host, defaults to 16
+    :type pool_size: int, optional
+    :param decoder: JSON backend to decode responses with, defaults to the fastest one that is installed
+    :type decoder: str, optional
+    """
+    global connection
+    connection.session.close()
+    connection = Connection(timeout, pool_size, decoder)
+
+
+API_URL = "https://api.qmusic.nl"
+CATALOG_CACHE = os.path.join(os.path.expanduser("~"), ".cache", "qmusic", "channels.json")
 
 
 class Qmusic:
-    def __init__(self):
-        self.__achannels__ = self.__channels__()
+    def __init__(self, conn=None, cache_path=CATALOG_CACHE, cache_ttl=86400, compact=False, selective=False,
+                 base_url=None):
+        """The Q-music API. The channel catalog is loaded on first use, from disk if a fresh enough copy is cached.
+        :param conn: The connection to use, defaults to the shared connection
+        :type conn: :class:`Connection`, optional
+        :param cache_path: Where to cache the channel catalog, None disables caching
+        :type cache_path: str, optional
+        :param cache_ttl: Seconds a cached channel catalog stays valid, defaults to a day
+        :type cache_ttl: int, optional
+        :param compact: Whether channels return :class:`CompactSong` instead of :class:`Song` objects
+        :type compact: bool, optional
+        :param selective: Whether to only decode the fields needed for polling (see :data:`CATALOG_SCHEMA` and
+            :data:`PLAYS_SCHEMA`), accessors of other fields are not available then. "auto" only does so when the
+            connection decodes with msgspec, the other backends decode everything first and are slower selectively
+        :type selective: bool, str, optional
+        :param base_url: Url to use instead of the Q-music API, e.g. of a simulator. The catalog is fetched from
+            <base_url>/2.4/app/channels and channels are polled at <base_url>/<api_url>/2.4
+            (the default catalog cache is not used then)
+        :type base_url: str, optional
+        """
+        self.__conn__ = conn or connection
+        if selective == "auto":
+            # Selecting fields only pays off when the decoder skips the others while parsing
+            selective = self.__conn__.decoder.backend == "msgspec"
+        self.__compact__ = compact
+        self.__selective__ = selective
+        self.__base_url__ = base_url.rstrip("/") if base_url else None
+        if base_url and cache_path == CATALOG_CACHE:
+            # Never mix up the catalog of another API with the real one
+            cache_path = None
+        if cache_path and selective:
+            # A selectively decoded catalog lacks fields, so keep it apart from a complete one
+            cache_path = os.path.splitext(cache_path)[0] + ".selective.json"
+        self.__cache_path__ = cache_path
+        self.__cache_ttl__ = cache_ttl
+        self.__achannels__ = None
+        self.__byslug__ = None
+        self.__from_cache__ = False
 
     def __channels__(self):
-        return requests.get("https://api.qmusic.nl/2.4/app/channels").json()["data"]
+        if self.__achannels__ is None:
+            channels = self.__read_cache__()
+            if channels is None:
+                self.refresh()
+            else:
+                self.__load__(channels, True)
+        return self.__achannels__
+
+    def __load__(self, channels, from_cache):
+        self.__achannels__ = channels
+        self.__byslug__ = {channel["data"]["id"]: channel for channel in channels}
+        self.__from_cache__ = from_cache
+
+    def __fetch_channels__(self):
+        schema = CATALOG_SCHEMA if self.__selective__ else None
+        channels = self.__conn__.get_json((self.__base_url__ or API_URL) + "/2.4/app/channels", schema)["data"]
+        self.__write_cache__(channels)
+        return channels
+
+    def __read_cache__(self):
+        if not self.__cache_path__:
+            return None
+        try:
+            if time.time() - os.path.getmtime(self.__cache_path__) > self.__cache_ttl__:
+                return None
+            with open(self.__cache_path__, "rb") as cache:
+                return self.__conn__.decoder.decode(cache.read())
+        except (OSError, ValueError):
+            return None
+
+    def __write_cache__(self, channels):
+        if not self.__cache_path__:
+            return
+        try:
+            directory = os.path.dirname(self.__cache_path__) or "."
+            os.makedirs(directory, exist_ok=True)
+            # Write next to the cache first, so a crash never leaves a truncated catalog behind
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "w") as tmp:
+                json.dump(channels, tmp)
+            os.replace(tmp_path, self.__cache_path__)
+        except OSError:
+            pass
+
+    def refresh(self):
+        """Fetches the channel catalog, bypassing (and updating) the cache."""
+        self.__load__(self.__fetch_channels__(), False)
+
+    def get_connection(self):
+        """Gets the connection that is used for all requests.
+        :return: Returns the Connection object
+        :rtype: :class:`Connection`
+        """
+        return self.__conn__
+
+    def __channel__(self, channel):
+        return Channel(channel, self.__conn__, self.__compact__, self.__selective__, self.__base_url__)
 
     def get_channel(self, slug="qmusic_nl"):
-        """Gets the channel from the slug.
+        """Gets the channel from the slug. The channel does not make any request until it is used.
         :param slug: The slug of the channel, defaults to "qmusic_nl"
         :type slug: str, optional
         :return: Returns a Channel object or None if it isn't available
         :rtype: :class:`Channel`
         """
-        for channel in self.__achannels__:
-            if channel["data"]["id"] == slug:
-                return Channel(channel)
-        return None
+        self.__channels__()
+        if slug not in self.__byslug__ and self.__from_cache__:
+            # The cached catalog might predate the channel
+            self.refresh()
+        channel = self.__byslug__.get(slug)
+        return self.__channel__(channel) if channel is not None else None
+
+    def slugs(self):
+        """Gets the slugs of all channels in the catalog.
+        :return: Returns a list with the slug of every channel
+        :rtype: list, str
+        """
+        return [channel["data"]["id"] for channel in self.__channels__()]
+
+    def get_channels(self, slugs=None):
+        """Gets multiple channels at once.
+        :param slugs: The slugs of the channels, defaults to every channel in the catalog
+        :type slugs: list, optional
+        :return: Returns a list with a Channel object for every available slug
+        :rtype: list, :class:`Channel`
+        """
+        if slugs is None:
+            return [self.__channel__(channel) for channel in self.__channels__()]
+        channels = [self.get_channel(slug) for slug in slugs]
+        return [channel for channel in channels if channel is not None]
 
 
 class Channel:
-    def __init__(self, json):
+    def __init__(self, json, conn=None, compact=False, selective=False, base_url=None):
         self.json = json
+        self.__base_url__ = base_url
+        self.__conn__ = conn or connection
+        self.__song__ = CompactSong if compact else Song
+        self.__schema__ = PLAYS_SCHEMA if selective else None
         self.__data__ = self.json["data"]
         self.__apiurl__ = self.__api_url__()
-        self.__r__ = self.__req__()
+        self.__current__ = None
+        self.__current_play__ = None  # The play the current song was built from
+        self.__latest__ = None  # The newest play that was fetched or pushed last
+        # Whether the "next" song of the newest play is still to start (see next_song), rather than playing already
+        self.next_upcoming = False
+        self.tracer = None  # Set to a tracing.Tracer to record spans of fetching and parsing plays
+
+    def __span__(self, name):
+        if self.tracer is None:
+            return contextlib.nullcontext()
+        return self.tracer.span(name, channel=self.__data__["id"])
 
     def __req__(self):
-        return requests.get(self.__apiurl__ + "/tracks/plays?limit=1").json()["played_tracks"][0]
+        return self.__plays__(1)[0]
+
+    def __plays__(self, limit):
+        url = self.__apiurl__ + "/tracks/plays?limit=" + str(limit)
+        with self.__span__("fetch"):
+            document, _ = self.__conn__.get_json_conditional(url, self.__schema__)
+        plays = document["played_tracks"]
+        self.__latest__ = plays[0] if plays else None
+        return plays
 
     def current_song(self):
         """Gets the current song playing on the channel.
+        The "next" song of the newest play is taken as the current one, unless :attr:`next_upcoming` is set.
         :return: Returns a Song object
         :rtype: :class:`Song`
         """
         req = self.__req__()
-
-        if "next" in req:
-            return Song(req.pop("next"), self.__apiurl__)
-        else:
-            return Song(req, self.__apiurl__)
-
-    def next_song(self):
+        # An unchanged response hands back the very same play, whichever method fetched it last
+        if req is self.__current_play__:
+            return self.__current__
+
+        with self.__span__("song"):
+            if req.get("next") and not self.next_upcoming:
+                self.__current__ = self.__song__(req["next"], self.__apiurl__)
+            else:
+                self.__current__ = self.__song__(req, self.__apiurl__)
+        self.__current_play__ = req
+        return self.__current__
+
+    def next_song(self, cached=False):
         """Gets the next song on the channel. The next song might not be available, in that case it returns None.
+        :param cached: Whether to take it from the plays that were fetched (or pushed) last instead of fetching them
+            again, defaults to False
+        :type cached: bool, optional
         :return: Returns a Song object if the next song is available or None if it isn't available
         :rtype: :class:`Song`, bool
         """
-        req = self.__req__()
+        req = self.__latest__ if cached else self.__req__()
 
-        if "next" in req:
-            return Song(req["next"], self.__apiurl__)
+        if req is not None and req.get("next"):
+            return self.__song__(req["next"], self.__apiurl__)
         else:
             return None
 
+    def push_songs(self, url=None, read_timeout=30):
+        """Subscribes to the now-playing feed of the channel, a server-sent events stream of "play" events
+        that each hold a play like those of :meth:`recent_songs`, sent the moment the song starts.
+        :param url: The url of the feed, defaults to tracks/plays/stream of the channel
+        :type url: str, optional
+        :param read_timeout: Seconds without any data (including keep-alive comments) after which the feed is
+            considered dead, defaults to 30
+        :type read_timeout: float, optional
+        :return: Returns a generator of Song objects, and of None whenever the feed shows it is still alive
+        :rtype: generator
+        :raises requests.RequestException: If the feed cannot be opened, or breaks or stays silent too long
+        """
+        schema = self.__schema__["played_tracks"][0] if self.__schema__ else None
+        for event, data in self.__conn__.stream_events(url or self.__apiurl__ + "/tracks/plays/stream", read_timeout):
+            if event in ("play", "message"):
+                with self.__span__("song"):
+                    self.__latest__ = self.__conn__.decoder.decode(data, schema)
+                    self.__current__ = self.__song__(self.__latest__, self.__apiurl__)
+                    self.__current_play__ = self.__latest__
+                yield self.__current__
+            else:
+                yield None
+
+    def recent_songs(self, limit=10):
+        """Gets the songs that were played most recently on the channel, newest first.
+        :param limit: The maximum number of songs to get, defaults to 10
+        :type limit: int, optional
+        :return: Returns a list with Song objects
+        :rtype: list, :class:`Song`
+        """
+        plays = self.__plays__(limit)
+        with self.__span__("song"):
+            return [self.__song__(play, self.__apiurl__) for play in plays]
+
     def color(self):
         """Gets the colors of the channel
         :return: Returns a Color object
@@ -84,8 +512,17 @@ class Channel:
         return self.__data__["name"]
 
     def __api_url__(self):
+        if self.__base_url__:
+            return self.__base_url__ + "/" + self.__data__["api_url"] + "/2.4"
         return "http://" + self.__data__["api_url"] + "/2.4"
 
+    def api_url(self):
+        """Gets the url of the API of the channel, its plays are at <api_url>/tracks/plays
+        :return: Returns a string with the url
+        :rtype: str
+        """
+        return self.__apiurl__
+
     def station_id(self):
         """Gets the station id of the channel
         :return: Returns a string with the station id
@@ -440,6 +877,7 @@ class Song:
         :return: Return a datetime.datetime object
         :rtype: datetime.datetime
         """
+        import dateutil.parser  # Only needed for the complete model, so imported on first use
         return dateutil.parser.parse(self.json["played_at"])
 
     def slug(self):
@@ -595,6 +1033,172 @@ class Artist:
         return self.json["country"]["name"] if "name" in self.json else None
 
 
+def parse_timestamp(value):
+    """Parses an ISO 8601 timestamp, using the fast standard library parser when it understands the format.
+    :param value: The timestamp, e.g. '2021-03-01T12:34:56+01:00'
+    :type value: str
+    :return: Returns a datetime.datetime object
+    :rtype: datetime.datetime
+    """
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except ValueError:
+        import dateutil.parser  # Rarely needed, so imported on first use
+        return dateutil.parser.parse(value)
+
+
+class CompactSong:
+    """A memory efficient alternative to :class:`Song`.
+    Only the commonly used fields are extracted and converted, once, and the raw JSON is dropped unless asked for.
+    """
+    __slots__ = ("__code", "__title", "__slug", "__played_at", "__thumbnail", "__release_year", "__artist",
+                 "__featuring", "__json")
+
+    def __init__(self, json, BASE, keep_json=False):
+        self.__code = json["selector_code"]
+        self.__title = json["title"]
+        self.__slug = json.get("slug")
+        played_at = json.get("played_at")  # Not always known of the next song
+        self.__played_at = parse_timestamp(played_at) if played_at is not None else None
+        thumbnail = json.get("thumbnail")
+        self.__thumbnail = BASE[:-3] + "cover" + thumbnail if thumbnail is not None else None
+        self.__release_year = json.get("release_year")
+        self.__artist = CompactArtist(json["artist"], BASE)
+        self.__featuring = tuple(CompactArtist(artist["artist"], BASE) for artist in json.get("sub_artists", ()))
+        self.__json = json if keep_json else None
+
+    def played_at(self):
+        """Gets the timestamp of when the song started playing (or is announced to start, for the next song)
+        :return: Return a datetime.datetime object or None if it isn't available
+        :rtype: datetime.datetime, bool
+        """
+        return self.__played_at
+
+    def slug(self):
+        """Gets the slug of the song. E.g. all-i-want-for-christmas-is-you
+        :return: Return a string with the slug
+        :rtype: str
+        """
+        return self.__slug
+
+    def title(self):
+        """Gets the title of the song.
+        :return: Return a string with the title
+        :rtype: str
+        """
+        return self.__title
+
+    def selector_code(self):
+        """Gets the selector code of a song
+        :return: Return a string with the selector code
+        :rtype: str
+        """
+        return self.__code
+
+    def release_year(self):
+        """Gets the release year of a song
+        :return: Return a string with the release year or None if it isn't available
+        :rtype: str, bool
+        """
+        return self.__release_year
+
+    def thumbnail_url(self):
+        """Gets the thumbnail url of a song. Like :meth:`Song.thumbnail_url`, raises a KeyError if there is none.
+        :return: Return a string with the thumbnail url
+        :rtype: str
+        """
+        if self.__thumbnail is None:
+            raise KeyError("thumbnail")
+        return self.__thumbnail
+
+    def artist(self):
+        """Gets the artist of a song
+        :return: Return a CompactArtist object
+        :rtype: :class:`CompactArtist`
+        """
+        return self.__artist
+
+    def featuring_artists(self):
+        """Gets the featuring artists of a song
+        :return: Return a tuple with CompactArtist objects of the featuring artists.
+        :rtype: tuple, :class:`CompactArtist`
+        """
+        return self.__featuring
+
+    def json(self):
+        """Gets the raw JSON of the song, if it was kept
+        :return: Return a dict with the raw JSON or None if it wasn't kept
+        :rtype: dict, bool
+        """
+        return self.__json
+
+
+class CompactArtist:
+    """A memory efficient alternative to :class:`Artist`, holding only the commonly used fields."""
+    __slots__ = ("__id", "__name", "__main_name", "__slug", "__country_code", "__country_name", "__photo")
+
+    def __init__(self, json, BASE=""):
+        self.__id = json.get("id")
+        self.__name = json["name"]
+        self.__main_name = json.get("original_name")
+        self.__slug = json.get("slug")
+        country = json.get("country") or {}
+        self.__country_code = country.get("code")
+        self.__country_name = country.get("name")
+        self.__photo = BASE + json["photo"] if json.get("photo") else None
+
+    def id_code(self):
+        """Gets the id/selector_code of the artist
+        :return: Returns an int with the id of the artist
+        :rtype: int
+        """
+        return self.__id
+
+    def name_all_artist(self):
+        """Gets the string with all the names of the song artists. E.g.: 'LOST FREQUENCIES & MATHIEU KOSS'
+        :return: Returns a string with all the song artists names
+        :rtype: str
+        """
+        return self.__name
+
+    def name_main_artist(self):
+        """Gets the string with the name of the artist. E.g.: 'LOST FREQUENCIES'
+        :return: Returns a string with the song artist name
+        :rtype: str
+        """
+        return self.__main_name
+
+    def slug(self):
+        """Gets the slug of the artist
+        :return: Returns a string with the slug of the artist
+        :rtype: str
+        """
+        return self.__slug
+
+    def country_code(self):
+        """Gets the country code from where the artist is
+        :return: Returns a string with the country code from where the artist is or None if it isn't available
+        :rtype: str, bool
+        """
+        return self.__country_code
+
+    def country_name(self):
+        """Gets the country name from where the artist is
+        :return: Returns a string with the country name from where the artist is or None if it isn't available
+        :rtype: str, bool
+        """
+        return self.__country_name
+
+    def photo(self):
+        """Gets the photo url of the artist. Like :meth:`Artist.photo`, raises a KeyError if there is none.
+        :return: Returns a string with the photo url of the artist
+        :rtype: str
+        """
+        if self.__photo is None:
+            raise KeyError("photo")
+        return self.__photo
+
+
 class Edition:
     def __init__(self, json):
         self.json = json
@@ -0,0 +1,365 @@
+#!/usr/bin/env python
+"""
+Deterministic replay of recorded plays through QBot, on a virtual clock.
+A recording holds tracks/plays responses as lines of JSON (see --record of QBot.py, or benchmarks/fixtures/plays.jsonl),
+from which the timeline of every channel is reconstructed. The bot then polls a stand-in API that answers with what
+was playing at the virtual moment of the request, and sleeping only moves the virtual clock forward,
+so a week of station history is replayed in seconds. Notifications are recorded instead of posted.
+The report tells how many tracks the polling policy detected, how late and with how many requests,
+so runs with different policies can be compared.
+
+Run with e.g. `python replay.py recording.jsonl --targets targets.csv --history 5 --output results.json`.
+"""
+
+from delivery import Delivery  # Outcomes of recorded notifications
+from qmusic import Qmusic, Decoder, extract  # Q-music API wrapper
+from QBot import QBot       # Bot under test
+
+import argparse             # Command line arguments
+import bisect               # Finding what was playing
+import contextlib           # Silencing the bot
+import datetime             # Play timestamps
+import io                   # Silencing the bot
+import json                 # Recordings and results
+import threading            # Guarding recorded notifications
+import time                 # Wall-clock duration of the replay
+
+REPLAY_URL = 'http://replay.invalid'  # Base URL of the stand-in API
+
+
+class ReplayFinished(Exception):
+    """
+    Raised by the virtual clock when the end of the recording has been reached.
+    """
+
+
+class VirtualClock:
+    """
+    Clock that only moves when it is slept on, in place of the time module.
+    """
+
+    def __init__(self, start, end=None):
+        """
+        Args:
+            start (float): Virtual moment to start at (UNIX timestamp).
+            end (float): Virtual moment at which sleeping raises ReplayFinished (None never ends).
+        """
+        self.now = start
+        self.end = end
+        self.lock = threading.Lock()
+
+    def time(self):
+        """
+        Returns:
+            float: Virtual UNIX timestamp.
+        """
+        return self.now
+
+    def monotonic(self):
+        """
+        Returns:
+            float: Virtual UNIX timestamp, which never goes backwards either.
+        """
+        return self.now
+
+    def sleep(self, seconds):
+        """
+        Moves the clock forward, without waiting.
+
+        Args:
+            seconds (float): Seconds to move forward.
+        """
+        with self.lock:
+            self.now += max(0.0, seconds)
+            if self.end is not None and self.now > self.end:
+                raise ReplayFinished()
+
+
+class Timeline:
+    """
+    What was played on a channel, reconstructed from the recorded responses.
+    """
+
+    def __init__(self):
+        self.plays = {}  # (selector code, start) -> play
+        self.starts = []  # Start of every play, in order (once built)
+        self.ordered = []  # Plays in order of their start (once built)
+
+    def add(self, plays):
+        """
+        Adds the plays of a recorded response.
+
+        Args:
+            plays (list): Plays, like played_tracks.
+        """
+        for play in plays:
+            start = parseTime(play['played_at'])
+            # The upcoming song is only known ahead of time by the API, never by the replay
+            self.plays[(play['selector_code'], start)] = {field: value for field, value in play.items()
+                                                          if field != 'next'}
+
+    def build(self):
+        """
+        Orders the plays once all recorded responses have been added.
+        """
+        keys = sorted(self.plays, key=lambda key: key[1])
+        self.starts = [start for _, start in keys]
+        self.ordered = [self.plays[key] for key in keys]
+
+    def playsAt(self, moment, limit):
+        """
+        Args:
+            moment (float): Virtual moment (UNIX timestamp).
+            limit (int): Maximum number of plays.
+
+        Returns:
+            list: Plays that started at or before the moment, newest first.
+        """
+        end = bisect.bisect_right(self.starts, moment)
+        return self.ordered[max(0, end - limit):end][::-1]
+
+
+class ReplayConnection:
+    """
+    Stand-in for qmusic.Connection, answering requests from the timelines at the moment of the virtual clock.
+    """
+
+    def __init__(self, timelines, clock, decoder):
+        """
+        Args:
+            timelines (dict): Timeline of every channel, by slug.
+            clock (VirtualClock): Clock of the replay.
+            decoder (qmusic.Decoder): Decoder, for the catalog cache and push feeds (which are not replayed).
+        """
+        self.timelines = timelines
+        self.clock = clock
+        self.decoder = decoder
+        self.observer = None
+        self.recorder = None
+        self.requests = 0  # Number of tracks/plays requests
+        self.previous = {}  # Last answer per url, to tell whether it changed
+        self.lock = threading.Lock()
+
+    def get_json(self, url, schema=None):
+        """
+        Answers the catalog request.
+        """
+        catalog = {'data': [{'data': {'id': slug, 'name': slug, 'api_url': 'replay/' + slug, 'station_id': slug}}
+                            for slug in self.timelines]}
+        return extract(catalog, schema)
+
+    def get_json_conditional(self, url, schema=None):
+        """
+        Answers a tracks/plays request with the plays up to the current virtual moment.
+        """
+        path, _, query = url.partition('?')
+        slug = path.split('/replay/')[1].split('/')[0]
+        limit = int(query.split('limit=')[1]) if 'limit=' in query else 10
+        document = extract({'played_tracks': self.timelines[slug].playsAt(self.clock.time(), limit)}, schema)
+        with self.lock:
+            self.requests += 1
+            changed = self.previous.get(url) != document
+            if changed:
+                self.previous[url] = document
+            else:
+                document = self.previous[url]  # Like a 304, the previously decoded document is handed back
+        if self.observer is not None:
+            self.observer(url, 200, 0.0, 0.0)
+        return document, changed
+
+
+class RecordingDeliverer:
+    """
+    Stand-in for delivery.Deliverer, which records notifications instead of posting them.
+    """
+
+    def __init__(self, clock):
+        """
+        Args:
+            clock (VirtualClock): Clock of the replay, the moment of every notification is recorded.
+        """
+        self.clock = clock
+        self.notifications = []  # (virtual moment, hookURL, postContent)
+        self.lock = threading.Lock()
+
+    def deliver(self, jobs, onLater=None):
+        """
+        Records notifications.
+
+        Args:
+            jobs (list): Tuples of (hookURL, postContent).
+            onLater (callable): Unused, recorded notifications are never rate limited.
+
+        Returns:
+            list: A successful delivery.Delivery for every notification.
+        """
+        with self.lock:
+            self.notifications.extend((self.clock.time(), hookURL, postContent) for hookURL, postContent in jobs)
+        return [Delivery(hookURL, 204) for hookURL, _ in jobs]
+
+    def close(self):
+        pass
+
+
+class ReplayBot(QBot):
+    """
+    QBot that remembers when it detected every track.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.detections = []  # (slug, selector code, start, moment of detection) of every handled track
+
+    def handleUpdate(self, track, slug=None):
+        self.detections.append((slug, track.selector_code(), track.played_at().timestamp(), self.clock.time()))
+        super().handleUpdate(track, slug)
+
+
+def readRecording(path, defaultSlug='qmusic_nl'):
+    """
+    Reads the timeline of every channel from a recording.
+
+    Args:
+        path (str): Location of the recording, one tracks/plays response per line.
+        defaultSlug (str): Channel of responses that do not name their channel.
+
+    Returns:
+        dict: Timeline of every channel, by slug.
+    """
+    timelines = {}
+    with open(path) as recording:
+        for line in recording:
+            if line.strip():
+                response = json.loads(line)
+                timelines.setdefault(response.get('channel', defaultSlug), Timeline()).add(response['played_tracks'])
+    for timeline in timelines.values():
+        timeline.build()
+    return timelines
+
+
+def replay(timelines, targetsPath, history=0, schedulerOptions=None, tail=600.0, quiet=True):
+    """
+    Replays the timelines through a bot and reports how well it kept up.
+
+    Args:
+        timelines (dict): Timeline of every channel, by slug.
+        targetsPath (str): Location of the targets file.
+        history (int): Number of recent plays the bot fetches per poll.
+        schedulerOptions (dict): Arguments of scheduler.PollScheduler, i.e. the polling policy.
+        tail (float): Seconds to keep replaying after the start of the last play.
+        quiet (bool): Whether to silence the output of the bot.
+
+    Returns:
+        dict: Report of the replay (see summarise), with every notification under 'notifications'.
+    """
+    # Start once every channel is playing something, like a bot that is started in the middle of the day
+    start = max(timeline.starts[0] for timeline in timelines.values() if timeline.starts)
+    end = max(timeline.starts[-1] for timeline in timelines.values() if timeline.starts) + tail
+    clock = VirtualClock(start, end)
+    connection = ReplayConnection(timelines, clock, Decoder())
+    qapi = Qmusic(connection, cache_path=None, compact=True, selective='auto', base_url=REPLAY_URL)
+    deliverer = RecordingDeliverer(clock)
+    began = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()) if quiet else contextlib.nullcontext():
+        bot = ReplayBot(list(timelines), history, qapi=qapi, clock=clock, schedulerOptions=schedulerOptions)
+        bot.deliverer.close()
+        bot.deliverer = deliverer
+        bot.readTargets(targetsPath)
+        try:
+            bot.listenToQ()
+        except ReplayFinished:
+            pass
+        bot.pollers.shutdown()
+    report = summarise(timelines, bot.detections, start, end, connection.requests)
+    report['wall_seconds'] = round(time.perf_counter() - began, 3)
+    report['speed_up'] = round((end - start) / max(report['wall_seconds'], 1e-9))
+    report['notifications'] = [{'at': formatTime(moment), 'target': hookURL, 'content': content}
+                               for moment, hookURL, content in sorted(deliverer.notifications, key=lambda n: n[:2])]
+    return report
+
+
+def summarise(timelines, detections, start, end, requests):
+    """
+    Compares the detected tracks to the timelines.
+
+    Args:
+        timelines (dict): Timeline of every channel, by slug.
+        detections (list): Tuples of (slug, selector code, start, moment of detection).
+        start (float): Virtual start of the replay.
+        end (float): Virtual end of the replay.
+        requests (int): Number of tracks/plays requests.
+
+    Returns:
+        dict: Number of tracks (played during the replay, or already playing when it started), detected tracks and
+              requests, and the detection lag (s) of the tracks that started during the replay.
+    """
+    played = set()
+    for slug, timeline in timelines.items():
+        first = max(0, bisect.bisect_right(timeline.starts, start) - 1)
+        played.update((slug, play['selector_code'], playStart)
+                      for playStart, play in zip(timeline.starts[first:], timeline.ordered[first:]))
+    detected = {(slug, code, playStart): moment for slug, code, playStart, moment in detections}
+    lags = sorted(moment - playStart for (_, _, playStart), moment in detected.items() if playStart > start)
+    return {
+        'virtual_seconds': round(end - start),
+        'channels': len(timelines),
+        'tracks': len(played),
+        'detected': len(played & set(detected)),
+        'missed': len(played - set(detected)),
+        'requests': requests,
+        'lag': {'mean': round(sum(lags) / len(lags), 3), 'p50': round(lags[len(lags) // 2], 3),
+                'p95': round(lags[min(len(lags) - 1, int(0.95 * len(lags)))], 3), 'max': round(lags[-1], 3)}
+        if lags else None,
+    }
+
+
+def parseTime(timestamp):
+    """
+    Args:
+        timestamp (str): ISO 8601 timestamp, like played_at.
+
+    Returns:
+        float: UNIX timestamp.
+    """
+    return datetime.datetime.fromisoformat(timestamp.replace('Z', '+00:00')).timestamp()
+
+
+def formatTime(moment):
+    """
+    Args:
+        moment (float): UNIX timestamp.
+
+    Returns:
+        str: ISO 8601 timestamp (UTC).
+    """
+    return datetime.datetime.fromtimestamp(moment, datetime.timezone.utc).isoformat()
+
+
+# If executed, replay a recording
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay recorded plays through the bot on a virtual clock.')
+    parser.add_argument('recording', help='Recorded tracks/plays responses, one per line (see --record of QBot.py)')
+    parser.add_argument('--targets', default='targets.csv', help='Location of the targets file')
+    parser.add_argument('--channel', default='qmusic_nl', help='Channel of responses that do not name their channel')
+    parser.add_argument('--history', type=int, default=0, help='Number of recent plays to fetch per poll')
+    parser.add_argument('--default-length', type=float, help='Assumed song length (s) until lengths are learned')
+    parser.add_argument('--tight-interval', type=float, help='Seconds between polls around the predicted change')
+    parser.add_argument('--max-interval', type=float, help='Maximum number of seconds between polls')
+    parser.add_argument('--min-interval', type=float, help='Minimum number of seconds between polls')
+    parser.add_argument('--min-length', type=float, help='Shortest song length (s) to learn from')
+    parser.add_argument('--max-length', type=float, help='Longest song length (s) to learn from')
+    parser.add_argument('--tail', type=float, default=600, help='Seconds to keep replaying after the last play')
+    parser.add_argument('--output', metavar='PATH', help='Write the report and every notification as JSON to PATH')
+    parser.add_argument('--verbose', action='store_true', help='Show the output of the bot')
+    args = parser.parse_args()
+
+    policy = {'defaultLength': args.default_length, 'tightInterval': args.tight_interval,
+              'maxInterval': args.max_interval, 'minInterval': args.min_interval, 'minLength': args.min_length,
+              'maxLength': args.max_length}
+    results = replay(readRecording(args.recording, args.channel), args.targets, args.history,
+                     {name: value for name, value in policy.items() if value is not None}, args.tail, not args.verbose)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+    notifications = results.pop('notifications')
+    print(json.dumps(dict(results, notifications=len(notifications)), indent=2))
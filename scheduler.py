@@ -0,0 +1,136 @@
+from collections import deque  # Bounded histories
+
+import time                 # Current time
+
+
+class PollScheduler:
+    """
+    Song-duration-aware polling schedule for a single channel.
+    The lengths of songs on the channel are learned from the start times of consecutive tracks.
+    Between changes the scheduler sleeps, around the predicted change it polls tightly,
+    and if a song runs longer than usual it gradually backs off again.
+    """
+
+    def __init__(self, defaultLength=210, tightInterval=5, maxInterval=60, minInterval=1, history=50, clock=time.time,
+                 minLength=None, maxLength=None):
+        """
+        Args:
+            defaultLength (float): Assumed song length in seconds until lengths have been learned.
+            tightInterval (float): Seconds between polls around the predicted change.
+            maxInterval (float): Maximum number of seconds between polls.
+            minInterval (float): Minimum number of seconds between polls.
+            history (int): Number of recent tracks to learn from and report on.
+            clock (callable): Returns the current time as a UNIX timestamp.
+            minLength (float): Shortest plausible song length in seconds, shorter ones are not learned.
+                               Defaults to a seventh of defaultLength (30 s for the default of 210 s).
+            maxLength (float): Longest plausible song length in seconds, longer ones are not learned.
+                               Defaults to 30 / 7 times defaultLength (900 s for the default of 210 s).
+        """
+        self.defaultLength = defaultLength
+        self.minLength = defaultLength / 7 if minLength is None else minLength
+        self.maxLength = defaultLength * 30 / 7 if maxLength is None else maxLength
+        self.tightInterval = tightInterval
+        self.maxInterval = maxInterval
+        self.minInterval = minInterval
+        self.clock = clock
+        self.lengths = deque(maxlen=history)  # Learned song lengths (seconds)
+        self.lags = deque(maxlen=history)  # Seconds between the start of a track and its detection
+        self.pollCounts = deque(maxlen=history)  # Number of requests it took to detect each track
+        self.songStart = None  # Start of the current track (UNIX timestamp)
+        self.polls = 0  # Requests since the current track was detected
+        self.lastLag = None  # Detection lag of the change witnessed by the last poll (if any)
+        self.lastPolls = None  # Requests it took to detect the change witnessed by the last poll (if any)
+
+    def observe(self, track, isNew, missed=0):
+        """
+        Registers the result of a poll.
+
+        Args:
+            track (qmusic.Song): Latest track returned by the poll.
+            isNew (bool): Whether the track differs from the previous one.
+            missed (int): Number of tracks that were played in between the previous and the latest track.
+
+        Returns:
+            float: Number of seconds to sleep before the next poll.
+        """
+        now = self.clock()
+        self.polls += 1
+        self.lastLag = self.lastPolls = None
+        if isNew:
+            start = track.played_at().timestamp()
+            if self.songStart is not None:
+                # Only a change witnessed by this scheduler says something about lag and song length
+                self.lastLag, self.lastPolls = max(0.0, now - start), self.polls
+                self.lags.append(self.lastLag)
+                self.pollCounts.append(self.lastPolls)
+                length = start - self.songStart
+                if not missed and self.minLength <= length <= self.maxLength:
+                    # Ignore lengths spanning multiple tracks and implausible ones (e.g. after an outage)
+                    self.lengths.append(length)
+            self.songStart = start
+            self.polls = 0
+        return self.nextSleep(now)
+
+    def quantile(self, fraction):
+        """
+        Gets a quantile of the learned song lengths.
+
+        Args:
+            fraction (float): Quantile to get (between 0 and 1).
+
+        Returns:
+            float: Song length in seconds.
+        """
+        if not self.lengths:
+            # Nothing learned yet, assume a spread around the default length
+            return self.defaultLength * (0.75 + fraction / 2)
+        lengths = sorted(self.lengths)
+        return lengths[min(len(lengths) - 1, int(fraction * len(lengths)))]
+
+    def predictedChange(self):
+        """
+        Predicts when the current track ends, from its start and the typical song length.
+
+        Returns:
+            float: Predicted start of the next track (UNIX timestamp), None while the current one has no known start.
+        """
+        if self.songStart is None:
+            return None
+        return self.songStart + self.quantile(0.5)
+
+    def nextSleep(self, now):
+        """
+        Determines how long to sleep, based on how far the current track is into its predicted length.
+
+        Args:
+            now (float): Current time (UNIX timestamp).
+
+        Returns:
+            float: Number of seconds to sleep before the next poll.
+        """
+        if self.songStart is None:
+            # Start of the current track is unknown, so poll tightly
+            return self.tightInterval
+        elapsed = now - self.songStart
+        early, late = self.quantile(0.1), self.quantile(0.9)
+        if elapsed < early:
+            # Change not expected yet, sleep until it may happen
+            sleep = early - elapsed
+        elif elapsed < late:
+            # Change expected any moment now
+            sleep = self.tightInterval
+        else:
+            # Song takes longer than usual, back off gradually
+            sleep = self.tightInterval + (elapsed - late) / 4
+        return max(self.minInterval, min(self.maxInterval, sleep))
+
+    def stats(self):
+        """
+        Reports how well the schedule performs over the recent tracks.
+
+        Returns:
+            dict: Mean detection lag (s), mean requests per track and the predicted song length (s).
+        """
+        return {'lag': sum(self.lags) / len(self.lags) if self.lags else None,
+                'requests': sum(self.pollCounts) / len(self.pollCounts) if self.pollCounts else None,
+                'length': self.quantile(0.5)}
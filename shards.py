@@ -0,0 +1,151 @@
+from bisect import bisect_right  # Walking the ring
+
+import hashlib              # Stable hashes (unlike hash(), the same in every process)
+import multiprocessing      # Worker processes and their queues
+import traceback            # Print caught exceptions
+
+
+class HashRing:
+    """
+    Consistent hashing of keys onto a number of shards.
+    Every shard owns many points on a ring of hashes and a key belongs to the first point after its own hash,
+    so changing the number of shards only moves the keys of the points that were added or removed.
+    """
+
+    def __init__(self, shards, replicas=64):
+        """
+        Args:
+            shards (int): Number of shards.
+            replicas (int): Points per shard on the ring, more spread the keys more evenly.
+        """
+        self.shards = shards
+        points = sorted((ringHash('{}:{}'.format(shard, replica)), shard)
+                        for shard in range(shards) for replica in range(replicas))
+        self.hashes = [point for point, _ in points]
+        self.owners = [shard for _, shard in points]
+
+    def owner(self, key):
+        """
+        Args:
+            key (str): Key to look up, e.g. a webhook URL.
+
+        Returns:
+            int: Shard the key belongs to.
+        """
+        return self.owners[bisect_right(self.hashes, ringHash(key)) % len(self.hashes)]
+
+
+def ringHash(key):
+    """
+    Args:
+        key (str): Key to hash.
+
+    Returns:
+        int: 64-bit hash of the key, stable across processes and runs.
+    """
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big')
+
+
+class ShardPool:
+    """
+    Worker processes that each match and deliver the songs published to them for a shard of the targets.
+    Targets are sharded by webhook, so every webhook is posted to (and rate limited) by a single worker,
+    and the messages of all its targets are still merged into one post.
+    Songs are published to every worker over its own multiprocessing queue.
+    """
+
+    def __init__(self, workers, options, queueSize=1000):
+        """
+        Starts the worker processes.
+
+        Args:
+            workers (int): Number of worker processes.
+            options (dict): Arguments of runWorker, shared by every worker (see there).
+            queueSize (int): Maximum number of songs waiting per worker, publishing blocks when a queue is full.
+        """
+        context = multiprocessing.get_context('spawn')  # Forking a process that runs threads is not safe
+        self.queues = [context.Queue(queueSize) for _ in range(workers)]
+        self.processes = [context.Process(target=runWorker, args=(index, workers, queue, options),
+                                          name='shard-{}'.format(index), daemon=True)
+                          for index, queue in enumerate(self.queues)]
+        for process in self.processes:
+            process.start()
+
+    def publish(self, track, slug):
+        """
+        Hands a new song to every worker.
+
+        Args:
+            track (qmusic.Song): The new song.
+            slug (str): Slug of the channel it is played on.
+        """
+        for queue in self.queues:
+            queue.put((track, slug))
+
+    def depth(self, index):
+        """
+        Args:
+            index (int): Shard of the worker.
+
+        Returns:
+            float: Number of songs waiting for the worker (approximate, NaN where the platform cannot tell).
+        """
+        try:
+            return self.queues[index].qsize()
+        except NotImplementedError:
+            return float('nan')
+
+    def close(self, timeout=10):
+        """
+        Lets every worker finish the songs it was handed and stops it.
+
+        Args:
+            timeout (float): Seconds to wait for each worker.
+        """
+        for queue in self.queues:
+            queue.put(None)
+        for process in self.processes:
+            process.join(timeout)
+
+
+def runWorker(index, workers, queue, options):
+    """
+    Main function of a worker process: matches and delivers every published song for its shard of the targets.
+
+    Args:
+        index (int): Shard of this worker.
+        workers (int): Total number of workers.
+        queue (multiprocessing.Queue): Queue the songs are published to, None stops the worker.
+        options (dict): 'slugs', 'targets' (location of the targets file), 'outbox' (location of the outbox,
+                        every worker uses its own), 'api' (base URL of the API) and 'reloadInterval'.
+    """
+    # Imported here, the worker is started in a fresh interpreter
+    from QBot import QBot   # Matching and delivery
+    from qmusic import Qmusic  # Q-music API wrapper
+
+    qapi = Qmusic(compact=True, selective='auto', base_url=options.get('api'))
+    outboxPath = options.get('outbox')
+    if outboxPath:
+        outboxPath = '{}.shard{}'.format(outboxPath, index)
+    bot = QBot(options.get('slugs'), 0, outboxPath, qapi)
+    bot.shard = (HashRing(workers), index)
+    bot.readTargets(options['targets'])
+    if options.get('reloadInterval'):
+        bot.watchTargets(options['reloadInterval'])
+    print('Shard {} van {}: {} doelen'.format(index, workers, len(bot.targets)))
+
+    while True:
+        item = queue.get()
+        if item is None:
+            break
+        track, slug = item
+        try:
+            # Swap in reloaded targets (if any), there is no polling cycle to do it in between
+            bot.applyTargets()
+            bot.notify(track, slug)
+        except Exception:
+            # A failing song must not stop the worker
+            print(traceback.format_exc() + '\nShard {} kon liedje niet afhandelen'.format(index))
+    if bot.outbox:
+        bot.outbox.close()
+    bot.deliverer.close()
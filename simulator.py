@@ -0,0 +1,356 @@
+#!/usr/bin/env python
+"""
+Local stand-in for the Q-music API and for Discord webhooks, to load-test QBot without touching production.
+Serves the channel catalog at /2.4/app/channels and the plays of every channel at /<api_url>/2.4/tracks/plays,
+pushes every play the moment it starts as a server-sent event at /<api_url>/2.4/tracks/plays/stream,
+and accepts webhook posts at /webhook/<anything>. Counters are available at /stats.
+
+Start it with e.g. `python simulator.py --channels 1000 --song-length 20 --write-targets sim_targets.csv`,
+and point the bot at it with `python QBot.py all --api http://127.0.0.1:8765 --targets sim_targets.csv`.
+"""
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler  # Serving the API
+from urllib.parse import urlsplit, parse_qs  # Reading requests
+
+import argparse             # Command line arguments
+import datetime             # Play timestamps
+import json                 # Responses
+import random               # Songs, latency and errors
+import socket               # Disabling Nagle's algorithm
+import threading            # Counters
+import time                 # Song rotation and latency
+
+ARTISTS = ['QUEEN', 'THE WEEKND', 'DUA LIPA', 'ADELE', 'COLDPLAY', 'TOTO', 'THE KILLERS', 'HARRY STYLES',
+           'LADY GAGA', 'BRUNO MARS', 'ED SHEERAN', 'BILLIE EILISH', 'ABBA', 'MADONNA', 'U2', 'DAVID BOWIE']
+WORDS = ['love', 'night', 'dance', 'heart', 'summer', 'fire', 'dream', 'light', 'rain', 'home', 'gold', 'wild']
+
+
+class Simulator(ThreadingHTTPServer):
+    """
+    Simulated Q-music API with a simulated webhook sink.
+    Every channel plays an endless, deterministic rotation of songs of a configurable length,
+    with the song changes of different channels spread out over time.
+    """
+    daemon_threads = True
+
+    def __init__(self, address, channels=10, songLength=180.0, latency=0.0, errorRate=0.0,
+                 hookLatency=0.0, rateLimitRate=0.0, hookErrorRate=0.0, push=True, keepAlive=15.0, pushDuration=0.0,
+                 announce=False, seed=0):
+        """
+        Args:
+            address (tuple): Host and port to listen on.
+            channels (int): Number of simulated channels.
+            songLength (float): Seconds every song lasts.
+            latency (float): Seconds every API response is delayed (on average).
+            errorRate (float): Fraction of API requests that fail with a 500.
+            hookLatency (float): Seconds every webhook response is delayed (on average).
+            rateLimitRate (float): Fraction of webhook posts that are answered with a 429.
+            hookErrorRate (float): Fraction of webhook posts that fail with a 502.
+            push (bool): Whether to serve the push feeds (their URL is not found otherwise).
+            keepAlive (float): Seconds in between keep-alive comments on a quiet push feed.
+            pushDuration (float): Seconds after which a push feed is closed, to test reconnecting (0 keeps it open).
+            announce (bool): Whether the newest play announces the song that is played next (for --pre-arm of QBot).
+            seed (int): Seed for the random numbers.
+        """
+        super().__init__(address, SimulatorHandler)
+        self.slugs = ['sim_{}'.format(i) for i in range(channels)]
+        self.songLength = songLength
+        self.latency = latency
+        self.errorRate = errorRate
+        self.hookLatency = hookLatency
+        self.rateLimitRate = rateLimitRate
+        self.hookErrorRate = hookErrorRate
+        self.push = push
+        self.keepAlive = keepAlive
+        self.pushDuration = pushDuration
+        self.announce = announce
+        self.rng = random.Random(seed)
+        self.epoch = time.time()
+        self.offsets = {slug: self.rng.uniform(0, songLength) for slug in self.slugs}  # Spread out song changes
+        self.stats = {'catalog': 0, 'plays': 0, 'api_errors': 0, 'posts': 0, 'delivered': 0, 'rate_limited': 0,
+                      'hook_errors': 0, 'push_streams': 0, 'push_events': 0, 'warm_ups': 0}
+        self.lock = threading.Lock()
+
+    def count(self, counter):
+        """
+        Increments a counter.
+
+        Args:
+            counter (str): Name of the counter.
+        """
+        with self.lock:
+            self.stats[counter] += 1
+
+    def chance(self, rate):
+        """
+        Args:
+            rate (float): Probability.
+
+        Returns:
+            bool: Whether an event with the given probability happens.
+        """
+        with self.lock:
+            return rate > 0 and self.rng.random() < rate
+
+    def delay(self, latency):
+        """
+        Sleeps for a random period around the given latency.
+
+        Args:
+            latency (float): Average number of seconds to sleep.
+        """
+        if latency > 0:
+            with self.lock:
+                period = self.rng.expovariate(1 / latency)
+            time.sleep(period)
+
+    def catalog(self):
+        """
+        Returns:
+            dict: Channel catalog, like app/channels.
+        """
+        return {'data': [{'data': {'id': slug, 'name': 'Simulated {}'.format(slug), 'api_url': 'sim/' + slug,
+                                   'station_id': slug, 'streams': {}, 'logo': {}},
+                          'color': {'background': '#ed1c24', 'foreground': '#ffffff', 'extra': '#000000'}}
+                         for slug in self.slugs]}
+
+    def song(self, slug, index):
+        """
+        Generates the song with the given index in the rotation of a channel.
+
+        Args:
+            slug (str): Slug of the channel.
+            index (int): Position of the song in the rotation.
+
+        Returns:
+            dict: Song, like an element of played_tracks.
+        """
+        rng = random.Random('{}:{}'.format(slug, index))
+        artistId = rng.randrange(len(ARTISTS))
+        title = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 3))).title()
+        start = self.songStart(slug, index)
+        return {'selector_code': '{}-{}'.format(slug, index), 'title': title, 'slug': title.lower().replace(' ', '-'),
+                'played_at': datetime.datetime.fromtimestamp(start, datetime.timezone.utc).isoformat(),
+                'thumbnail': '/tracks/{}.jpg'.format(index), 'release_year': str(1970 + rng.randrange(55)),
+                'artist': {'id': artistId, 'name': ARTISTS[artistId], 'original_name': ARTISTS[artistId],
+                           'slug': ARTISTS[artistId].lower().replace(' ', '-')},
+                'sub_artists': []}
+
+    def play(self, slug, index):
+        """
+        Generates the play of the song with the given index, announcing the song after it (if announced).
+
+        Args:
+            slug (str): Slug of the channel.
+            index (int): Position of the song in the rotation.
+
+        Returns:
+            dict: Song, like the newest element of played_tracks.
+        """
+        play = self.song(slug, index)
+        if self.announce:
+            play['next'] = self.song(slug, index + 1)
+        return play
+
+    def currentIndex(self, slug):
+        """
+        Args:
+            slug (str): Slug of the channel.
+
+        Returns:
+            int: Position in the rotation of the song that is playing on the channel.
+        """
+        return int((time.time() - self.epoch - self.offsets[slug]) // self.songLength)
+
+    def songStart(self, slug, index):
+        """
+        Args:
+            slug (str): Slug of the channel.
+            index (int): Position of the song in the rotation.
+
+        Returns:
+            float: Start of the song (UNIX timestamp).
+        """
+        return self.epoch + self.offsets[slug] + index * self.songLength
+
+    def plays(self, slug, limit):
+        """
+        Returns:
+            dict: Most recent plays of a channel, newest first, like tracks/plays.
+        """
+        current = self.currentIndex(slug)
+        return {'played_tracks': [self.play(slug, current)] +
+                                 [self.song(slug, index) for index in range(current - 1, current - limit, -1)]}
+
+
+class SimulatorHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep connections alive
+
+    def setup(self):
+        super().setup()
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def do_GET(self):
+        sim = self.server
+        url = urlsplit(self.path)
+        if url.path == '/stats':
+            with sim.lock:
+                return self.reply(200, dict(sim.stats))
+
+        sim.delay(sim.latency)
+        if sim.chance(sim.errorRate):
+            sim.count('api_errors')
+            return self.reply(500, {'error': 'simulated failure'})
+        if url.path == '/2.4/app/channels':
+            sim.count('catalog')
+            return self.reply(200, sim.catalog())
+        parts = url.path.strip('/').split('/')
+        if len(parts) == 6 and parts[0] == 'sim' and parts[2:] == ['2.4', 'tracks', 'plays', 'stream'] \
+                and parts[1] in sim.offsets and sim.push:
+            sim.count('push_streams')
+            return self.stream(parts[1])
+        if len(parts) == 5 and parts[0] == 'sim' and parts[2:] == ['2.4', 'tracks', 'plays'] \
+                and parts[1] in sim.offsets:
+            sim.count('plays')
+            limit = int(parse_qs(url.query).get('limit', ['1'])[0])
+            return self.reply(200, sim.plays(parts[1], max(1, limit)))
+        self.reply(404, {'error': 'not found'})
+
+    def do_HEAD(self):
+        sim = self.server
+        if not self.path.startswith('/webhook/'):
+            return self.reply(404)
+        # A connection opened ahead of posting (see delivery.Deliverer.warm)
+        sim.count('warm_ups')
+        self.reply(200)
+
+    def do_POST(self):
+        sim = self.server
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if not self.path.startswith('/webhook/'):
+            return self.reply(404, {'error': 'not found'})
+        sim.count('posts')
+        sim.delay(sim.hookLatency)
+        if sim.chance(sim.rateLimitRate):
+            sim.count('rate_limited')
+            return self.reply(429, {'message': 'You are being rate limited.', 'retry_after': 1.0},
+                              {'Retry-After': '1'})
+        if sim.chance(sim.hookErrorRate):
+            sim.count('hook_errors')
+            return self.reply(502, {'error': 'simulated failure'})
+        sim.count('delivered')
+        self.reply(204)
+
+    def stream(self, slug):
+        """
+        Pushes the current song of a channel and then every next one as it starts, as server-sent events.
+        Keep-alive comments are sent while nothing happens.
+
+        Args:
+            slug (str): Slug of the channel.
+        """
+        sim = self.server
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        index = sim.currentIndex(slug)
+        closeAt = time.time() + sim.pushDuration if sim.pushDuration > 0 else float('inf')
+        try:
+            self.sendChunk('event: play\ndata: {}\n\n'.format(json.dumps(sim.play(slug, index))))
+            while True:
+                nextStart = sim.songStart(slug, index + 1)
+                time.sleep(max(0, min(nextStart, time.time() + sim.keepAlive, closeAt) - time.time()))
+                if time.time() >= closeAt:
+                    break
+                if time.time() >= nextStart:
+                    index += 1
+                    sim.count('push_events')
+                    self.sendChunk('event: play\ndata: {}\n\n'.format(json.dumps(sim.play(slug, index))))
+                else:
+                    self.sendChunk(': keep-alive\n\n')
+            self.wfile.write(b'0\r\n\r\n')  # Last chunk
+        except (BrokenPipeError, ConnectionResetError) as _:
+            pass
+        self.close_connection = True
+
+    def sendChunk(self, text):
+        """
+        Sends a chunk of a chunked response right away.
+
+        Args:
+            text (str): Content of the chunk.
+        """
+        data = text.encode()
+        self.wfile.write('{:x}\r\n'.format(len(data)).encode() + data + b'\r\n')
+        self.wfile.flush()
+
+    def reply(self, status, document=None, headers=None):
+        body = json.dumps(document).encode() if document is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def writeTargets(path, baseURL, subscribers, hooks, seed=0):
+    """
+    Writes a targets file with simulated subscribers, all posting to the webhook sink of the simulator.
+
+    Args:
+        path (str): Location of the targets file.
+        baseURL (str): URL of the simulator.
+        subscribers (int): Number of targets.
+        hooks (int): Number of different webhooks the targets post to.
+        seed (int): Seed for the random triggers.
+    """
+    rng = random.Random(seed)
+    vocabulary = [artist.lower() for artist in ARTISTS] + WORDS
+    with open(path, 'w') as targets:
+        targets.write('Trigger;Target (url);Message;Channel (slug)\n')
+        for i in range(subscribers):
+            targets.write('{};{}/webhook/{};Subscriber {};\n'.format(
+                rng.choice(vocabulary), baseURL, rng.randrange(hooks), i))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Simulate the Q-music API and Discord webhooks.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--channels', type=int, default=10, help='Number of simulated channels')
+    parser.add_argument('--song-length', type=float, default=180, help='Seconds every song lasts')
+    parser.add_argument('--latency', type=float, default=0, help='Average API response delay (s)')
+    parser.add_argument('--error-rate', type=float, default=0, help='Fraction of API requests failing with a 500')
+    parser.add_argument('--hook-latency', type=float, default=0, help='Average webhook response delay (s)')
+    parser.add_argument('--rate-limit-rate', type=float, default=0, help='Fraction of posts answered with a 429')
+    parser.add_argument('--hook-error-rate', type=float, default=0, help='Fraction of posts failing with a 502')
+    parser.add_argument('--no-push', action='store_true', help='Do not serve push feeds, to test polling fallback')
+    parser.add_argument('--keep-alive', type=float, default=15, help='Seconds in between push feed keep-alives')
+    parser.add_argument('--push-duration', type=float, default=0,
+                        help='Seconds after which push feeds are closed, to test reconnecting (0 keeps them open)')
+    parser.add_argument('--announce-next', action='store_true',
+                        help='Announce the song that is played next in the newest play (for --pre-arm of QBot)')
+    parser.add_argument('--write-targets', metavar='PATH', help='Write a targets file with simulated subscribers')
+    parser.add_argument('--subscribers', type=int, default=1000, help='Number of simulated subscribers')
+    parser.add_argument('--hooks', type=int, default=100, help='Number of webhooks the subscribers post to')
+    args = parser.parse_args()
+
+    simulator = Simulator((args.host, args.port), args.channels, args.song_length, args.latency, args.error_rate,
+                          args.hook_latency, args.rate_limit_rate, args.hook_error_rate, not args.no_push,
+                          args.keep_alive, args.push_duration, args.announce_next)
+    baseURL = 'http://{}:{}'.format(args.host, simulator.server_port)
+    if args.write_targets:
+        writeTargets(args.write_targets, baseURL, args.subscribers, args.hooks)
+        print('Wrote {} simulated subscribers to {}'.format(args.subscribers, args.write_targets))
+    print('Simulating {} channels at {} (CTRL-C to stop)'.format(args.channels, baseURL))
+    try:
+        simulator.serve_forever()
+    except KeyboardInterrupt:
+        pass
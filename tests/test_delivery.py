@@ -0,0 +1,83 @@
+"""
+Checks of webhook delivery against a local webhook that rate limits.
+Run from the repository root with `python -m unittest discover tests` (or pytest).
+"""
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler  # Local webhook
+
+import os                   # Repository root
+import sys                  # Importing from the repository root
+import threading            # Serving the webhook and waiting for posts in the background
+import time                 # Timing deliveries
+import unittest             # Test cases
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from delivery import Deliverer  # Delivery under test
+
+RETRY_AFTER = 2  # Seconds the webhook asks to wait after its first post
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        with self.server.lock:
+            self.server.posts.append(self.path)
+            limited = self.path == '/limited' and self.server.posts.count(self.path) == 1
+        self.send_response(429 if limited else 204)
+        if limited:
+            self.send_header('Retry-After', str(RETRY_AFTER))
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class TestRateLimitedDelivery(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), WebhookHandler)
+        self.server.posts = []
+        self.server.lock = threading.Lock()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.baseURL = 'http://127.0.0.1:{}'.format(self.server.server_port)
+        self.deliverer = Deliverer()
+
+    def tearDown(self):
+        self.deliverer.close()
+        self.server.shutdown()
+
+    def test_rate_limit_does_not_hold_up_the_caller(self):
+        later = []
+        done = threading.Event()
+
+        def onLater(deliveries):
+            later.extend(deliveries)
+            done.set()
+
+        start = time.perf_counter()
+        deliveries = self.deliverer.deliver([(self.baseURL + '/limited', {'content': 'a'}),
+                                             (self.baseURL + '/other', {'content': 'b'})], onLater)
+        self.assertLess(time.perf_counter() - start, RETRY_AFTER / 2)
+        self.assertEqual([delivery.deferred for delivery in deliveries], [True, False])
+        self.assertEqual([delivery.status for delivery in deliveries], [None, 204])
+
+        # A next post to the webhook that is still rate limited does not wait either
+        start = time.perf_counter()
+        self.deliverer.deliver([(self.baseURL + '/limited', {'content': 'c'})], lambda deliveries: None)
+        self.assertLess(time.perf_counter() - start, RETRY_AFTER / 2)
+
+        # The rate-limited post is made in the background once the webhook allows it
+        self.assertTrue(done.wait(RETRY_AFTER * 5))
+        self.assertTrue(later[0].ok())
+
+    def test_waiting_delivery_retries(self):
+        deliveries = self.deliverer.deliver([(self.baseURL + '/limited', {'content': 'a'})])
+        self.assertTrue(deliveries[0].ok())
+
+
+if __name__ == '__main__':
+    unittest.main()
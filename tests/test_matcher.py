@@ -0,0 +1,117 @@
+"""
+Checks of trigger matching against straightforward (but slow) reference implementations.
+Run from the repository root with `python -m unittest discover tests` (or pytest).
+"""
+
+import itertools            # Every pattern over a small alphabet
+import os                   # Repository root
+import random               # Random patterns, intervals and reloads
+import sys                  # Importing from the repository root
+import unittest             # Test cases
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from matcher import Automaton, IntervalIndex, TriggerMatcher, parseTrigger  # Matching under test
+
+# Every word of up to four letters over a small alphabet, so patterns overlap and share prefixes and suffixes a lot
+WORDS = [''.join(letters) for length in range(1, 5) for letters in itertools.product('abc', repeat=length)]
+
+
+def randomText(rng, length=40):
+    """
+    Args:
+        rng (random.Random): Random numbers.
+        length (int): Number of characters.
+
+    Returns:
+        str: Text over the alphabet of WORDS (and spaces).
+    """
+    return ''.join(rng.choice('abc ') for _ in range(length))
+
+
+class TestAutomaton(unittest.TestCase):
+
+    def test_finds_every_contained_pattern(self):
+        rng = random.Random(1)
+        for _ in range(50):
+            patterns = rng.sample(WORDS, rng.randint(1, 30))
+            automaton = Automaton(patterns)
+            for _ in range(20):
+                text = randomText(rng)
+                self.assertEqual(automaton.search(text),
+                                 {index for index, pattern in enumerate(patterns) if pattern in text})
+
+    def test_overlapping_patterns(self):
+        automaton = Automaton(['he', 'she', 'his', 'hers'])
+        self.assertEqual(automaton.search('ushers'), {0, 1, 3})
+        self.assertEqual(automaton.search('queen'), set())
+
+
+class TestIntervalIndex(unittest.TestCase):
+
+    def test_finds_every_containing_interval(self):
+        rng = random.Random(2)
+        for _ in range(50):
+            intervals = []
+            for item in range(rng.randint(0, 15)):
+                low, high = sorted(rng.randint(1950, 2030) for _ in range(2))
+                intervals.append((rng.choice((low, None)), rng.choice((high, high, None)), item))
+            index = IntervalIndex(intervals)
+            for value in range(1940, 2041):
+                self.assertEqual(sorted(index.lookup(value)),
+                                 [item for low, high, item in intervals
+                                  if (low is None or low <= value) and (high is None or value <= high)])
+
+    def test_year_triggers(self):
+        self.assertEqual(parseTrigger('year:1985'), ('year', (1985, 1985)))
+        self.assertEqual(parseTrigger('Year: 1980-1989'), ('year', (1980, 1989)))
+        self.assertEqual(parseTrigger('year:2000-'), ('year', (2000, None)))
+        self.assertEqual(parseTrigger('year:-1969'), ('year', (None, 1969)))
+        self.assertEqual(parseTrigger('queen: live'), ('text', 'queen: live'))
+        with self.assertRaises(ValueError):
+            parseTrigger('year:abc')
+
+
+class TestTriggerMatcher(unittest.TestCase):
+
+    def test_structured_and_text_triggers(self):
+        targets = [{'trigger': trigger} for trigger in
+                   ('Queen', 'artist:1', 'featuring:2', 'code:ABC1', 'year:1970-1979', '')]
+        matcher = TriggerMatcher(targets)
+        matches = matcher.match('Bohemian Rhapsody QUEEN', artist=1, featuring=[2], code='ABC1', year=1975)
+        self.assertEqual(matches, targets)
+        self.assertEqual(matcher.match('Under Pressure', artist=3, year=1981), targets[-1:])
+
+    def test_update_matches_like_a_fresh_matcher(self):
+        rng = random.Random(3)
+        targets = [{'trigger': word} for word in rng.sample(WORDS, 100)]
+        matcher = TriggerMatcher(targets)
+        rebuilt = incremental = False
+        for _ in range(200):
+            if rng.random() < 0.05:
+                # Remove most targets, so most compiled patterns are not used anymore
+                targets = rng.sample(targets, min(5, len(targets)))
+            elif rng.random() < 0.5:
+                targets = rng.sample(targets, max(0, len(targets) - rng.randint(1, 10)))
+            else:
+                targets = targets + [{'trigger': rng.choice(WORDS)} for _ in range(rng.randint(1, 10))]
+            triggers = {target['trigger'] for target in targets}
+            compiled = sum(len(automaton.patterns) for automaton in matcher.automata)
+            matcher = matcher.update(targets)
+            if compiled > 2 * len(triggers) + 64:
+                # Everything was compiled into a single automaton again
+                self.assertEqual(len(matcher.automata), 1)
+                self.assertEqual(set(matcher.automata[0].patterns), triggers)
+                rebuilt = True
+            incremental |= len(matcher.automata) > 1
+
+            fresh = TriggerMatcher(targets)
+            for _ in range(10):
+                text = randomText(rng)
+                self.assertEqual(matcher.match(text), fresh.match(text))
+        self.assertTrue(rebuilt)
+        self.assertTrue(incremental)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+"""
+Checks of the delivery outbox, with a stand-in deliverer and against the simulator.
+Run from the repository root with `python -m unittest discover tests` (or pytest).
+"""
+
+import os                   # Repository root
+import shutil               # Removing the temporary directory
+import sqlite3              # Inspecting the outbox
+import sys                  # Importing from the repository root
+import tempfile             # Outbox databases
+import threading            # Serving the simulator in the background
+import time                 # Due times of retries
+import unittest             # Test cases
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from delivery import Delivery  # Outcomes of the stand-in deliverer
+from outbox import Outbox      # Outbox under test
+
+
+class StubDeliverer:
+    """
+    Stand-in for delivery.Deliverer, which answers every post with the status given for its webhook.
+    """
+
+    def __init__(self, statuses=None):
+        self.statuses = statuses or {}  # HTTP status per webhook URL, 204 for others
+        self.posts = []  # Tuples of (hookURL, postContent) that were posted
+
+    def deliver(self, jobs, onLater=None):
+        self.posts.extend(jobs)
+        return [Delivery(hookURL, self.statuses.get(hookURL, 204)) for hookURL, _ in jobs]
+
+
+class TestOutbox(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'outbox.sqlite')
+        self.deliverer = StubDeliverer()
+        self.outbox = Outbox(self.path, self.deliverer, baseDelay=5, maxDelay=60, maxAttempts=3)
+
+    def tearDown(self):
+        self.outbox.close()
+        shutil.rmtree(self.directory)
+
+    def rows(self):
+        """
+        Returns:
+            list: Tuples of (target, status, attempts, next_attempt) of every notification, in the order recorded.
+        """
+        with sqlite3.connect(self.path) as db:
+            return db.execute('SELECT target, status, attempts, next_attempt FROM outbox ORDER BY id').fetchall()
+
+    def test_recording_a_play_again_is_ignored(self):
+        jobs = [('http://hook/a', {'content': 'Queen'}), ('http://hook/b', {'content': 'Queen'})]
+        self.outbox.record('qmusic_nl', 'A', 'qmusic_nl:A@12:00', jobs)
+        self.outbox.record('qmusic_nl', 'A', 'qmusic_nl:A@12:00', jobs)
+        self.outbox.drain()
+        self.assertEqual(len(self.deliverer.posts), 2)
+        # A later play of the same song is notified again
+        self.outbox.record('qmusic_nl', 'A', 'qmusic_nl:A@15:00', jobs[:1])
+        self.outbox.drain()
+        self.assertEqual(len(self.deliverer.posts), 3)
+
+    def test_undelivered_notifications_survive_a_crash(self):
+        self.outbox.record('qmusic_nl', 'A', 'qmusic_nl:A@12:00', [('http://hook/a', {'content': 'Queen'})])
+        self.outbox.db.close()  # Crash before anything was delivered
+
+        deliverer = StubDeliverer()
+        self.outbox = Outbox(self.path, deliverer)
+        self.assertEqual(self.outbox.latestCodes(), {'qmusic_nl': 'A'})
+        self.outbox.drain()
+        self.assertEqual(deliverer.posts, [('http://hook/a', {'content': 'Queen'})])
+        self.assertEqual(self.rows()[0][1], 'delivered')
+
+    def test_failed_posts_back_off_and_are_given_up(self):
+        self.deliverer.statuses = {'http://hook/down': 502, 'http://hook/gone': 404}
+        self.outbox.record('qmusic_nl', 'A', 'qmusic_nl:A@12:00',
+                           [('http://hook/down', {'content': 'a'}), ('http://hook/gone', {'content': 'a'})])
+        start = time.time()
+        wait = self.outbox.drain()
+        (_, status, attempts, due), (_, gone, _, _) = self.rows()
+        self.assertEqual((status, attempts, gone), ('pending', 1, 'failed'))  # Client errors are not retried
+        self.assertAlmostEqual(due - start, 5, delta=1)
+        self.assertAlmostEqual(wait, 5, delta=1)
+        self.outbox.drain()  # Not attempted again before it is due
+        self.assertEqual(len(self.deliverer.posts), 2)
+
+        with self.outbox.lock:
+            self.outbox.db.execute('UPDATE outbox SET next_attempt = 0')
+        start = time.time()
+        self.outbox.drain()
+        _, status, attempts, due = self.rows()[0]
+        self.assertEqual((status, attempts), ('pending', 2))
+        self.assertAlmostEqual(due - start, 10, delta=1)  # Doubled
+
+        with self.outbox.lock:
+            self.outbox.db.execute('UPDATE outbox SET next_attempt = 0')
+        self.assertIsNone(self.outbox.drain())
+        self.assertEqual(self.rows()[0][1:3], ('failed', 3))
+
+    def test_delivered_notifications_are_pruned(self):
+        self.outbox.retention = 60
+        self.outbox.record('qmusic_nl', 'A', 'qmusic_nl:A@12:00', [('http://hook/a', {'content': 'a'})])
+        self.deliverer.statuses = {'http://hook/down': 502}
+        self.outbox.record('qmusic_nl', 'B', 'qmusic_nl:B@12:03', [('http://hook/down', {'content': 'b'})])
+        self.outbox.drain()
+        self.assertEqual(self.outbox.prune(time.time() + 30), 0)  # Still within the retention period
+        self.assertEqual(self.outbox.prune(time.time() + 120), 1)
+        self.assertEqual([row[:2] for row in self.rows()], [('http://hook/down', 'pending')])
+
+
+class TestRunOnce(unittest.TestCase):
+    """
+    A single check (--once) against the simulator, which waits for the outbox to be drained.
+    """
+
+    def setUp(self):
+        from simulator import Simulator  # Simulated API and webhooks
+        from qmusic import Qmusic, Connection  # Pointed at the simulator
+        from QBot import QBot  # Bot under test
+        self.directory = tempfile.mkdtemp()
+        self.server = Simulator(('127.0.0.1', 0), channels=1, songLength=3600, push=False)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        baseURL = 'http://127.0.0.1:{}'.format(self.server.server_port)
+        slug = self.server.slugs[0]
+        code = self.server.play(slug, self.server.currentIndex(slug))['selector_code']
+        targets = os.path.join(self.directory, 'targets.csv')
+        with open(targets, 'w') as tfile:
+            tfile.write('Trigger;Target (url);Message;Channel (slug)\n')
+            tfile.writelines('code:{};{}/webhook/{};Subscriber {};\n'.format(code, baseURL, i, i) for i in range(3))
+        qapi = Qmusic(Connection(), compact=True, base_url=baseURL)
+        self.bot = QBot([slug], 0, os.path.join(self.directory, 'outbox.sqlite'), qapi)
+        self.bot.readTargets(targets)
+
+    def tearDown(self):
+        self.bot.outbox.close()
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.directory)
+
+    def test_run_once_drains_the_outbox(self):
+        self.assertEqual(self.bot.runOnce(), 1)
+        self.assertEqual(self.server.stats['delivered'], 3)
+        with self.bot.outbox.lock:
+            pending = self.bot.outbox.db.execute('SELECT COUNT(*) FROM outbox WHERE status != \'delivered\'')
+            self.assertEqual(pending.fetchone()[0], 0)
+
+    def test_failed_posts_stay_for_the_next_run(self):
+        self.server.hookErrorRate = 1.0
+        start = time.perf_counter()
+        self.assertEqual(self.bot.runOnce(), 1)
+        self.assertLess(time.perf_counter() - start, self.bot.outbox.baseDelay)  # Retries are not waited for
+        with self.bot.outbox.lock:
+            pending = self.bot.outbox.db.execute('SELECT COUNT(*) FROM outbox WHERE status = \'pending\'')
+            self.assertEqual(pending.fetchone()[0], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+"""
+Checks of the Q-music API wrapper against a stand-in connection.
+Run from the repository root with `python -m unittest discover tests` (or pytest).
+"""
+
+import os                   # Repository root
+import sys                  # Importing from the repository root
+import unittest             # Test cases
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from qmusic import Channel  # Channel under test
+
+
+def play(code, upcoming=None):
+    """
+    Args:
+        code (str): Selector code of the song.
+        upcoming (str): Selector code of the song that is announced next (if any).
+
+    Returns:
+        dict: Play like an element of played_tracks.
+    """
+    document = {'selector_code': code, 'title': code, 'played_at': '2021-03-01T12:00:00+01:00',
+                'artist': {'id': 1, 'name': 'QUEEN'}}
+    if upcoming:
+        document['next'] = play(upcoming)
+    return document
+
+
+class ConditionalConnection:
+    """
+    Stand-in for qmusic.Connection, which answers like a server that supports conditional requests:
+    as long as the plays did not change, the previously decoded document is handed back as unchanged.
+    """
+
+    def __init__(self):
+        self.plays = [play('A')]  # Plays the server currently has, newest first
+        self.previous = None  # Document of the previous response
+
+    def get_json_conditional(self, url, schema=None):
+        document = {'played_tracks': self.plays}
+        if self.previous is not None and self.previous == document:
+            return self.previous, False
+        self.previous = document
+        return document, True
+
+
+class TestCurrentSong(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = ConditionalConnection()
+        self.channel = Channel({'data': {'id': 'qmusic_nl', 'api_url': 'api.example.org'}}, self.conn, compact=True)
+
+    def test_unchanged_plays_reuse_the_song(self):
+        first = self.channel.current_song()
+        self.assertIs(self.channel.current_song(), first)
+
+    def test_announced_song_is_current_by_default(self):
+        self.conn.plays = [play('B', upcoming='C')]
+        self.assertEqual(self.channel.current_song().selector_code(), 'C')
+
+    def test_change_fetched_by_next_song_is_seen(self):
+        self.channel.next_upcoming = True
+        self.assertEqual(self.channel.current_song().selector_code(), 'A')
+        self.conn.plays = [play('B', upcoming='C')]
+        self.assertEqual(self.channel.next_song().selector_code(), 'C')
+        # The change was fetched by next_song, current_song itself only sees an unchanged response
+        self.assertEqual(self.channel.current_song().selector_code(), 'B')
+
+    def test_next_song_from_cache(self):
+        self.conn.plays = [play('B', upcoming='C')]
+        self.channel.current_song()
+        self.assertEqual(self.channel.next_song(cached=True).selector_code(), 'C')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,276 @@
+from collections import Counter  # Counting sampled stacks
+
+import json                 # Writing spans
+import os                   # Profile locations
+import signal               # Triggering the sampler
+import sys                  # Stacks of all threads
+import threading            # Parent spans per thread, sampling in the background
+import time                 # Timing spans and samples
+
+
+class Span:
+    """
+    A timed piece of work, with the spans of the work it consists of as children.
+    Used as a context manager, a span is timed from entering until exiting it,
+    and while it is open it is the parent of new spans on the same thread.
+    """
+
+    __slots__ = ('tracer', 'name', 'parent', 'attributes', 'start', 'began', 'duration', 'children')
+
+    def __init__(self, tracer, name, parent, attributes):
+        """
+        Args:
+            tracer (Tracer): Tracer that records the span.
+            name (str): Name of the span.
+            parent (Span): Span this one is a child of (None for a root span).
+            attributes (dict): Details of the span.
+        """
+        self.tracer = tracer
+        self.name = name
+        self.parent = parent
+        self.attributes = attributes
+        self.start = None  # UNIX timestamp
+        self.began = None  # time.perf_counter()
+        self.duration = None  # Seconds
+        self.children = []
+
+    def __enter__(self):
+        self.start, self.began = time.time(), time.perf_counter()
+        self.tracer.stack().append(self)
+        return self
+
+    def __exit__(self, excType, excValue, tb):
+        self.duration = time.perf_counter() - self.began
+        if excType is not None:
+            self.attributes['error'] = excType.__name__
+        stack = self.tracer.stack()
+        if stack and stack[-1] is self:
+            stack.pop()
+        if self.parent is None:
+            self.tracer.emit(self)
+        else:
+            self.parent.children.append(self)  # Atomic, children may finish on different threads
+        return False
+
+    def set(self, **attributes):
+        """
+        Adds details to the span.
+
+        Args:
+            **attributes: Details of the span.
+        """
+        self.attributes.update(attributes)
+
+    def toDict(self):
+        """
+        Returns:
+            dict: The span and its children (in the order they started), ready to be encoded as JSON.
+        """
+        span = {'name': self.name, 'start': self.start, 'ms': round(self.duration * 1000, 3)}
+        if self.attributes:
+            span['attributes'] = self.attributes
+        if self.children:
+            span['children'] = [child.toDict() for child in sorted(self.children, key=lambda child: child.began)]
+        return span
+
+
+class NullSpan:
+    """
+    Span that records nothing, handed out while tracing is disabled.
+    """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, tb):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class Tracer:
+    """
+    Opt-in tracer, writing every finished root span (with all of its children) as a line of JSON.
+    While disabled, spans cost no more than a method call.
+    """
+
+    def __init__(self, path=None, minDuration=0.0):
+        """
+        Args:
+            path (str): File to append spans to, None disables tracing.
+            minDuration (float): Only root spans taking at least this many seconds are written,
+                                 so that only the slow ones are kept.
+        """
+        self.enabled = path is not None
+        self.minDuration = minDuration
+        self.local = threading.local()  # Stack of open spans per thread
+        self.lock = threading.Lock()  # Guards writing
+        self.output = open(path, 'a') if self.enabled else None
+
+    def span(self, name, parent=None, **attributes):
+        """
+        Creates a span, to be used as a context manager.
+
+        Args:
+            name (str): Name of the span.
+            parent (Span): Span this one is part of, defaults to the innermost open span on this thread.
+                           Needed when the work is handed to another thread.
+            **attributes: Details of the span.
+
+        Returns:
+            Span: The span (a NullSpan if tracing is disabled).
+        """
+        if not self.enabled:
+            return NULL_SPAN
+        if parent is None:
+            parent = self.current()
+        return Span(self, name, parent, attributes)
+
+    def current(self):
+        """
+        Returns:
+            Span: Innermost open span on this thread (None if there is none).
+        """
+        stack = self.stack()
+        return stack[-1] if stack else None
+
+    def stack(self):
+        """
+        Returns:
+            list: Open spans on this thread, innermost last.
+        """
+        try:
+            return self.local.stack
+        except AttributeError:
+            self.local.stack = []
+            return self.local.stack
+
+    def emit(self, span):
+        """
+        Writes a finished root span.
+
+        Args:
+            span (Span): Finished root span.
+        """
+        if span.duration < self.minDuration:
+            return
+        line = json.dumps(span.toDict(), default=str)
+        with self.lock:
+            self.output.write(line + '\n')
+            self.output.flush()
+
+    def close(self):
+        """
+        Closes the trace file.
+        """
+        if self.output:
+            self.output.close()
+
+
+class Sampler:
+    """
+    On-demand sampling profiler, covering every thread (polls and posts run in worker pools,
+    which a cProfile capture of a single thread would miss).
+    Stacks are sampled for a while and written in the collapsed format read by flame graph tools
+    (e.g. flamegraph.pl or speedscope): one line per distinct stack, frames separated by ';', followed by a count.
+    """
+
+    def __init__(self, directory='.', duration=30.0, interval=0.005):
+        """
+        Args:
+            directory (str): Directory to write profiles to.
+            duration (float): Seconds to sample for.
+            interval (float): Seconds in between samples.
+        """
+        self.directory = directory
+        self.duration = duration
+        self.interval = interval
+        self.running = threading.Lock()  # Held while sampling
+
+    def installSignal(self, signum=getattr(signal, 'SIGUSR1', None)):
+        """
+        Starts a capture whenever the process receives a signal, e.g. `kill -USR1 <pid>`.
+        Must be called from the main thread.
+
+        Args:
+            signum (int): Signal to listen to, defaults to SIGUSR1.
+
+        Returns:
+            bool: Whether the signal handler was installed (not every platform has the signal).
+        """
+        if signum is None:
+            return False
+        signal.signal(signum, lambda *_: self.start())
+        return True
+
+    def start(self):
+        """
+        Starts a capture in the background, unless one is already running.
+
+        Returns:
+            bool: Whether a capture was started.
+        """
+        if not self.running.acquire(blocking=False):
+            return False
+        threading.Thread(target=self.capture, name='sampler', daemon=True).start()
+        return True
+
+    def capture(self):
+        """
+        Samples the stacks of all other threads, writes the profile and reports where it went.
+        """
+        try:
+            print('Profiel wordt gemaakt ({:.0f} s)...'.format(self.duration))
+            stacks = self.sample()
+            path = os.path.join(self.directory, time.strftime('profile-%Y%m%d-%H%M%S.txt'))
+            with open(path, 'w') as profile:
+                for stack, count in stacks.most_common():
+                    profile.write('{} {}\n'.format(stack, count))
+            print('Profiel geschreven naar {} ({} samples)'.format(path, sum(stacks.values())))
+        except Exception as error:
+            # Never let a profile take down the bot
+            print('Profiel kon niet worden gemaakt: {}'.format(error))
+        finally:
+            self.running.release()
+
+    def sample(self):
+        """
+        Returns:
+            collections.Counter: Number of samples per collapsed stack.
+        """
+        own = threading.get_ident()
+        stacks = Counter()
+        deadline = time.monotonic() + self.duration
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident != own:
+                    stacks[collapse(names.get(ident, str(ident)), frame)] += 1
+            time.sleep(self.interval)
+        return stacks
+
+
+def collapse(threadName, frame):
+    """
+    Formats a stack in the collapsed format.
+
+    Args:
+        threadName (str): Name of the thread the stack belongs to. Numbered pool threads are taken together.
+        frame (frame): Innermost frame of the stack.
+
+    Returns:
+        str: Thread name and frames from the outermost to the innermost, separated by ';'.
+    """
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append('{} ({}:{})'.format(code.co_name, os.path.basename(code.co_filename), frame.f_lineno))
+        frame = frame.f_back
+    frames.append(threadName.rstrip('0123456789').rstrip('_') or threadName)
+    return ';'.join(reversed(frames))